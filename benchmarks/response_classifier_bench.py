@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: single-pass response classifier vs. the previous
+per-check .lower() + any(...) + regex approach
+
+Usage:
+    python benchmarks/response_classifier_bench.py [page.html ...]
+
+Without arguments a set of representative pages (check-in page, already
+checked in, login page, dashboard with a large Inertia payload) is used.
+Pass recorded responses saved from the browser to benchmark real pages.
+"""
+
+import os
+import re
+import sys
+import timeit
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 直接按路径加载，避免导入 services 包时初始化数据库
+_spec = importlib.util.spec_from_file_location(
+    'response_classifier', os.path.join(ROOT, 'services', 'response_classifier.py')
+)
+response_classifier = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(response_classifier)
+
+
+def legacy_classify(html_content):
+    """改造前的判断方式：每个判断各自 lower() 和 any()，再逐个正则"""
+    content_lower = html_content.lower()
+    already_done = any(i in content_lower for i in [
+        'already checked in', '今日已签到', 'checked in today',
+        'attendance recorded', '已完成签到', 'completed today'
+    ])
+    content_lower = html_content.lower()
+    checkin_page = any(i in content_lower for i in ['check-in', 'checkin', '签到', 'attendance', 'daily'])
+    content_lower = html_content.lower()
+    authenticated = any(i in content_lower for i in ['dashboard', 'profile', 'user', 'logout', 'welcome'])
+    content_lower = html_content.lower()
+    success = any(i in content_lower for i in [
+        'check-in successful', 'checkin successful', '签到成功',
+        'attendance recorded', 'earned reward', '获得奖励',
+        'success', '成功', 'completed'
+    ])
+
+    csrf_token = None
+    for pattern in [
+        r'name=["\']_token["\'][^>]*value=["\']([^"\']+)["\']',
+        r'name=["\']csrf_token["\'][^>]*value=["\']([^"\']+)["\']',
+        r'<meta[^>]*name=["\']csrf-token["\'][^>]*content=["\']([^"\']+)["\']',
+    ]:
+        match = re.search(pattern, html_content, re.IGNORECASE)
+        if match:
+            csrf_token = match.group(1)
+            break
+
+    reward = None
+    if success:
+        for pattern in [
+            r'获得奖励[^\d]*(\d+\.?\d*)\s*元',
+            r'earned.*?(\d+\.?\d*)\s*(credits?|points?)',
+            r'(\d+\.?\d*)\s*(credits?|points?|元)'
+        ]:
+            match = re.search(pattern, html_content, re.IGNORECASE)
+            if match:
+                reward = match.group(1)
+                break
+
+    return already_done, checkin_page, authenticated, success, csrf_token, reward
+
+
+def new_classify(html_content):
+    signals = response_classifier.classify_response(html_content)
+    success = signals.has('success')
+    return (
+        signals.has('already_done'), signals.has('checkin_page'), signals.has('authenticated'),
+        success, signals.csrf_token, signals.reward if success else None,
+    )
+
+
+def sample_pages():
+    """典型页面（无录制页面时使用）"""
+    filler = '<div class="row"><span class="cell">%d</span><p>lorem ipsum dolor sit amet</p></div>\n'
+    body = ''.join(filler % i for i in range(2000))
+    payload = '&quot;item&quot;:&quot;value&quot;,' * 5000
+    return {
+        'checkin_page': (
+            '<html><head><meta name="csrf-token" content="abc123token"></head><body>'
+            + body + '<h1>每日签到</h1><form><input name="_token" value="abc123token">'
+            '<button>Check-in</button></form></body></html>'
+        ),
+        'already_done': '<html><body>' + body + '<div class="alert">今日已签到，明天再来</div></body></html>',
+        'success_response': '<html><body>' + body + '<div>签到成功，获得奖励 0.5 元</div></body></html>',
+        'login_page': (
+            '<html><body>' + body
+            + '<form action="/login"><input type="email" name="email">'
+            '<input type="password" name="password"></form></body></html>'
+        ),
+        'dashboard_inertia': (
+            '<html><body><div id="app" data-page="{&quot;props&quot;:{' + payload
+            + '}}"></div>' + body + '<a href="/logout">Logout</a></body></html>'
+        ),
+    }
+
+
+def load_pages(paths):
+    pages = {}
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            pages[os.path.basename(path)] = f.read()
+    return pages
+
+
+def main():
+    pages = load_pages(sys.argv[1:]) if len(sys.argv) > 1 else sample_pages()
+
+    print(f"{'page':<24}{'size':>10}{'legacy (ms)':>14}{'classifier (ms)':>18}{'speedup':>10}")
+    for name, html_content in pages.items():
+        legacy_result = legacy_classify(html_content)
+        new_result = new_classify(html_content)
+        if legacy_result != new_result:
+            print(f"  ! {name}: results differ: legacy={legacy_result} classifier={new_result}")
+
+        number = 50
+        legacy_time = timeit.timeit(lambda: legacy_classify(html_content), number=number) / number * 1000
+        new_time = timeit.timeit(lambda: new_classify(html_content), number=number) / number * 1000
+        print(
+            f"{name:<24}{len(html_content):>10}{legacy_time:>14.3f}{new_time:>18.3f}"
+            f"{legacy_time / new_time if new_time else 0:>9.1f}x"
+        )
+
+
+if __name__ == '__main__':
+    main()
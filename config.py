@@ -15,6 +15,24 @@ ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', 'admin')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin123')
 PORT = int(os.getenv('PORT', '8181'))
 MAX_MYSQL_RETRIES = int(os.getenv('MAX_MYSQL_RETRIES', '12'))
+QUARANTINE_AUTH_FAILURES = int(os.getenv('QUARANTINE_AUTH_FAILURES', '3'))
+
+# Upstream circuit breaker
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', '0.5'))
+CIRCUIT_MIN_REQUESTS = int(os.getenv('CIRCUIT_MIN_REQUESTS', '10'))
+CIRCUIT_OPEN_SECONDS = int(os.getenv('CIRCUIT_OPEN_SECONDS', '120'))
+
+# Total time budget (seconds) for one account's check-in pipeline
+CHECKIN_TIME_BUDGET = int(os.getenv('CHECKIN_TIME_BUDGET', '90'))
+
+# Connections kept per upstream host in the shared HTTP pool
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+
+# Accounts refreshed in parallel by the balance refresh engine
+BALANCE_REFRESH_WORKERS = int(os.getenv('BALANCE_REFRESH_WORKERS', '8'))
+
+# Redeem steps run at the same time by the batch redeem scheduler (all tasks and accounts)
+BATCH_REDEEM_WORKERS = int(os.getenv('BATCH_REDEEM_WORKERS', '4'))
 
 # Data directory - use /app/data in Docker, local ./data otherwise
 DATA_DIR = os.getenv('DATA_DIR', '/app/data' if os.path.exists('/app') else './data')
@@ -312,6 +312,37 @@ class Database:
                         )
                     ''')
 
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS batch_redeem_items (
+                            id INT AUTO_INCREMENT PRIMARY KEY,
+                            task_id INT NOT NULL,
+                            item_index INT NOT NULL,
+                            code VARCHAR(100) NOT NULL,
+                            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                            message TEXT,
+                            amount VARCHAR(50) DEFAULT '',
+                            executed_at TIMESTAMP NULL,
+                            FOREIGN KEY (task_id) REFERENCES batch_redeem_tasks(id) ON DELETE CASCADE,
+                            UNIQUE KEY uk_batch_item (task_id, item_index),
+                            INDEX idx_batch_item_status (task_id, status)
+                        )
+                    ''')
+
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS batch_redeem_accounts (
+                            id INT AUTO_INCREMENT PRIMARY KEY,
+                            task_id INT NOT NULL,
+                            account_id INT NOT NULL,
+                            next_execute_at TIMESTAMP NULL,
+                            success_count INT DEFAULT 0,
+                            fail_count INT DEFAULT 0,
+                            FOREIGN KEY (task_id) REFERENCES batch_redeem_tasks(id) ON DELETE CASCADE,
+                            FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+                            UNIQUE KEY uk_batch_account (task_id, account_id),
+                            INDEX idx_batch_account_member (account_id)
+                        )
+                    ''')
+
                     cursor.execute('''
                         CREATE TABLE IF NOT EXISTS invitation_codes (
                             id INT AUTO_INCREMENT PRIMARY KEY,
@@ -333,6 +364,20 @@ class Database:
                         )
                     ''')
 
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS balance_snapshots (
+                            id INT AUTO_INCREMENT PRIMARY KEY,
+                            account_id INT NOT NULL,
+                            resolution VARCHAR(4) NOT NULL DEFAULT 'raw',
+                            bucket_at DATETIME NOT NULL,
+                            balance DECIMAL(20,8) NOT NULL,
+                            total_consumed DECIMAL(20,8) NOT NULL DEFAULT 0,
+                            FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+                            INDEX idx_snapshot_account (account_id, bucket_at),
+                            INDEX idx_snapshot_resolution (resolution, bucket_at)
+                        )
+                    ''')
+
                     # Add new fields if not exist
                     new_fields = [
                         ("accounts", "retry_count", "INT DEFAULT 2"),
@@ -359,6 +404,39 @@ class Database:
                         ("accounts", "balance_updated_at", "TIMESTAMP NULL DEFAULT NULL"),
                         # Invitation codes sync time
                         ("accounts", "invitation_synced_at", "TIMESTAMP NULL DEFAULT NULL"),
+                        # Per error class retry policy overrides (JSON)
+                        ("checkin_settings", "retry_policy", "TEXT"),
+                        # Check-in outcome classification
+                        ("checkin_history", "outcome", "VARCHAR(20) DEFAULT NULL"),
+                        # Account health and quarantine
+                        ("accounts", "health_score", "INT DEFAULT 100"),
+                        ("accounts", "consecutive_auth_failures", "INT DEFAULT 0"),
+                        ("accounts", "quarantined", "BOOLEAN DEFAULT FALSE"),
+                        ("accounts", "quarantined_at", "TIMESTAMP NULL DEFAULT NULL"),
+                        ("accounts", "last_probe_at", "TIMESTAMP NULL DEFAULT NULL"),
+                        # Pre-flight warm-up before the check-in window
+                        ("checkin_settings", "warmup_minutes", "INT DEFAULT 0"),
+                        # Per-account check-in windows and load spreading
+                        ("accounts", "custom_window", "BOOLEAN DEFAULT FALSE"),
+                        ("checkin_settings", "spread_minutes", "INT DEFAULT 0"),
+                        # Last successful check-in strategy per account
+                        ("accounts", "checkin_strategy", "VARCHAR(100) DEFAULT NULL"),
+                        # Infer authentication from the check-in response
+                        ("checkin_settings", "inline_auth", "BOOLEAN DEFAULT FALSE"),
+                        # Per-phase timings and successful endpoint of each check-in
+                        ("checkin_history", "timings", "TEXT"),
+                        ("checkin_history", "endpoint", "VARCHAR(100) DEFAULT NULL"),
+                        # Last time the balance actually changed (staleness-based refresh)
+                        ("accounts", "balance_changed_at", "TIMESTAMP NULL DEFAULT NULL"),
+                        # Pooled batch redeem across several accounts
+                        ("batch_redeem_tasks", "mode", "VARCHAR(10) DEFAULT 'single'"),
+                        ("batch_redeem_items", "account_id", "INT DEFAULT NULL"),
+                        # Leases so several panel processes can share batch redeem work
+                        ("batch_redeem_accounts", "owner", "VARCHAR(64) DEFAULT NULL"),
+                        ("batch_redeem_accounts", "lease_until", "TIMESTAMP NULL DEFAULT NULL"),
+                        # Last balance fetch attempt and consecutive failures (refresh backoff)
+                        ("accounts", "balance_checked_at", "TIMESTAMP NULL DEFAULT NULL"),
+                        ("accounts", "balance_failures", "INT DEFAULT 0"),
                     ]
 
                     for table_name, field_name, field_type in new_fields:
@@ -373,6 +451,22 @@ class Database:
                     except:
                         pass  # Index may already exist
 
+                    try:
+                        cursor.execute('CREATE INDEX idx_checkin_outcome ON checkin_history(outcome, checkin_date)')
+                    except:
+                        pass  # Index may already exist
+
+                    # Redeem code deduplication lookups
+                    try:
+                        cursor.execute('CREATE INDEX idx_redeem_code ON redeem_history(code, account_id)')
+                    except:
+                        pass  # Index may already exist
+
+                    try:
+                        cursor.execute('CREATE INDEX idx_batch_item_code ON batch_redeem_items(code, status)')
+                    except:
+                        pass  # Index may already exist
+
                 else:
                     cursor.execute('''
                         CREATE TABLE IF NOT EXISTS accounts (
@@ -468,6 +562,35 @@ class Database:
                         )
                     ''')
 
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS batch_redeem_items (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            task_id INTEGER NOT NULL,
+                            item_index INTEGER NOT NULL,
+                            code VARCHAR(100) NOT NULL,
+                            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                            message TEXT,
+                            amount VARCHAR(50) DEFAULT '',
+                            executed_at TIMESTAMP NULL,
+                            FOREIGN KEY (task_id) REFERENCES batch_redeem_tasks(id) ON DELETE CASCADE,
+                            UNIQUE (task_id, item_index)
+                        )
+                    ''')
+
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS batch_redeem_accounts (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            task_id INTEGER NOT NULL,
+                            account_id INTEGER NOT NULL,
+                            next_execute_at TIMESTAMP NULL,
+                            success_count INTEGER DEFAULT 0,
+                            fail_count INTEGER DEFAULT 0,
+                            FOREIGN KEY (task_id) REFERENCES batch_redeem_tasks(id) ON DELETE CASCADE,
+                            FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+                            UNIQUE (task_id, account_id)
+                        )
+                    ''')
+
                     cursor.execute('''
                         CREATE TABLE IF NOT EXISTS invitation_codes (
                             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -487,11 +610,27 @@ class Database:
                         )
                     ''')
 
+                    cursor.execute('''
+                        CREATE TABLE IF NOT EXISTS balance_snapshots (
+                            id INTEGER PRIMARY KEY AUTOINCREMENT,
+                            account_id INTEGER NOT NULL,
+                            resolution VARCHAR(4) NOT NULL DEFAULT 'raw',
+                            bucket_at TIMESTAMP NOT NULL,
+                            balance REAL NOT NULL,
+                            total_consumed REAL NOT NULL DEFAULT 0,
+                            FOREIGN KEY (account_id) REFERENCES accounts(id) ON DELETE CASCADE
+                        )
+                    ''')
+
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_redeem_account ON redeem_history(account_id)')
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_redeem_time ON redeem_history(created_at)')
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_status ON batch_redeem_tasks(status)')
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_account ON batch_redeem_tasks(account_id)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_item_status ON batch_redeem_items(task_id, status)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_account_member ON batch_redeem_accounts(account_id)')
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_invitation_account ON invitation_codes(account_id)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_account ON balance_snapshots(account_id, bucket_at)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_resolution ON balance_snapshots(resolution, bucket_at)')
 
                     # Search optimization indexes
                     cursor.execute('CREATE INDEX IF NOT EXISTS idx_invitation_code ON invitation_codes(code)')
@@ -508,6 +647,39 @@ class Database:
                         ("accounts", "balance_updated_at", "TIMESTAMP DEFAULT NULL"),
                         # Invitation codes sync time
                         ("accounts", "invitation_synced_at", "TIMESTAMP DEFAULT NULL"),
+                        # Per error class retry policy overrides (JSON)
+                        ("checkin_settings", "retry_policy", "TEXT DEFAULT NULL"),
+                        # Check-in outcome classification
+                        ("checkin_history", "outcome", "VARCHAR(20) DEFAULT NULL"),
+                        # Account health and quarantine
+                        ("accounts", "health_score", "INTEGER DEFAULT 100"),
+                        ("accounts", "consecutive_auth_failures", "INTEGER DEFAULT 0"),
+                        ("accounts", "quarantined", "BOOLEAN DEFAULT 0"),
+                        ("accounts", "quarantined_at", "TIMESTAMP DEFAULT NULL"),
+                        ("accounts", "last_probe_at", "TIMESTAMP DEFAULT NULL"),
+                        # Pre-flight warm-up before the check-in window
+                        ("checkin_settings", "warmup_minutes", "INTEGER DEFAULT 0"),
+                        # Per-account check-in windows and load spreading
+                        ("accounts", "custom_window", "BOOLEAN DEFAULT 0"),
+                        ("checkin_settings", "spread_minutes", "INTEGER DEFAULT 0"),
+                        # Last successful check-in strategy per account
+                        ("accounts", "checkin_strategy", "VARCHAR(100) DEFAULT NULL"),
+                        # Infer authentication from the check-in response
+                        ("checkin_settings", "inline_auth", "BOOLEAN DEFAULT 0"),
+                        # Per-phase timings and successful endpoint of each check-in
+                        ("checkin_history", "timings", "TEXT"),
+                        ("checkin_history", "endpoint", "VARCHAR(100) DEFAULT NULL"),
+                        # Last time the balance actually changed (staleness-based refresh)
+                        ("accounts", "balance_changed_at", "TIMESTAMP DEFAULT NULL"),
+                        # Pooled batch redeem across several accounts
+                        ("batch_redeem_tasks", "mode", "VARCHAR(10) DEFAULT 'single'"),
+                        ("batch_redeem_items", "account_id", "INTEGER DEFAULT NULL"),
+                        # Leases so several panel processes can share batch redeem work
+                        ("batch_redeem_accounts", "owner", "VARCHAR(64) DEFAULT NULL"),
+                        ("batch_redeem_accounts", "lease_until", "TIMESTAMP DEFAULT NULL"),
+                        # Last balance fetch attempt and consecutive failures (refresh backoff)
+                        ("accounts", "balance_checked_at", "TIMESTAMP DEFAULT NULL"),
+                        ("accounts", "balance_failures", "INTEGER DEFAULT 0"),
                     ]
 
                     for table_name, field_name, field_type in sqlite_new_fields:
@@ -516,6 +688,12 @@ class Database:
                         except:
                             pass
 
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_checkin_outcome ON checkin_history(outcome, checkin_date)')
+
+                    # Redeem code deduplication lookups
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_redeem_code ON redeem_history(code, account_id)')
+                    cursor.execute('CREATE INDEX IF NOT EXISTS idx_batch_item_code ON batch_redeem_items(code, status)')
+
                 # Initialize notification settings
                 cursor.execute('SELECT COUNT(*) as cnt FROM notification_settings')
                 result = cursor.fetchone()
@@ -621,6 +799,47 @@ class Database:
                     elif attempt == max_retries - 1:
                         raise
 
+    def executemany(self, query, seq_of_params):
+        """Execute a statement for every parameter tuple in a single round trip with connection retry"""
+        seq_of_params = list(seq_of_params)
+        if not seq_of_params:
+            return None
+
+        with self.lock:
+            max_retries = self.max_retries if self.db_type == 'mysql' else 3
+
+            for attempt in range(max_retries):
+                try:
+                    if self.db_type == 'mysql':
+                        self._ensure_connection()
+                        query = query.replace('?', '%s')
+
+                    cursor = self.conn.cursor()
+                    cursor.executemany(query, seq_of_params)
+
+                    if self.db_type == 'sqlite':
+                        self.conn.commit()
+
+                    if self.db_type == 'mysql':
+                        self.retry_count = 0
+
+                    return cursor
+
+                except Exception as e:
+                    logger.error(f"Database executemany error (attempt {attempt + 1}): {e}")
+
+                    if self.db_type == 'mysql' and attempt < max_retries - 1:
+                        delay = self.calculate_retry_delay(attempt)
+                        logger.info(f"Retrying database operation in {delay} seconds...")
+                        time.sleep(delay)
+
+                        try:
+                            self.reconnect_with_retry()
+                        except:
+                            pass
+                    elif attempt == max_retries - 1:
+                        raise
+
     def fetchone(self, query, params=None, use_cache=False):
         """Fetch one row from database with optional caching"""
         cache_key = None
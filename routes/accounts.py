@@ -6,26 +6,24 @@ Accounts routes for Leaflow Auto Check-in Control Panel
 
 import json
 import time
-import random
-import threading
+from datetime import datetime
 
 from flask import Blueprint, request, jsonify
 
-from config import logger
+from config import logger, TIMEZONE
 from database import db, account_cache, data_cache
 from utils import token_required, parse_cookie_string
 
 accounts_bp = Blueprint('accounts', __name__)
 
-# 全局进度状态
-refresh_progress = {
-    'running': False,
-    'total': 0,
-    'completed': 0,
-    'success': 0,
-    'failed': 0,
-    'current_account': ''
-}
+
+def _is_valid_time(value):
+    """校验 HH:MM 格式的时间"""
+    try:
+        hour, minute = value.split(':')
+        return len(hour) == 2 and len(minute) == 2 and 0 <= int(hour) < 24 and 0 <= int(minute) < 60
+    except (ValueError, AttributeError):
+        return False
 
 
 @accounts_bp.route('/api/accounts', methods=['GET'])
@@ -43,9 +41,10 @@ def get_accounts():
         # 基础查询 SQL
         base_query = '''
             SELECT a.id, a.name, a.enabled, a.checkin_time_start, a.checkin_time_end,
-                   a.check_interval, a.retry_count, a.created_at,
+                   a.check_interval, a.retry_count, a.custom_window, a.created_at,
                    a.leaflow_uid, a.leaflow_name, a.leaflow_email, a.leaflow_created_at,
                    a.current_balance, a.total_consumed, a.balance_updated_at,
+                   a.health_score, a.consecutive_auth_failures, a.quarantined, a.quarantined_at,
                    ch.success as today_success, ch.message as today_message,
                    ch.created_at as today_checkin_time,
                    COALESCE(ic.total_codes, 0) as invitation_total,
@@ -163,6 +162,28 @@ def update_account(account_id):
             updates.append('enabled = ?')
             params.append(1 if data['enabled'] else 0)
 
+        # 自定义签到窗口：设置开始/结束时间即启用，custom_window = false 恢复自动分配
+        if 'checkin_time_start' in data or 'checkin_time_end' in data:
+            start = data.get('checkin_time_start') or ''
+            end = data.get('checkin_time_end') or ''
+            if not _is_valid_time(start) or not _is_valid_time(end):
+                return jsonify({'message': 'Check-in window must be in HH:MM format'}), 400
+            if start > end:
+                return jsonify({'message': 'Check-in window start must not be later than end'}), 400
+            updates.extend(['checkin_time_start = ?', 'checkin_time_end = ?', 'custom_window = 1'])
+            params.extend([start, end])
+        elif 'custom_window' in data and not data['custom_window']:
+            updates.append('custom_window = 0')
+
+        if 'check_interval' in data:
+            check_interval = int(data['check_interval'])
+            if check_interval < 0 or check_interval > 3600:
+                return jsonify({'message': 'Check interval must be between 0 and 3600 seconds'}), 400
+            updates.append('check_interval = ?')
+            params.append(check_interval)
+
+        release_quarantine = False
+
         if 'token_data' in data or 'cookie_data' in data:
             cookie_input = data.get('token_data', data.get('cookie_data', ''))
             if isinstance(cookie_input, str):
@@ -171,12 +192,28 @@ def update_account(account_id):
                 token_data = cookie_input
             updates.append('token_data = ?')
             params.append(json.dumps(token_data))
+            # 更新 Cookie 后自动解除隔离
+            release_quarantine = True
+
+        if 'quarantined' in data:
+            if data['quarantined']:
+                return jsonify({'message': 'Accounts are quarantined automatically'}), 400
+            release_quarantine = True
+
+        if release_quarantine:
+            updates.append('quarantined = 0')
+            updates.append('quarantined_at = NULL')
+            updates.append('consecutive_auth_failures = 0')
 
         if updates:
             params.append(account_id)
             query = f"UPDATE accounts SET {', '.join(updates)} WHERE id = ?"
             db.execute(query, params)
 
+            if 'token_data' in data or 'cookie_data' in data:
+                from services.session_registry import session_registry
+                session_registry.invalidate(account_id)
+
             account_cache.refresh_from_db(db)
             data_cache.invalidate()
 
@@ -199,6 +236,9 @@ def delete_account(account_id):
         db.execute('DELETE FROM checkin_history WHERE account_id = ?', (account_id,))
         db.execute('DELETE FROM accounts WHERE id = ?', (account_id,))
 
+        from services.session_registry import session_registry
+        session_registry.invalidate(account_id)
+
         account_cache.refresh_from_db(db)
         data_cache.invalidate()
 
@@ -214,49 +254,22 @@ def delete_account(account_id):
 @token_required
 def refresh_account_balance(account_id):
     """Refresh balance info for a single account"""
-    from datetime import datetime
-    from config import TIMEZONE
     from services import BalanceService
-    from services.checkin_service import LeafLowCheckin
+    from services.session_registry import session_registry
 
     try:
         account = db.fetchone('SELECT * FROM accounts WHERE id = ?', (account_id,))
         if not account:
             return jsonify({'message': 'Account not found'}), 404
 
-        # 解析 token_data 并创建 session
-        token_data = json.loads(account['token_data'])
-        leaflow_checkin = LeafLowCheckin()
-        session = leaflow_checkin.create_session(token_data)
+        session = session_registry.get(account)
 
-        # 获取余额信息
-        success, result = BalanceService.fetch_balance_info(session)
+        # 获取并保存余额信息（与进行中的定时刷新共用同一次请求）
+        success, result = BalanceService.fetch_account_balance(db, session, account_id)
 
         if not success:
             return jsonify({'message': f'Failed to fetch balance: {result}'}), 400
 
-        # 更新数据库
-        db.execute('''
-            UPDATE accounts SET
-                leaflow_uid = ?,
-                leaflow_name = ?,
-                leaflow_email = ?,
-                leaflow_created_at = ?,
-                current_balance = ?,
-                total_consumed = ?,
-                balance_updated_at = ?
-            WHERE id = ?
-        ''', (
-            result['leaflow_uid'],
-            result['leaflow_name'],
-            result['leaflow_email'],
-            result['leaflow_created_at'],
-            result['current_balance'],
-            result['total_consumed'],
-            datetime.now(TIMEZONE),
-            account_id
-        ))
-
         account_cache.refresh_from_db(db)
         data_cache.invalidate()
 
@@ -276,99 +289,24 @@ def refresh_account_balance(account_id):
 @token_required
 def refresh_all_balances():
     """异步刷新所有启用账号的余额"""
-    global refresh_progress
-
-    if refresh_progress['running']:
-        return jsonify({'message': '刷新任务正在进行中', 'status': 'running'}), 400
+    from services.balance_refresh import balance_refresh
 
     try:
+        # 手动刷新同时只保留一个，重复点击返回进行中的任务
+        running = balance_refresh.latest('manual')
+        if running and running.running:
+            return jsonify({'message': '刷新任务正在进行中', 'status': 'running', 'job_id': running.id})
+
         accounts = db.fetchall('SELECT * FROM accounts WHERE enabled = 1')
 
         if not accounts:
             return jsonify({'message': 'No enabled accounts found'}), 404
 
-        # 初始化进度状态
-        refresh_progress['running'] = True
-        refresh_progress['total'] = len(accounts)
-        refresh_progress['completed'] = 0
-        refresh_progress['success'] = 0
-        refresh_progress['failed'] = 0
-        refresh_progress['current_account'] = ''
-
-        def do_refresh():
-            """后台执行刷新任务"""
-            global refresh_progress
-            from datetime import datetime
-            from config import TIMEZONE
-            from services import BalanceService
-            from services.checkin_service import LeafLowCheckin
+        job = balance_refresh.start(accounts, source='manual')
 
-            try:
-                leaflow_checkin = LeafLowCheckin()
-
-                for account in accounts:
-                    refresh_progress['current_account'] = account['name']
-
-                    try:
-                        token_data = json.loads(account['token_data'])
-                        session = leaflow_checkin.create_session(token_data)
-
-                        success, result = BalanceService.fetch_balance_info(session)
-
-                        if success:
-                            db.execute('''
-                                UPDATE accounts SET
-                                    leaflow_uid = ?,
-                                    leaflow_name = ?,
-                                    leaflow_email = ?,
-                                    leaflow_created_at = ?,
-                                    current_balance = ?,
-                                    total_consumed = ?,
-                                    balance_updated_at = ?
-                                WHERE id = ?
-                            ''', (
-                                result['leaflow_uid'],
-                                result['leaflow_name'],
-                                result['leaflow_email'],
-                                result['leaflow_created_at'],
-                                result['current_balance'],
-                                result['total_consumed'],
-                                datetime.now(TIMEZONE),
-                                account['id']
-                            ))
-                            refresh_progress['success'] += 1
-                            logger.info(f"Account {account['name']} balance refreshed: {result['current_balance']}")
-                        else:
-                            refresh_progress['failed'] += 1
-                            logger.warning(f"Account {account['name']} balance refresh failed: {result}")
-
-                    except Exception as e:
-                        refresh_progress['failed'] += 1
-                        logger.error(f"Account {account['name']} balance refresh error: {e}")
-
-                    refresh_progress['completed'] += 1
-
-                    # 每个账号间随机等待 300-1000ms
-                    time.sleep(random.uniform(0.3, 1.0))
-
-                account_cache.refresh_from_db(db)
-                data_cache.invalidate()
-                logger.info(f"All balances refresh completed: {refresh_progress['success']}/{refresh_progress['total']}")
-
-            except Exception as e:
-                logger.error(f"Refresh all balances error: {e}")
-            finally:
-                refresh_progress['running'] = False
-                refresh_progress['current_account'] = ''
-
-        # 启动后台线程
-        thread = threading.Thread(target=do_refresh, daemon=True)
-        thread.start()
-
-        return jsonify({'message': '余额刷新任务已启动', 'status': 'started'})
+        return jsonify({'message': '余额刷新任务已启动', 'status': 'started', 'job_id': job.id})
 
     except Exception as e:
-        refresh_progress['running'] = False
         logger.error(f"Refresh all balances error: {e}")
         return jsonify({'message': f'Error: {str(e)}'}), 500
 
@@ -376,8 +314,84 @@ def refresh_all_balances():
 @accounts_bp.route('/api/accounts/refresh-progress', methods=['GET'])
 @token_required
 def get_refresh_progress():
-    """获取刷新进度"""
-    return jsonify(refresh_progress)
+    """获取刷新进度（默认最近一次手动刷新，可通过 job_id 指定）"""
+    from services.balance_refresh import balance_refresh
+
+    job_id = request.args.get('job_id')
+    job = balance_refresh.get(job_id) if job_id else balance_refresh.latest('manual')
+    if job is None:
+        if job_id:
+            return jsonify({'message': 'Job not found'}), 404
+        return jsonify({'running': False, 'total': 0, 'completed': 0, 'success': 0, 'failed': 0, 'current_account': ''})
+    return jsonify(job.to_dict())
+
+
+@accounts_bp.route('/api/accounts/refresh-jobs', methods=['GET'])
+@token_required
+def get_refresh_jobs():
+    """列出最近的余额刷新任务（手动和定时）"""
+    from services.balance_refresh import balance_refresh
+
+    return jsonify(balance_refresh.list_jobs())
+
+
+def _parse_date_range(default_days=7):
+    """读取 start/end（YYYY-MM-DD，含 end 当天），返回 [start, end) 的 datetime"""
+    from datetime import datetime, timedelta
+    from config import TIMEZONE
+
+    today = datetime.now(TIMEZONE).date()
+    end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+    start = (datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+             if request.args.get('start') else end - timedelta(days=default_days - 1))
+    if start > end:
+        raise ValueError('start must not be after end')
+    return datetime.combine(start, datetime.min.time()), datetime.combine(end + timedelta(days=1), datetime.min.time())
+
+
+@accounts_bp.route('/api/accounts/<int:account_id>/balance-history', methods=['GET'])
+@token_required
+def get_balance_history(account_id):
+    """账号的余额快照（近期为原始点，较早的为小时/天桶）和每日收入"""
+    from services.balance_snapshot_service import BalanceSnapshotService
+
+    try:
+        start, end = _parse_date_range()
+    except ValueError as e:
+        return jsonify({'message': f'Invalid date range: {e}'}), 400
+
+    try:
+        points = BalanceSnapshotService.get_points(db, account_id, start, end)
+        earnings = BalanceSnapshotService.daily_earnings(db, start, end, account_id)
+        return jsonify({
+            'points': points,
+            'daily_earnings': [{'date': day.isoformat(), 'amount': float(amount)} for day, amount in sorted(earnings.items())]
+        })
+    except Exception as e:
+        logger.error(f"Get balance history error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+
+
+@accounts_bp.route('/api/accounts/balance-earnings', methods=['GET'])
+@token_required
+def get_balance_earnings():
+    """所有账号的每日收入合计"""
+    from services.balance_snapshot_service import BalanceSnapshotService
+
+    try:
+        start, end = _parse_date_range()
+    except ValueError as e:
+        return jsonify({'message': f'Invalid date range: {e}'}), 400
+
+    try:
+        earnings = BalanceSnapshotService.daily_earnings(db, start, end)
+        return jsonify({
+            'daily_earnings': [{'date': day.isoformat(), 'amount': float(amount)} for day, amount in sorted(earnings.items())],
+            'total': float(sum(earnings.values()))
+        })
+    except Exception as e:
+        logger.error(f"Get balance earnings error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 500
 
 
 @accounts_bp.route('/api/accounts/<int:account_id>/redeem', methods=['POST'])
@@ -385,7 +399,8 @@ def get_refresh_progress():
 def redeem_code(account_id):
     """为指定账号执行兑换码兑换"""
     from services.redeem_service import RedeemService
-    from services.checkin_service import LeafLowCheckin
+    from services.session_registry import session_registry
+    from services.redeem_code_registry import redeem_code_registry
 
     try:
         data = request.get_json()
@@ -399,26 +414,34 @@ def redeem_code(account_id):
         if not account:
             return jsonify({'message': '账号不存在'}), 404
 
-        # 创建 session 并执行兑换
-        token_data = json.loads(account['token_data'])
-        leaflow_checkin = LeafLowCheckin()
-        session = leaflow_checkin.create_session(token_data)
+        # 已兑换过或已确认无效的码不再请求上游
+        known = redeem_code_registry.find_known(db, [account_id], [code])
+        if code in known:
+            return jsonify({
+                'success': False,
+                'message': f'兑换码不可用: {known[code]}'
+            }), 400
 
+        # 复用账户的 session 执行兑换
+        session = session_registry.get(account)
+
+        started = time.time()
         success, message = RedeemService.redeem_code(session, code)
 
         # 提取金额并记录历史
         amount = RedeemService.extract_amount(message) if success else ''
 
         db.execute('''
-            INSERT INTO redeem_history (account_id, code, success, message, amount)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (account_id, code, success, message, amount))
+            INSERT INTO redeem_history (account_id, code, success, message, amount, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (account_id, code, success, message, amount, datetime.now(TIMEZONE).replace(tzinfo=None)))
+        redeem_code_registry.remember(db, account_id, code, success, message)
 
         if success:
             logger.info(f"Account {account['name']} redeem success: {message}")
-            # 兑换成功后刷新余额
+            # 兑换成功后刷新余额（兑换响应中已带有新余额时不再请求）
             from services.balance_service import BalanceService
-            BalanceService.refresh_account_balance(db, session, account_id, account['name'])
+            BalanceService.refresh_account_balance(db, session, account_id, account['name'], seen_since=started)
             # 清除缓存以刷新余额显示
             data_cache.invalidate()
             return jsonify({
@@ -482,11 +505,30 @@ def create_batch_redeem(account_id):
         if not account:
             return jsonify({'success': False, 'message': '账号不存在'}), 404
 
+        # 码池模式：其他账户一起消耗这批兑换码
+        pool_account_ids = []
+        for pool_id in data.get('pool_account_ids') or []:
+            try:
+                pool_id = int(pool_id)
+            except (TypeError, ValueError):
+                return jsonify({'success': False, 'message': '无效的账号 ID'}), 400
+            if pool_id != account_id:
+                pool_account_ids.append(pool_id)
+
+        if pool_account_ids:
+            placeholders = ','.join('?' for _ in pool_account_ids)
+            found = db.fetchall(f'SELECT id FROM accounts WHERE id IN ({placeholders})', tuple(pool_account_ids))
+            if len(found) != len(set(pool_account_ids)):
+                return jsonify({'success': False, 'message': '部分账号不存在'}), 404
+
         # 创建任务
-        result = batch_redeem_scheduler.create_task(account_id, codes)
+        result = batch_redeem_scheduler.create_task(account_id, codes, pool_account_ids)
 
         if result['success']:
-            logger.info(f"Batch redeem task created for account {account['name']}: {len(codes)} codes")
+            logger.info(
+                f"Batch redeem task created for account {account['name']}: {len(codes)} codes"
+                + (f", {len(pool_account_ids)} pooled accounts" if pool_account_ids else '')
+            )
             return jsonify(result)
         else:
             return jsonify(result), 400
@@ -503,7 +545,10 @@ def get_batch_redeem_status(account_id):
     from services.batch_redeem_service import batch_redeem_scheduler
 
     try:
-        result = batch_redeem_scheduler.get_task_status(account_id)
+        page = request.args.get('page', type=int)
+        per_page = min(max(request.args.get('per_page', 50, type=int), 1), 200)
+        status = request.args.get('status') or None
+        result = batch_redeem_scheduler.get_task_status(account_id, page, per_page, status)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Get batch redeem status error: {e}")
@@ -568,7 +613,7 @@ def resume_batch_redeem(task_id):
 def get_invitation_codes(account_id):
     """获取账户的邀请码列表（支持缓存）"""
     from services.invitation_service import InvitationService
-    from services.checkin_service import LeafLowCheckin
+    from services.session_registry import session_registry
 
     try:
         # 获取 refresh 参数
@@ -594,10 +639,8 @@ def get_invitation_codes(account_id):
                 'cached': True
             })
 
-        # 创建 session 调用 API
-        token_data = json.loads(account['token_data'])
-        leaflow_checkin = LeafLowCheckin()
-        session = leaflow_checkin.create_session(token_data)
+        # 复用账户的 session 调用 API
+        session = session_registry.get(account)
 
         # 获取邀请码列表
         success, result = InvitationService.get_invitation_codes(session)
@@ -628,7 +671,7 @@ def get_invitation_codes(account_id):
 def create_invitation_code(account_id):
     """为账户创建新邀请码"""
     from services.invitation_service import InvitationService
-    from services.checkin_service import LeafLowCheckin
+    from services.session_registry import session_registry
 
     try:
         # 获取账号
@@ -636,21 +679,19 @@ def create_invitation_code(account_id):
         if not account:
             return jsonify({'success': False, 'message': '账号不存在'}), 404
 
-        # 创建 session
-        token_data = json.loads(account['token_data'])
-        leaflow_checkin = LeafLowCheckin()
-        session = leaflow_checkin.create_session(token_data)
+        session = session_registry.get(account)
 
         # 创建邀请码（固定 max_uses=1）
+        started = time.time()
         success, result = InvitationService.create_invitation_code(session, max_uses=1)
 
         if success:
             logger.info(f"Account {account['name']} created invitation code: {result.get('code')}")
             # 保存到数据库缓存
             InvitationService.save_single_code(db, account_id, result)
-            # 创建邀请码后刷新余额（邀请码消耗余额）
+            # 创建邀请码后刷新余额（邀请码消耗余额；响应中已带有新余额时不再请求）
             from services.balance_service import BalanceService
-            BalanceService.refresh_account_balance(db, session, account_id, account['name'])
+            BalanceService.refresh_account_balance(db, session, account_id, account['name'], seen_since=started)
             return jsonify({
                 'success': True,
                 'code': result
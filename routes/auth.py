@@ -4,7 +4,6 @@
 Authentication routes for Leaflow Auto Check-in Control Panel
 """
 
-import re
 from datetime import datetime, timedelta
 
 from flask import Blueprint, request, jsonify, make_response, current_app
@@ -12,6 +11,7 @@ import jwt
 
 from config import ADMIN_USERNAME, ADMIN_PASSWORD, TIMEZONE, logger
 from database import db
+from services.balance_snapshot_service import BalanceSnapshotService
 from utils import token_required
 
 auth_bp = Blueprint('auth', __name__)
@@ -72,7 +72,7 @@ def dashboard():
         today = datetime.now(TIMEZONE).date()
 
         today_checkins = db.fetchall('''
-            SELECT a.name, ch.success, ch.message, ch.created_at, ch.retry_times
+            SELECT a.name, ch.success, ch.message, ch.outcome, ch.created_at, ch.retry_times
             FROM checkin_history ch
             JOIN accounts a ON ch.account_id = a.id
             WHERE DATE(ch.checkin_date) = DATE(?)
@@ -96,20 +96,16 @@ def dashboard():
             WHERE current_balance IS NOT NULL
         ''', use_cache=True)
 
-        # 统计今日签到总额（从成功签到的 message 中提取）
-        today_success_records = db.fetchall('''
-            SELECT message FROM checkin_history
-            WHERE DATE(checkin_date) = DATE(?) AND success = 1
-        ''', (today,))
-
-        today_checkin_amount = 0.0
-        if today_success_records:
-            for record in today_success_records:
-                msg = record.get('message', '') or ''
-                # 匹配数字，如 "+0.5"、"0.5 credits"、"获得 0.5"
-                match = re.search(r'(\d+\.?\d*)\s*(credits?|元)?', msg, re.IGNORECASE)
-                if match:
-                    today_checkin_amount += float(match.group(1))
+        # 今日收入来自余额快照（相邻快照的余额增加量），扣除当日兑换码金额即为签到所得
+        today_earnings = BalanceSnapshotService.today_earnings(db)
+        # redeem_history.created_at 按本地时间写入，用本地当天的时间范围过滤
+        day_start = datetime.now(TIMEZONE).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+        today_redeemed = db.fetchone('''
+            SELECT COALESCE(SUM(CAST(amount AS DECIMAL(20,8))), 0) as total FROM redeem_history
+            WHERE success = 1 AND amount <> '' AND created_at >= ? AND created_at < ?
+        ''', (day_start, day_start + timedelta(days=1)))
+        redeemed_amount = float(today_redeemed['total']) if today_redeemed else 0
+        today_checkin_amount = max(0.0, float(today_earnings) - redeemed_amount)
 
         total_balance = float(balance_stats['total_balance']) if balance_stats else 0
         total_consumed = float(balance_stats['total_consumed']) if balance_stats else 0
@@ -123,7 +119,8 @@ def dashboard():
             'success_rate': success_rate,
             'total_balance': total_balance,
             'total_consumed': total_consumed,
-            'today_checkin_amount': today_checkin_amount
+            'today_checkin_amount': today_checkin_amount,
+            'today_earnings': float(today_earnings)
         })
 
     except Exception as e:
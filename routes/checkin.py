@@ -4,14 +4,21 @@
 Check-in routes for Leaflow Auto Check-in Control Panel
 """
 
-import threading
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import Blueprint, request, jsonify
 
 from config import logger, TIMEZONE
 from database import db, account_cache, data_cache
 from services import scheduler
+from services.checkin_outcome import CheckinOutcome
+from services.checkin_planner import CheckinPlanner
+from services.checkin_trace import summarize_timings
+from services.circuit_breaker import circuit_breakers
+from services.http_transport import shared_transport
+from services.leaflow_client import leaflow_client
+from services.session_registry import session_registry
+from services.single_flight import single_flight
 from utils import token_required
 
 checkin_bp = Blueprint('checkin', __name__)
@@ -53,44 +60,91 @@ def clear_checkin_history():
 def manual_checkin(account_id):
     """Trigger manual check-in"""
     try:
-        threading.Thread(target=scheduler.perform_checkin, args=(account_id,), daemon=True).start()
-        return jsonify({'message': 'Manual check-in triggered'})
+        job, started = scheduler.trigger_checkin(account_id)
+        # 重复点击返回进行中的任务，不会再发起一次签到
+        return jsonify({
+            'message': 'Manual check-in triggered' if started else 'Check-in already in progress',
+            'status': 'started' if started else 'running',
+            'job': job.to_dict()
+        })
     except Exception as e:
         logger.error(f"Manual checkin error: {e}")
         return jsonify({'message': f'Error: {str(e)}'}), 400
 
 
+def _query_checkin_history(account_id=None, days=10, outcome=None):
+    """Query checkin history within the last N days, optionally by account and outcome"""
+    today = datetime.now(TIMEZONE).date()
+
+    conditions = []
+    params = []
+
+    if account_id is not None:
+        conditions.append('ch.account_id = ?')
+        params.append(account_id)
+
+    if db.db_type == 'mysql':
+        conditions.append('ch.checkin_date >= DATE_SUB(?, INTERVAL ? DAY)')
+    else:
+        conditions.append("ch.checkin_date >= DATE(?, '-' || ? || ' days')")
+    params.extend([today, days])
+
+    if outcome:
+        conditions.append('ch.outcome = ?')
+        params.append(outcome)
+
+    return db.fetchall(f'''
+        SELECT ch.id, ch.account_id, a.name as account_name, ch.success, ch.message,
+               ch.outcome, ch.retry_times, ch.created_at, ch.checkin_date
+        FROM checkin_history ch
+        JOIN accounts a ON ch.account_id = a.id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY ch.created_at DESC
+    ''', tuple(params))
+
+
+def _get_outcome_filter():
+    """Read and validate the outcome query parameter"""
+    outcome = request.args.get('outcome', '').strip() or None
+    if outcome and outcome not in CheckinOutcome.values():
+        raise ValueError(f"Invalid outcome: {outcome}")
+    return outcome
+
+
 @checkin_bp.route('/api/checkin/history/<int:account_id>', methods=['GET'])
 @token_required
 def get_checkin_history(account_id):
     """Get checkin history for a specific account (last 10 days by default)"""
     try:
         days = request.args.get('days', 10, type=int)
-        today = datetime.now(TIMEZONE).date()
-
-        if db.db_type == 'mysql':
-            history = db.fetchall('''
-                SELECT ch.id, ch.success, ch.message, ch.retry_times, ch.created_at, ch.checkin_date
-                FROM checkin_history ch
-                WHERE ch.account_id = ?
-                  AND ch.checkin_date >= DATE_SUB(?, INTERVAL ? DAY)
-                ORDER BY ch.created_at DESC
-            ''', (account_id, today, days))
-        else:
-            history = db.fetchall('''
-                SELECT ch.id, ch.success, ch.message, ch.retry_times, ch.created_at, ch.checkin_date
-                FROM checkin_history ch
-                WHERE ch.account_id = ?
-                  AND ch.checkin_date >= DATE(?, '-' || ? || ' days')
-                ORDER BY ch.created_at DESC
-            ''', (account_id, today, days))
+        outcome = _get_outcome_filter()
 
+        history = _query_checkin_history(account_id, days, outcome)
         return jsonify(history or [])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Get checkin history error: {e}")
         return jsonify({'message': f'Error: {str(e)}'}), 400
 
 
+@checkin_bp.route('/api/checkin/history', methods=['GET'])
+@token_required
+def get_all_checkin_history():
+    """Get checkin history of all accounts, filterable by outcome"""
+    try:
+        days = request.args.get('days', 1, type=int)
+        outcome = _get_outcome_filter()
+
+        history = _query_checkin_history(None, days, outcome)
+        return jsonify(history or [])
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Get all checkin history error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 400
+
+
 @checkin_bp.route('/api/checkin/delete', methods=['POST'])
 @token_required
 def delete_checkin_records():
@@ -112,3 +166,118 @@ def delete_checkin_records():
     except Exception as e:
         logger.error(f"Delete checkin records error: {e}")
         return jsonify({'message': f'Error: {str(e)}'}), 400
+
+
+@checkin_bp.route('/api/checkin/circuit-breakers', methods=['GET'])
+@token_required
+def get_circuit_breakers():
+    """Get upstream circuit breaker states"""
+    return jsonify(circuit_breakers.snapshot())
+
+
+@checkin_bp.route('/api/checkin/http-pool', methods=['GET'])
+@token_required
+def get_http_pool_stats():
+    """Get shared HTTP connection pool, TLS resumption, account session, Inertia handshake and in-flight statistics"""
+    stats = shared_transport.stats()
+    stats['sessions'] = session_registry.status()
+    stats['inertia'] = leaflow_client.status()
+    stats['in_flight'] = single_flight.snapshot()
+    return jsonify(stats)
+
+
+@checkin_bp.route('/api/checkin/warmup', methods=['GET'])
+@token_required
+def get_warmup_status():
+    """Get pre-flight warm-up status"""
+    return jsonify(scheduler.warmup.status())
+
+
+@checkin_bp.route('/api/checkin/schedule-preview', methods=['GET'])
+@token_required
+def get_schedule_preview():
+    """Preview today's planned check-in times and projected requests per minute"""
+    try:
+        settings = dict(db.fetchone('SELECT * FROM checkin_settings WHERE id = 1') or {})
+
+        # 允许在保存前预览未提交的设置
+        if request.args.get('checkin_time'):
+            settings['checkin_time'] = request.args.get('checkin_time')
+        if request.args.get('spread_minutes') is not None:
+            settings['spread_minutes'] = max(0, min(720, request.args.get('spread_minutes', 0, type=int)))
+
+        accounts = db.fetchall('''
+            SELECT id, checkin_time_start, checkin_time_end, custom_window
+            FROM accounts WHERE enabled = 1 AND quarantined = 0
+        ''') or []
+
+        plan = CheckinPlanner.plan(accounts, settings, datetime.now(TIMEZONE))
+        preview = CheckinPlanner.project_load(plan, settings.get('random_delay_max') or 0)
+        preview['planned'] = CheckinPlanner.format_plan(plan)
+        return jsonify(preview)
+    except Exception as e:
+        logger.error(f"Get schedule preview error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+
+
+@checkin_bp.route('/api/checkin/endpoint-stats', methods=['GET'])
+@token_required
+def get_endpoint_stats():
+    """Get which check-in strategy wins, globally and per account"""
+    try:
+        stats = scheduler.leaflow_checkin.strategy_stats.snapshot()
+        rows = db.fetchall('''
+            SELECT checkin_strategy, COUNT(*) as accounts FROM accounts
+            WHERE checkin_strategy IS NOT NULL
+            GROUP BY checkin_strategy
+        ''') or []
+        stats['accounts_by_strategy'] = {row['checkin_strategy']: row['accounts'] for row in rows}
+        return jsonify(stats)
+    except Exception as e:
+        logger.error(f"Get endpoint stats error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 500
+
+
+@checkin_bp.route('/api/checkin/timings', methods=['GET'])
+@token_required
+def get_checkin_timings():
+    """Get p50/p95/p99 of each check-in phase over a date range (default: last 7 days)"""
+    try:
+        today = datetime.now(TIMEZONE).date()
+        try:
+            end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+            start = (datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+                     if request.args.get('start') else end - timedelta(days=6))
+        except ValueError:
+            return jsonify({'message': 'Invalid date, expected YYYY-MM-DD'}), 400
+
+        if start > end:
+            return jsonify({'message': 'start must not be after end'}), 400
+
+        conditions = ['checkin_date >= ?', 'checkin_date <= ?', 'timings IS NOT NULL']
+        params = [start, end]
+        account_id = request.args.get('account_id', type=int)
+        if account_id:
+            conditions.append('account_id = ?')
+            params.append(account_id)
+
+        rows = db.fetchall(f'''
+            SELECT timings, endpoint FROM checkin_history
+            WHERE {' AND '.join(conditions)}
+        ''', tuple(params)) or []
+
+        endpoints = {}
+        for row in rows:
+            if row['endpoint']:
+                endpoints[row['endpoint']] = endpoints.get(row['endpoint'], 0) + 1
+
+        return jsonify({
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'samples': len(rows),
+            'phases': summarize_timings(rows),
+            'endpoints': endpoints
+        })
+    except Exception as e:
+        logger.error(f"Get checkin timings error: {e}")
+        return jsonify({'message': f'Error: {str(e)}'}), 500
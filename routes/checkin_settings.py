@@ -4,12 +4,15 @@
 Checkin settings routes for Leaflow Auto Check-in Control Panel
 """
 
+import json
 from datetime import datetime
 
 from flask import Blueprint, request, jsonify
 
 from config import logger
 from database import db, data_cache
+from services.checkin_planner import CheckinPlanner
+from services.retry_policy import load_retry_policies, validate_policy_overrides
 from utils import token_required
 
 checkin_settings_bp = Blueprint('checkin_settings', __name__)
@@ -22,6 +25,8 @@ def get_checkin_settings():
     try:
         settings = db.fetchone('SELECT * FROM checkin_settings WHERE id = 1')
         if settings:
+            policies = load_retry_policies(settings.get('retry_policy'))
+            settings['retry_policy'] = {name: policy.to_dict() for name, policy in policies.items()}
             return jsonify(settings)
         else:
             default_settings = {
@@ -29,7 +34,11 @@ def get_checkin_settings():
                 'checkin_time': '05:30',
                 'retry_count': 2,
                 'random_delay_min': 0,
-                'random_delay_max': 30
+                'random_delay_max': 30,
+                'warmup_minutes': 0,
+                'spread_minutes': 0,
+                'inline_auth': False,
+                'retry_policy': {name: policy.to_dict() for name, policy in load_retry_policies().items()}
             }
             return jsonify(default_settings)
     except Exception as e:
@@ -49,6 +58,9 @@ def update_checkin_settings():
         retry_count = int(data.get('retry_count', 2))
         random_delay_min = int(data.get('random_delay_min', 0))
         random_delay_max = int(data.get('random_delay_max', 30))
+        warmup_minutes = int(data.get('warmup_minutes', 0) or 0)
+        spread_minutes = int(data.get('spread_minutes', 0) or 0)
+        inline_auth = 1 if data.get('inline_auth') else 0
 
         # Validate parameters
         if random_delay_min > random_delay_max:
@@ -60,6 +72,21 @@ def update_checkin_settings():
         if random_delay_min < 0 or random_delay_max > 300:
             return jsonify({'message': '随机延迟必须在 0-300 秒之间'}), 400
 
+        if warmup_minutes < 0 or warmup_minutes > 60:
+            return jsonify({'message': '预热时间必须在 0-60 分钟之间'}), 400
+
+        if spread_minutes < 0 or spread_minutes > 720:
+            return jsonify({'message': '分散时长必须在 0-720 分钟之间'}), 400
+
+        if spread_minutes > CheckinPlanner.max_spread_minutes(checkin_time):
+            return jsonify({'message': '签到时间加分散时长不能跨过午夜'}), 400
+
+        retry_policy = data.get('retry_policy')
+        if retry_policy is not None:
+            valid, error_msg = validate_policy_overrides(retry_policy)
+            if not valid:
+                return jsonify({'message': error_msg}), 400
+
         existing = db.fetchone('SELECT id FROM checkin_settings WHERE id = 1')
 
         if existing:
@@ -67,25 +94,33 @@ def update_checkin_settings():
                 UPDATE checkin_settings
                 SET checkin_time = ?, retry_count = ?,
                     random_delay_min = ?, random_delay_max = ?,
-                    updated_at = ?
+                    warmup_minutes = ?, spread_minutes = ?, inline_auth = ?, updated_at = ?
                 WHERE id = 1
             ''', (
                 checkin_time, retry_count,
                 random_delay_min, random_delay_max,
-                datetime.now()
+                warmup_minutes, spread_minutes, inline_auth, datetime.now()
             ))
             logger.info("Checkin settings updated successfully")
         else:
             db.execute('''
                 INSERT INTO checkin_settings
-                (id, checkin_time, retry_count, random_delay_min, random_delay_max)
-                VALUES (1, ?, ?, ?, ?)
+                (id, checkin_time, retry_count, random_delay_min, random_delay_max,
+                 warmup_minutes, spread_minutes, inline_auth)
+                VALUES (1, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 checkin_time, retry_count,
-                random_delay_min, random_delay_max
+                random_delay_min, random_delay_max, warmup_minutes, spread_minutes, inline_auth
             ))
             logger.info("Checkin settings created successfully")
 
+        # 仅在提交时更新重试策略，避免覆盖已有配置
+        if retry_policy is not None:
+            db.execute(
+                'UPDATE checkin_settings SET retry_policy = ? WHERE id = 1',
+                (json.dumps(retry_policy),)
+            )
+
         data_cache.invalidate()
 
         return jsonify({'message': '签到设置保存成功'})
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Balance refresh engine for Leaflow Auto Check-in Control Panel
+Refreshes many accounts with bounded parallelism, writes results in
+batches and tracks each run as a separately observable job
+"""
+
+import math
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from config import logger, TIMEZONE, BALANCE_REFRESH_WORKERS
+from database import db, account_cache, data_cache
+from .balance_service import BalanceService
+from .circuit_breaker import CircuitOpenError
+from .session_registry import session_registry
+
+
+class BalanceRefreshJob:
+    """一次批量刷新的进度"""
+
+    def __init__(self, source, total):
+        self.id = uuid.uuid4().hex[:12]
+        self.source = source
+        self.total = total
+        self.completed = 0
+        self.success = 0
+        self.failed = 0
+        self.current = set()
+        self.status = 'running'
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.status == 'running'
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'job_id': self.id,
+                'source': self.source,
+                'status': self.status,
+                'running': self.running,
+                'total': self.total,
+                'completed': self.completed,
+                'success': self.success,
+                'failed': self.failed,
+                'current_account': ', '.join(sorted(self.current)),
+                'error': self.error,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed': round((self.finished_at or time.time()) - self.started_at, 1),
+            }
+
+
+def _to_datetime(value):
+    """数据库中的时间（MySQL 为 datetime，SQLite 为字符串）转为带时区的 datetime"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = TIMEZONE.localize(value)
+    return value
+
+
+class BalanceRefreshPolicy:
+    """
+    按账户的数据新鲜度安排余额刷新
+
+    余额最近有变化的账户按基础间隔刷新，长期不变的账户间隔随不变的天数
+    逐步拉长（最多 MAX_FACTOR 倍）；每轮只取最久未刷新的一部分，
+    把刷新分散到整个间隔内；获取失败的账户从最后一次尝试起按连续失败次数
+    指数退避，不会挤占其他账户的配额
+    """
+
+    MAX_FACTOR = 12
+    MAX_BACKOFF_FACTOR = 16
+
+    @staticmethod
+    def refresh_interval(account, now, base_interval):
+        """账户的刷新间隔（秒）"""
+        changed_at = _to_datetime(account.get('balance_changed_at'))
+        if changed_at is None:
+            return base_interval
+        days_unchanged = max(0.0, (now - changed_at).total_seconds() / 86400)
+        return base_interval * min(BalanceRefreshPolicy.MAX_FACTOR, 1 + int(days_unchanged))
+
+    @staticmethod
+    def retry_interval(account, now, base_interval):
+        """连续失败时的刷新间隔（秒）：在正常间隔上按失败次数翻倍"""
+        interval = BalanceRefreshPolicy.refresh_interval(account, now, base_interval)
+        failures = int(account.get('balance_failures') or 0)
+        if failures <= 0:
+            return interval
+        return interval * min(BalanceRefreshPolicy.MAX_BACKOFF_FACTOR, 2 ** failures)
+
+    @staticmethod
+    def select_due(accounts, now, base_interval, tick):
+        """
+        选出本轮需要刷新的账户
+
+        Args:
+            accounts: 启用的账户
+            now: 当前时间
+            base_interval: 基础刷新间隔（秒）
+            tick: 两轮之间的秒数
+
+        Returns:
+            list: 最久未刷新的到期账户，数量不超过本轮配额
+        """
+        due = []
+        for account in accounts:
+            # 从最后一次成功或最后一次尝试（取较晚者）算起
+            attempts = [
+                value for value in (
+                    _to_datetime(account.get('balance_updated_at')),
+                    _to_datetime(account.get('balance_checked_at'))
+                ) if value is not None
+            ]
+            if not attempts:
+                due.append((0.0, account))
+                continue
+            age = (now - max(attempts)).total_seconds()
+            if age >= BalanceRefreshPolicy.retry_interval(account, now, base_interval):
+                due.append((age, account))
+
+        # 配额为平均每轮应刷新数的两倍，积压时也能在一个间隔内追上
+        quota = max(1, math.ceil(len(accounts) * tick / base_interval)) * 2
+        due.sort(key=lambda item: (item[0] != 0.0, -item[0]))
+        return [account for _, account in due[:quota]]
+
+
+class BalanceRefreshEngine:
+    """
+    并行刷新余额
+
+    最多 max_workers 个账户同时请求（共享连接池），结果每 batch_size 条
+    批量写库；上游熔断时停止派发剩余账户
+    """
+
+    def __init__(self, max_workers=8, batch_size=50, keep_jobs=20):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.keep_jobs = keep_jobs
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def start(self, accounts, source='manual'):
+        """在后台线程中刷新，立即返回 job"""
+        job = self._create_job(source, len(accounts))
+        threading.Thread(target=self._run, args=(job, accounts), daemon=True).start()
+        return job
+
+    def run(self, accounts, source='periodic'):
+        """在当前线程中刷新，完成后返回 job"""
+        job = self._create_job(source, len(accounts))
+        self._run(job, accounts)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def latest(self, source=None):
+        with self.lock:
+            for job in reversed(self.jobs.values()):
+                if source is None or job.source == source:
+                    return job
+        return None
+
+    def list_jobs(self):
+        with self.lock:
+            return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def _create_job(self, source, total):
+        job = BalanceRefreshJob(source, total)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep_jobs:
+                self.jobs.popitem(last=False)
+        return job
+
+    def _fetch(self, job, account):
+        if job.status != 'running':
+            return None
+        with job.lock:
+            job.current.add(account['name'])
+        try:
+            session = session_registry.get(account)
+            return BalanceService.fetch_account_balance(db, session, account['id'], save=False)
+        finally:
+            with job.lock:
+                job.current.discard(account['name'])
+
+    def _run(self, job, accounts):
+        pending = []
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='balance') as pool:
+                futures = {pool.submit(self._fetch, job, account): account for account in accounts}
+
+                for future in as_completed(futures):
+                    account = futures[future]
+                    try:
+                        result = future.result()
+                    except CircuitOpenError as e:
+                        if job.status == 'running':
+                            logger.warning(f"Balance refresh {job.id} stopped: {e}")
+                            job.status = 'stopped'
+                            job.error = str(e)
+                        result = None
+                    except Exception as e:
+                        logger.error(f"Account {account['name']} balance refresh error: {e}")
+                        result = (False, str(e))
+
+                    if result is None:
+                        continue
+
+                    success, info = result
+                    with job.lock:
+                        job.completed += 1
+                        if success:
+                            job.success += 1
+                        else:
+                            job.failed += 1
+                    if success:
+                        pending.append((account['id'], info))
+                    else:
+                        failed.append(account['id'])
+                        logger.warning(f"Account {account['name']} balance refresh failed: {info}")
+
+                    if len(pending) >= self.batch_size:
+                        BalanceService.save_balance_infos(db, pending)
+                        pending = []
+
+            BalanceService.save_balance_infos(db, pending)
+            pending = []
+            BalanceService.record_balance_failures(db, failed)
+
+            if job.success:
+                account_cache.refresh_from_db(db)
+                data_cache.invalidate()
+
+            if job.status == 'running':
+                job.status = 'completed'
+            logger.info(
+                f"Balance refresh {job.id} ({job.source}) {job.status}: "
+                f"{job.success}/{job.total} success in {time.time() - job.started_at:.1f}s"
+            )
+
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+            logger.error(f"Balance refresh {job.id} error: {e}")
+        finally:
+            job.finished_at = time.time()
+
+
+# 全局余额刷新引擎
+balance_refresh = BalanceRefreshEngine(max_workers=BALANCE_REFRESH_WORKERS)
@@ -7,10 +7,17 @@ Handles fetching and parsing balance information from Leaflow
 
 import re
 import json
-import html
+import time
+import threading
 from datetime import datetime
+from urllib.parse import urlparse
 
 from config import logger
+from .circuit_breaker import CircuitOpenError, guarded_request
+from .deadline import request_timeout
+from .inertia_page import read_data_page, find_data_page, extract_auth_user
+from .single_flight import single_flight, FlightTimeout
+from .balance_snapshot_service import BalanceSnapshotService
 
 
 def convert_iso_datetime(iso_str):
@@ -31,24 +38,33 @@ class BalanceService:
     BALANCE_URL = "https://leaflow.net/balance/records"
 
     @staticmethod
-    def fetch_balance_info(session):
+    def fetch_balance_info(session, deadline=None):
         """
         从 balance/records 页面获取余额信息
 
         Args:
             session: 已认证的 requests.Session 对象
+            deadline: 可选的 Deadline，超时从剩余预算中截取
 
         Returns:
             tuple: (success: bool, data: dict | error_msg: str)
+
+        Raises:
+            CircuitOpenError: 上游熔断中，请求未发出
         """
         try:
-            response = session.get(BalanceService.BALANCE_URL, timeout=30)
+            response = guarded_request(
+                session, 'GET', BalanceService.BALANCE_URL, timeout=request_timeout(deadline), stream=True
+            )
 
             if response.status_code != 200:
+                response.close()
                 return False, f"HTTP {response.status_code}"
 
-            return BalanceService.parse_balance_data(response.text)
+            return BalanceService.parse_data_page(read_data_page(response))
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"Fetch balance error: {e}")
             return False, str(e)
@@ -69,29 +85,34 @@ class BalanceService:
             pattern = r'data-page="([^"]+)"'
             match = re.search(pattern, html_content)
 
-            if not match:
-                return False, "data-page attribute not found"
+            return BalanceService.parse_data_page(match.group(1) if match else None)
 
-            # HTML 实体解码
-            json_str = html.unescape(match.group(1))
-            data = json.loads(json_str)
+        except Exception as e:
+            logger.error(f"Parse balance data error: {e}")
+            return False, str(e)
+
+    @staticmethod
+    def parse_data_page(data_page):
+        """
+        从 data-page 属性值中解析余额信息（只解码 props.auth.user）
+
+        Args:
+            data_page: data-page 属性的原始值，None 表示页面中没有该属性
+
+        Returns:
+            tuple: (success: bool, data: dict | error_msg: str)
+        """
+        try:
+            if data_page is None:
+                return False, "data-page attribute not found"
 
             # 提取用户信息: props.auth.user
-            user = data.get('props', {}).get('auth', {}).get('user')
+            user = extract_auth_user(data_page)
 
             if not user:
                 return False, "User data not found in response"
 
-            balance_info = {
-                'leaflow_uid': user.get('id'),
-                'leaflow_name': user.get('name', ''),
-                'leaflow_email': user.get('email', ''),
-                'leaflow_created_at': convert_iso_datetime(user.get('created_at', '')),
-                'current_balance': user.get('current_balance', '0'),
-                'total_consumed': user.get('total_consumed', '0')
-            }
-
-            return True, balance_info
+            return True, BalanceService.balance_info_from_user(user)
 
         except json.JSONDecodeError as e:
             logger.error(f"JSON parse error: {e}")
@@ -101,7 +122,229 @@ class BalanceService:
             return False, str(e)
 
     @staticmethod
-    def refresh_account_balance(db, session, account_id, account_name):
+    def balance_info_from_user(user):
+        """props.auth.user 转为 accounts 表的余额字段"""
+        return {
+            'leaflow_uid': user.get('id'),
+            'leaflow_name': user.get('name', ''),
+            'leaflow_email': user.get('email', ''),
+            'leaflow_created_at': convert_iso_datetime(user.get('created_at', '')),
+            'current_balance': user.get('current_balance', '0'),
+            'total_consumed': user.get('total_consumed', '0')
+        }
+
+    # ========== 顺带获取余额 ==========
+
+    # account_id -> (seen_at, balance_info, written_at)
+    _observed = {}
+    _observed_lock = threading.Lock()
+    # 相同的余额数据在该间隔内不重复写库（秒）
+    OBSERVE_WRITE_INTERVAL = 60
+
+    @staticmethod
+    def _remember(account_id, balance_info, written):
+        now = time.time()
+        with BalanceService._observed_lock:
+            previous = BalanceService._observed.get(account_id)
+            written_at = now if written else (previous[2] if previous else 0)
+            BalanceService._observed[account_id] = (now, balance_info, written_at)
+
+    @staticmethod
+    def observe_user(account_id, user):
+        """
+        用其他请求页面中的 props.auth.user 更新账户余额
+
+        Args:
+            account_id: 账户 ID
+            user: props.auth.user
+        """
+        balance_info = BalanceService.balance_info_from_user(user)
+
+        with BalanceService._observed_lock:
+            previous = BalanceService._observed.get(account_id)
+        if previous and previous[1] == balance_info and time.time() - previous[2] < BalanceService.OBSERVE_WRITE_INTERVAL:
+            BalanceService._remember(account_id, balance_info, written=False)
+            return
+
+        from database import db
+        BalanceService.save_balance_info(db, account_id, balance_info)
+        BalanceService._remember(account_id, balance_info, written=True)
+        logger.debug(f"Account {account_id} balance updated from page: {balance_info['current_balance']}")
+
+    @staticmethod
+    def observer(account_id):
+        """
+        session 的 response hook：Leaflow 页面（HTML 或 Inertia JSON）中带有用户数据时顺带更新余额
+
+        流式读取的响应由调用方自行解析，这里跳过以免提前读完正文
+        """
+        def hook(response, *args, **kwargs):
+            try:
+                if kwargs.get('stream') or response.status_code != 200:
+                    return response
+                hostname = urlparse(response.url).hostname or ''
+                if not hostname.endswith('leaflow.net'):
+                    return response
+
+                user = None
+                if response.headers.get('x-inertia'):
+                    user = response.json().get('props', {}).get('auth', {}).get('user')
+                elif b'data-page="' in response.content:
+                    data_page = find_data_page(response.text)
+                    user = extract_auth_user(data_page) if data_page else None
+
+                if isinstance(user, dict) and 'current_balance' in user:
+                    BalanceService.observe_user(account_id, user)
+            except Exception as e:
+                logger.debug(f"Observe balance from {response.url} failed: {e}")
+            return response
+        return hook
+
+    @staticmethod
+    def seen_since(account_id, since):
+        """
+        since（time.time()）之后见过的余额数据
+
+        Returns:
+            dict | None
+        """
+        with BalanceService._observed_lock:
+            observed = BalanceService._observed.get(account_id)
+        if observed and observed[0] >= since:
+            return observed[1]
+        return None
+
+    # balance_changed_at 必须排在 current_balance 之前（MySQL 按顺序赋值，需要比较旧值）
+    SAVE_QUERY = '''
+        UPDATE accounts SET
+            balance_changed_at = CASE
+                WHEN current_balance IS NULL OR current_balance <> ? THEN ? ELSE balance_changed_at
+            END,
+            leaflow_uid = ?,
+            leaflow_name = ?,
+            leaflow_email = ?,
+            leaflow_created_at = ?,
+            current_balance = ?,
+            total_consumed = ?,
+            balance_updated_at = ?,
+            balance_checked_at = ?,
+            balance_failures = 0
+        WHERE id = ?
+    '''
+
+    FAILURE_QUERY = '''
+        UPDATE accounts SET
+            balance_checked_at = ?,
+            balance_failures = COALESCE(balance_failures, 0) + 1
+        WHERE id = ?
+    '''
+
+    @staticmethod
+    def _save_params(account_id, balance_info, updated_at):
+        return (
+            balance_info['current_balance'],
+            updated_at,
+            balance_info['leaflow_uid'],
+            balance_info['leaflow_name'],
+            balance_info['leaflow_email'],
+            balance_info['leaflow_created_at'],
+            balance_info['current_balance'],
+            balance_info['total_consumed'],
+            updated_at,
+            updated_at,
+            account_id
+        )
+
+    @staticmethod
+    def save_balance_info(db, account_id, balance_info):
+        """
+        将解析出的余额信息写入 accounts 表
+
+        Args:
+            db: 数据库实例
+            account_id: 账户 ID
+            balance_info: parse_balance_data 返回的数据
+        """
+        from config import TIMEZONE
+
+        now = datetime.now(TIMEZONE)
+        BalanceSnapshotService.record_changes(db, [(account_id, balance_info)], now)
+        db.execute(
+            BalanceService.SAVE_QUERY,
+            BalanceService._save_params(account_id, balance_info, now)
+        )
+
+    @staticmethod
+    def save_balance_infos(db, results):
+        """
+        批量写入余额信息
+
+        Args:
+            db: 数据库实例
+            results: [(account_id, balance_info), ...]
+        """
+        from config import TIMEZONE
+
+        now = datetime.now(TIMEZONE)
+        BalanceSnapshotService.record_changes(db, results, now)
+        db.executemany(
+            BalanceService.SAVE_QUERY,
+            [BalanceService._save_params(account_id, info, now) for account_id, info in results]
+        )
+
+    @staticmethod
+    def record_balance_failures(db, account_ids):
+        """
+        记录获取余额失败：更新最后尝试时间并累计连续失败次数（用于刷新退避）
+
+        Args:
+            db: 数据库实例
+            account_ids: 获取失败的账户 ID 列表
+        """
+        from config import TIMEZONE
+
+        if not account_ids:
+            return
+        now = datetime.now(TIMEZONE)
+        db.executemany(BalanceService.FAILURE_QUERY, [(now, account_id) for account_id in account_ids])
+
+    @staticmethod
+    def fetch_account_balance(db, session, account_id, deadline=None, save=True):
+        """
+        获取并保存账户余额，同一账户并发的刷新（save 相同时）共用一次上游请求
+
+        Args:
+            db: 数据库实例
+            session: 已认证的 requests.Session 对象
+            account_id: 账户 ID
+            deadline: 可选的 Deadline，加入进行中的刷新时最多等待剩余预算
+            save: 为 False 时只获取不写库（由调用方批量写入）
+
+        Returns:
+            tuple: (success: bool, data: dict | error_msg: str)
+
+        Raises:
+            CircuitOpenError: 上游熔断中，请求未发出
+        """
+        def fetch_and_save():
+            success, result = BalanceService.fetch_balance_info(session, deadline)
+            if success:
+                if save:
+                    BalanceService.save_balance_info(db, account_id, result)
+                BalanceService._remember(account_id, result, written=save)
+            return success, result
+
+        try:
+            # save 不同的调用不能共用：只获取的结果由调用方批量写库，加入写库的调用需要确定已写入
+            return single_flight.do(
+                ('balance', account_id, save), fetch_and_save,
+                timeout=deadline.remaining() if deadline else None
+            )
+        except FlightTimeout as e:
+            return False, str(e)
+
+    @staticmethod
+    def refresh_account_balance(db, session, account_id, account_name, deadline=None, seen_since=None):
         """
         刷新账户余额并更新数据库（公共方法）
 
@@ -110,43 +353,30 @@ class BalanceService:
             session: 已认证的 requests.Session 对象
             account_id: 账户 ID
             account_name: 账户名称（用于日志）
+            deadline: 可选的 Deadline
+            seen_since: 可选的 time.time()，此后的响应中已带有余额数据时不再请求
 
         Returns:
             tuple: (success: bool, message: str)
         """
-        from datetime import datetime
-        from config import TIMEZONE
-
         try:
-            success, result = BalanceService.fetch_balance_info(session)
+            if seen_since is not None:
+                observed = BalanceService.seen_since(account_id, seen_since)
+                if observed:
+                    logger.info(f"[{account_name}] Balance already seen in response: {observed['current_balance']}")
+                    return True, observed['current_balance']
+
+            success, result = BalanceService.fetch_account_balance(db, session, account_id, deadline)
 
             if success:
-                db.execute('''
-                    UPDATE accounts SET
-                        leaflow_uid = ?,
-                        leaflow_name = ?,
-                        leaflow_email = ?,
-                        leaflow_created_at = ?,
-                        current_balance = ?,
-                        total_consumed = ?,
-                        balance_updated_at = ?
-                    WHERE id = ?
-                ''', (
-                    result['leaflow_uid'],
-                    result['leaflow_name'],
-                    result['leaflow_email'],
-                    result['leaflow_created_at'],
-                    result['current_balance'],
-                    result['total_consumed'],
-                    datetime.now(TIMEZONE),
-                    account_id
-                ))
                 logger.info(f"[{account_name}] Balance refreshed: {result['current_balance']}")
                 return True, result['current_balance']
             else:
                 logger.warning(f"[{account_name}] Balance refresh failed: {result}")
                 return False, result
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
             logger.error(f"[{account_name}] Balance refresh error: {e}")
             return False, str(e)
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Balance snapshot service for Leaflow Auto Check-in Control Panel
+Append-only balance history written only when the value changes, with
+old points downsampled into hourly and then daily buckets
+"""
+
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation
+
+from config import logger, TIMEZONE
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(str(value))
+    except (InvalidOperation, ValueError, TypeError):
+        return None
+
+
+def _to_local(value):
+    """数据库中的时间转为本地时区的 naive datetime（快照表统一按本地时间存储）"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(TIMEZONE).replace(tzinfo=None)
+    return value
+
+
+def _local_now():
+    return datetime.now(TIMEZONE).replace(tzinfo=None)
+
+
+class BalanceSnapshotService:
+    """余额快照（只追加，余额变化时才写入）"""
+
+    # 原始点保留 48 小时后合并为小时桶，小时桶保留 30 天后合并为天桶
+    RAW_RETENTION = timedelta(hours=48)
+    HOURLY_RETENTION = timedelta(days=30)
+
+    _seeded = None
+    _seeded_lock = threading.Lock()
+
+    @staticmethod
+    def _seeded_accounts(db):
+        with BalanceSnapshotService._seeded_lock:
+            if BalanceSnapshotService._seeded is None:
+                rows = db.fetchall('SELECT DISTINCT account_id FROM balance_snapshots')
+                BalanceSnapshotService._seeded = {row['account_id'] for row in rows}
+            return BalanceSnapshotService._seeded
+
+    @staticmethod
+    def record_changes(db, results, captured_at=None):
+        """
+        写入余额有变化的账户的快照（在更新 accounts 之前调用，用于比较旧值）
+
+        账户还没有任何快照时，先把旧值（balance_updated_at 时刻）作为基线写入
+
+        Args:
+            db: 数据库实例
+            results: [(account_id, balance_info), ...]
+            captured_at: 快照时间，默认当前时间
+        """
+        if not results:
+            return
+
+        try:
+            captured_at = _to_local(captured_at) if captured_at else _local_now()
+            ids = [account_id for account_id, _ in results]
+            placeholders = ','.join('?' for _ in ids)
+            previous = {
+                row['id']: row for row in db.fetchall(
+                    f'SELECT id, current_balance, total_consumed, balance_updated_at FROM accounts WHERE id IN ({placeholders})',
+                    tuple(ids)
+                )
+            }
+            seeded = BalanceSnapshotService._seeded_accounts(db)
+
+            rows = []
+            for account_id, info in results:
+                balance = _to_decimal(info.get('current_balance'))
+                if balance is None:
+                    continue
+                consumed = _to_decimal(info.get('total_consumed')) or Decimal(0)
+
+                old = previous.get(account_id) or {}
+                old_balance = _to_decimal(old.get('current_balance'))
+                old_consumed = _to_decimal(old.get('total_consumed')) or Decimal(0)
+                changed = old_balance != balance or old_consumed != consumed
+
+                if account_id not in seeded:
+                    if changed and old_balance is not None and old.get('balance_updated_at'):
+                        rows.append((account_id, 'raw', _to_local(old['balance_updated_at']), old_balance, old_consumed))
+                    rows.append((account_id, 'raw', captured_at, balance, consumed))
+                elif changed:
+                    rows.append((account_id, 'raw', captured_at, balance, consumed))
+
+            if rows:
+                db.executemany('''
+                    INSERT INTO balance_snapshots (account_id, resolution, bucket_at, balance, total_consumed)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(a, r, t, str(b), str(c)) for a, r, t, b, c in rows])
+                with BalanceSnapshotService._seeded_lock:
+                    seeded.update(row[0] for row in rows)
+        except Exception as e:
+            # 快照失败不影响余额更新
+            logger.error(f"Record balance snapshots error: {e}")
+
+    @staticmethod
+    def _merge(db, source, target, cutoff, bucket_start):
+        """把 cutoff 之前的 source 点合并为 target 桶（每桶保留最后一个值）"""
+        points = db.fetchall('''
+            SELECT account_id, bucket_at, balance, total_consumed FROM balance_snapshots
+            WHERE resolution = ? AND bucket_at < ?
+            ORDER BY account_id, bucket_at, id
+        ''', (source, cutoff))
+        if not points:
+            return 0
+
+        buckets = {}
+        for point in points:
+            key = (point['account_id'], bucket_start(_to_local(point['bucket_at'])))
+            buckets[key] = (point['balance'], point['total_consumed'])
+
+        db.executemany('''
+            INSERT INTO balance_snapshots (account_id, resolution, bucket_at, balance, total_consumed)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(account_id, target, at, str(balance), str(consumed))
+              for (account_id, at), (balance, consumed) in buckets.items()])
+        db.execute('DELETE FROM balance_snapshots WHERE resolution = ? AND bucket_at < ?', (source, cutoff))
+        return len(points)
+
+    @staticmethod
+    def downsample(db, now=None):
+        """
+        降采样：48 小时前的原始点合并为小时桶，30 天前的小时桶合并为天桶
+
+        截止时间对齐到整点/零点，同一个桶只会在一次合并中生成
+        """
+        now = _to_local(now) if now else _local_now()
+        hour_cutoff = (now - BalanceSnapshotService.RAW_RETENTION).replace(minute=0, second=0, microsecond=0)
+        day_cutoff = (now - BalanceSnapshotService.HOURLY_RETENTION).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        merged_raw = BalanceSnapshotService._merge(
+            db, 'raw', 'hour', hour_cutoff,
+            lambda at: at.replace(minute=0, second=0, microsecond=0)
+        )
+        merged_hourly = BalanceSnapshotService._merge(
+            db, 'hour', 'day', day_cutoff,
+            lambda at: at.replace(hour=0, minute=0, second=0, microsecond=0)
+        )
+        if merged_raw or merged_hourly:
+            logger.info(f"Balance snapshots downsampled: {merged_raw} raw -> hourly, {merged_hourly} hourly -> daily")
+
+    @staticmethod
+    def get_points(db, account_id, start, end):
+        """账户在 [start, end) 内的快照点（各精度混合，按时间排序）"""
+        rows = db.fetchall('''
+            SELECT resolution, bucket_at, balance, total_consumed FROM balance_snapshots
+            WHERE account_id = ? AND bucket_at >= ? AND bucket_at < ?
+            ORDER BY bucket_at, id
+        ''', (account_id, _to_local(start), _to_local(end)))
+        return [{
+            'at': _to_local(row['bucket_at']).isoformat(),
+            'resolution': row['resolution'],
+            'balance': float(row['balance']),
+            'total_consumed': float(row['total_consumed']),
+        } for row in rows]
+
+    @staticmethod
+    def daily_earnings(db, start, end, account_id=None):
+        """
+        [start, end) 内每天的收入（相邻快照之间余额增加量之和）
+
+        以 start 之前的最后一个快照为基线；降采样后的桶只保留最后的值，
+        桶内先增后减的部分会被抵消
+
+        Returns:
+            dict: {date: Decimal}
+        """
+        start, end = _to_local(start), _to_local(end)
+        account_filter = 'AND account_id = ?' if account_id else ''
+        account_params = (account_id,) if account_id else ()
+
+        baseline_rows = db.fetchall(f'''
+            SELECT s.account_id, s.balance FROM balance_snapshots s
+            JOIN (
+                SELECT account_id, MAX(bucket_at) AS last_at FROM balance_snapshots
+                WHERE bucket_at < ? {account_filter}
+                GROUP BY account_id
+            ) b ON s.account_id = b.account_id AND s.bucket_at = b.last_at
+        ''', (start,) + account_params)
+        last = {row['account_id']: Decimal(str(row['balance'])) for row in baseline_rows}
+
+        points = db.fetchall(f'''
+            SELECT account_id, bucket_at, balance FROM balance_snapshots
+            WHERE bucket_at >= ? AND bucket_at < ? {account_filter}
+            ORDER BY account_id, bucket_at, id
+        ''', (start, end) + account_params)
+
+        earnings = {}
+        for point in points:
+            balance = Decimal(str(point['balance']))
+            previous = last.get(point['account_id'])
+            if previous is not None and balance > previous:
+                day = _to_local(point['bucket_at']).date()
+                earnings[day] = earnings.get(day, Decimal(0)) + (balance - previous)
+            last[point['account_id']] = balance
+        return earnings
+
+    @staticmethod
+    def today_earnings(db):
+        """今日所有账户的收入合计"""
+        start = _local_now().replace(hour=0, minute=0, second=0, microsecond=0)
+        earnings = BalanceSnapshotService.daily_earnings(db, start, start + timedelta(days=1))
+        return sum(earnings.values(), Decimal(0))
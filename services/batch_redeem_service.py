@@ -4,37 +4,89 @@
 Batch redeem scheduler service for Leaflow Auto Check-in Control Panel
 """
 
+import os
 import json
+import math
 import time
+import uuid
+import socket
+import heapq
+import itertools
 import threading
 import traceback
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 
-from config import logger, TIMEZONE
+from config import logger, TIMEZONE, BATCH_REDEEM_WORKERS
 from database import db, data_cache
 from .redeem_service import RedeemService
-from .checkin_service import LeafLowCheckin
+from .session_registry import session_registry
+from .redeem_code_registry import redeem_code_registry
+
+
+def _to_timestamp(value):
+    """数据库中的时间（MySQL 为 datetime，SQLite 为字符串）转为时间戳"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = TIMEZONE.localize(value)
+    return value.timestamp()
+
+
+def _format_time(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return str(value).split('.')[0]
 
 
 class BatchRedeemScheduler:
-    """批量兑换调度器"""
+    """
+    批量兑换调度器
+
+    每个任务有一个或多个参与账户（batch_redeem_accounts），每个账户按自己的
+    间隔领取下一个待兑换的码；单账户任务即只有一个参与账户的码池。
+
+    到期时间按 (任务, 账户) 保存在内存定时堆中（启动时从 next_execute_at 加载，
+    创建、暂停、恢复、取消时同步更新），到期的步骤交给有界线程池执行。
+
+    多个进程共用一个数据库时，执行前先用条件更新领取 (任务, 账户) 的租约
+    （owner, lease_until），同一账户同一时间只有一个进程在兑换；任务状态以
+    数据库为准，每 SYNC_INTERVAL 秒从数据库同步其他进程创建或恢复的任务，
+    并回收租约过期（进程退出）的兑换码
+    """
 
     SUCCESS_INTERVAL = 70 * 60  # 成功间隔 70 分钟
     FAIL_INTERVAL = 60          # 失败间隔 1 分钟
-    CHECK_INTERVAL = 120         # 轮询间隔 120 秒
+    MAX_WORKERS = BATCH_REDEEM_WORKERS  # 同时执行的兑换步骤数（所有任务共享）
+    LEASE_SECONDS = 300         # 单次兑换步骤的租约时长
+    SYNC_INTERVAL = 60          # 与数据库同步的间隔
 
     def __init__(self):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
         self.running = False
         self.scheduler_thread = None
-        self.paused_tasks = set()  # 暂停的任务 ID 集合
-        self.cancelled_tasks = set()  # 取消的任务 ID 集合
-        self.leaflow_checkin = LeafLowCheckin()
+        self.executor = None
         self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        # 定时堆: (due_timestamp, seq, (task_id, account_id))；_due 记录每个槽位当前有效的到期时间，堆中过期条目惰性丢弃
+        self._timers = []
+        self._timer_seq = itertools.count()
+        self._due = {}
+        self._in_flight = set()
+        self._last_sync = 0
 
     def start(self):
         """启动调度器"""
         if not self.running:
             self.running = True
+            self.executor = ThreadPoolExecutor(max_workers=self.MAX_WORKERS, thread_name_prefix='batch-redeem')
             self.restore_tasks()
             self.scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
             self.scheduler_thread.start()
@@ -43,116 +95,328 @@ class BatchRedeemScheduler:
     def stop(self):
         """停止调度器"""
         self.running = False
+        self._wakeup.set()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+        if self.executor:
+            self.executor.shutdown(wait=False)
         logger.info("Batch redeem scheduler stopped")
 
     def restore_tasks(self):
-        """应用启动时恢复未完成任务"""
+        """应用启动时恢复未完成任务，并把各账户的到期时间载入定时堆"""
+        self._migrate_legacy_tasks()
         try:
-            tasks = db.fetchall('''
-                SELECT * FROM batch_redeem_tasks
-                WHERE status IN ('pending', 'running')
-            ''')
-
-            if not tasks:
-                return
-
-            for task in tasks:
-                task_id = task['id']
-                # pending 任务改为 running 并立即开始
-                if task['status'] == 'pending':
-                    now = datetime.now(TIMEZONE)
-                    db.execute('''
-                        UPDATE batch_redeem_tasks
-                        SET status = 'running', next_execute_at = ?, updated_at = ?
-                        WHERE id = ?
-                    ''', (now, now, task_id))
-                    logger.info(f"Restored pending batch task {task_id} -> running")
-                else:
-                    logger.info(f"Restored running batch task {task_id}, next_execute_at: {task.get('next_execute_at')}")
+            # pending 任务改为 running 并立即开始
+            now = datetime.now(TIMEZONE)
+            for task in db.fetchall("SELECT id FROM batch_redeem_tasks WHERE status = 'pending'"):
+                db.execute('''
+                    UPDATE batch_redeem_tasks
+                    SET status = 'running', next_execute_at = ?, updated_at = ?
+                    WHERE id = ?
+                ''', (now, now, task['id']))
+                db.execute('UPDATE batch_redeem_accounts SET next_execute_at = ? WHERE task_id = ?', (now, task['id']))
+                logger.info(f"Restored pending batch task {task['id']} -> running")
+
+            restored = self._sync_slots()
+            if restored:
+                logger.info(f"Restored {restored} batch redeem slots")
 
         except Exception as e:
             logger.error(f"Restore batch tasks error: {e}")
             logger.error(traceback.format_exc())
 
+    def _sync_slots(self):
+        """
+        与数据库同步：回收租约过期的兑换码，并按数据库中的 next_execute_at
+        （被其他进程持有时为租约到期时间）更新本进程的定时堆
+
+        Returns:
+            int: 运行中的槽位数
+        """
+        self._last_sync = time.time()
+        now = datetime.now(TIMEZONE)
+
+        # 持有租约的进程已退出：正在执行的兑换码重新排队
+        db.execute('''
+            UPDATE batch_redeem_items SET status = 'pending', account_id = NULL
+            WHERE status = 'executing' AND NOT EXISTS (
+                SELECT 1 FROM batch_redeem_accounts a
+                WHERE a.task_id = batch_redeem_items.task_id
+                AND a.account_id = batch_redeem_items.account_id
+                AND a.lease_until >= ?
+            )
+        ''', (now,))
+
+        slots = db.fetchall('''
+            SELECT a.task_id, a.account_id, a.next_execute_at, a.lease_until
+            FROM batch_redeem_accounts a
+            JOIN batch_redeem_tasks t ON t.id = a.task_id
+            WHERE t.status = 'running'
+        ''')
+        for slot in slots:
+            key = (slot['task_id'], slot['account_id'])
+            due = max(
+                _to_timestamp(slot['next_execute_at']) or 0,
+                _to_timestamp(slot['lease_until']) or 0
+            ) or time.time()
+            with self._lock:
+                if key in self._in_flight or self._due.get(key) == due:
+                    continue
+            self._schedule(key, due)
+        return len(slots)
+
+    def _migrate_legacy_tasks(self):
+        """
+        迁移旧任务：codes 字段中的 JSON 列表拆成 batch_redeem_items（迁移后 codes 置空），
+        没有参与账户记录的任务补上自身账户
+        """
+        try:
+            tasks = db.fetchall("SELECT * FROM batch_redeem_tasks WHERE codes != ''")
+        except Exception as e:
+            logger.error(f"Load legacy batch tasks error: {e}")
+            return
+
+        for task in tasks:
+            try:
+                codes = json.loads(task['codes'])
+                history = {}
+                executed = codes[:task['current_index']]
+                if executed:
+                    placeholders = ','.join('?' for _ in executed)
+                    for record in db.fetchall(f'''
+                        SELECT code, success, message, amount, created_at FROM redeem_history
+                        WHERE account_id = ? AND code IN ({placeholders})
+                        ORDER BY created_at DESC
+                    ''', (task['account_id'], *executed)):
+                        history.setdefault(record['code'], record)
+
+                rows = []
+                for i, code in enumerate(codes):
+                    record = history.get(code) if i < task['current_index'] else None
+                    if record:
+                        status = 'success' if record['success'] else 'failed'
+                        rows.append((task['id'], i, code, status, record['message'], record.get('amount') or '', record['created_at']))
+                    elif i < task['current_index']:
+                        rows.append((task['id'], i, code, 'unknown', '记录丢失', '', None))
+                    else:
+                        rows.append((task['id'], i, code, 'pending', None, '', None))
+
+                db.execute('DELETE FROM batch_redeem_items WHERE task_id = ?', (task['id'],))
+                self._insert_items(rows)
+                db.execute("UPDATE batch_redeem_tasks SET codes = '' WHERE id = ?", (task['id'],))
+                logger.info(f"Migrated batch task {task['id']} codes to batch_redeem_items ({len(rows)} items)")
+            except Exception as e:
+                logger.error(f"Migrate batch task {task['id']} error: {e}")
+
+        try:
+            db.execute('''
+                INSERT INTO batch_redeem_accounts (task_id, account_id, next_execute_at, success_count, fail_count)
+                SELECT t.id, t.account_id, t.next_execute_at, t.success_count, t.fail_count
+                FROM batch_redeem_tasks t
+                WHERE NOT EXISTS (SELECT 1 FROM batch_redeem_accounts a WHERE a.task_id = t.id)
+            ''')
+        except Exception as e:
+            logger.error(f"Migrate batch task accounts error: {e}")
+
+    @staticmethod
+    def _insert_items(rows):
+        """rows: [(task_id, item_index, code, status, message, amount, executed_at), ...]"""
+        if rows:
+            db.executemany('''
+                INSERT INTO batch_redeem_items (task_id, item_index, code, status, message, amount, executed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+
+    def _schedule(self, key, due):
+        """设置 (task_id, account_id) 槽位的下次执行时间（覆盖之前的）"""
+        with self._lock:
+            self._due[key] = due
+            heapq.heappush(self._timers, (due, next(self._timer_seq), key))
+        self._wakeup.set()
+
+    def _unschedule(self, task_id):
+        """移除任务所有账户的定时"""
+        with self._lock:
+            for key in [key for key in self._due if key[0] == task_id]:
+                del self._due[key]
+
+    def _pop_due(self):
+        """
+        取出已到期的槽位
+
+        Returns:
+            tuple: (到期的 (task_id, account_id) 列表, 距下一个到期的秒数或 None)
+        """
+        now = time.time()
+        due_slots = []
+        with self._lock:
+            while self._timers:
+                due, _, key = self._timers[0]
+                if self._due.get(key) != due:
+                    heapq.heappop(self._timers)
+                    continue
+                if due > now:
+                    return due_slots, due - now
+                heapq.heappop(self._timers)
+                if key in self._in_flight:
+                    # 执行中被重新排定：保留在 _due 中，执行结束后再入堆
+                    continue
+                del self._due[key]
+                self._in_flight.add(key)
+                due_slots.append(key)
+        return due_slots, None
+
     def _scheduler_loop(self):
-        """主调度循环"""
+        """主调度循环：睡到最近的到期时间、下一次同步，或被新的调度唤醒"""
         while self.running:
             try:
-                self._process_tasks()
+                if time.time() - self._last_sync >= self.SYNC_INTERVAL:
+                    self._sync_slots()
+                due_slots, delay = self._pop_due()
+                for task_id, account_id in due_slots:
+                    self.executor.submit(self._run_slot, task_id, account_id)
+                until_sync = max(0, self._last_sync + self.SYNC_INTERVAL - time.time())
+                delay = until_sync if delay is None else min(delay, until_sync)
             except Exception as e:
                 logger.error(f"Batch redeem scheduler error: {e}")
                 logger.error(traceback.format_exc())
+                delay = 5
 
-            time.sleep(self.CHECK_INTERVAL)
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
 
-    def _process_tasks(self):
-        """处理所有待执行的任务"""
-        now = datetime.now(TIMEZONE)
+    def _acquire_slot(self, task_id, account_id):
+        """
+        领取 (任务, 账户) 的租约：任务运行中、已到期且没有其他进程持有未过期的租约
 
-        # 查询需要执行的任务
-        tasks = db.fetchall('''
-            SELECT * FROM batch_redeem_tasks
-            WHERE status = 'running'
+        Returns:
+            bool: 是否领取成功
+        """
+        now = datetime.now(TIMEZONE)
+        cursor = db.execute('''
+            UPDATE batch_redeem_accounts SET owner = ?, lease_until = ?
+            WHERE task_id = ? AND account_id = ?
             AND (next_execute_at IS NULL OR next_execute_at <= ?)
-        ''', (now,))
-
-        if not tasks:
+            AND (lease_until IS NULL OR lease_until < ? OR owner = ?)
+            AND EXISTS (SELECT 1 FROM batch_redeem_tasks t WHERE t.id = ? AND t.status = 'running')
+        ''', (
+            self.owner, now + timedelta(seconds=self.LEASE_SECONDS), task_id, account_id,
+            now + timedelta(seconds=1), now, self.owner, task_id
+        ))
+        return cursor is not None and cursor.rowcount == 1
+
+    def _release_slot(self, task_id, account_id):
+        db.execute('''
+            UPDATE batch_redeem_accounts SET owner = NULL, lease_until = NULL
+            WHERE task_id = ? AND account_id = ? AND owner = ?
+        ''', (task_id, account_id, self.owner))
+
+    def _reschedule_from_db(self, task_id, account_id):
+        """领取失败（其他进程已执行或正持有租约）时，按数据库中的时间重新排定"""
+        slot = db.fetchone('''
+            SELECT a.next_execute_at, a.lease_until, t.status
+            FROM batch_redeem_accounts a
+            JOIN batch_redeem_tasks t ON t.id = a.task_id
+            WHERE a.task_id = ? AND a.account_id = ?
+        ''', (task_id, account_id))
+        if not slot or slot['status'] != 'running':
             return
+        due = max(_to_timestamp(slot['next_execute_at']) or 0, _to_timestamp(slot['lease_until']) or 0)
+        self._schedule((task_id, account_id), max(due, time.time() + 1))
 
-        for task in tasks:
-            task_id = task['id']
-
-            # 检查是否被暂停或取消
-            with self._lock:
-                if task_id in self.paused_tasks:
-                    continue
-                if task_id in self.cancelled_tasks:
-                    self.cancelled_tasks.discard(task_id)
-                    continue
+    def _run_slot(self, task_id, account_id):
+        """用一个账户执行任务的一个步骤（读取最新状态，暂停或取消的任务不执行）"""
+        acquired = False
+        try:
+            acquired = self._acquire_slot(task_id, account_id)
+            if not acquired:
+                self._reschedule_from_db(task_id, account_id)
+                return
 
-            # 检查是否已完成
-            current_index = task['current_index']
-            total_count = task['total_count']
+            task = db.fetchone('SELECT * FROM batch_redeem_tasks WHERE id = ?', (task_id,))
+            if not task or task['status'] != 'running':
+                return
 
-            if current_index >= total_count:
+            if task['current_index'] >= task['total_count']:
                 self._complete_task(task_id)
-                continue
-
-            # 执行单次兑换
-            threading.Thread(
-                target=self._execute_single_redeem,
-                args=(task,),
-                daemon=True
-            ).start()
+                return
 
-    def _execute_single_redeem(self, task):
-        """执行单次兑换"""
+            self._execute_single_redeem(task, account_id)
+        except Exception as e:
+            logger.error(f"Batch task {task_id} (account {account_id}) run error: {e}")
+            logger.error(traceback.format_exc())
+        finally:
+            if acquired:
+                try:
+                    self._release_slot(task_id, account_id)
+                except Exception as e:
+                    logger.error(f"Release batch slot ({task_id}, {account_id}) error: {e}")
+            self._finish_slot((task_id, account_id))
+
+    def _finish_slot(self, key):
+        """槽位执行结束：执行期间有新的定时则重新入堆并唤醒调度循环"""
+        with self._lock:
+            self._in_flight.discard(key)
+            due = self._due.get(key)
+            if due is not None:
+                heapq.heappush(self._timers, (due, next(self._timer_seq), key))
+        if due is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def _claim_item(task_id, account_id):
+        """领取任务中序号最小的待兑换码（条件更新，并行的账户不会领到同一个）"""
+        while True:
+            item = db.fetchone('''
+                SELECT id, item_index, code FROM batch_redeem_items
+                WHERE task_id = ? AND status = 'pending'
+                ORDER BY item_index LIMIT 1
+            ''', (task_id,))
+            if not item:
+                return None
+
+            cursor = db.execute('''
+                UPDATE batch_redeem_items SET status = 'executing', account_id = ?
+                WHERE id = ? AND status = 'pending'
+            ''', (account_id, item['id']))
+            if cursor is not None and cursor.rowcount == 1:
+                return item
+
+    def _execute_single_redeem(self, task, account_id):
+        """用指定账户执行单次兑换"""
         task_id = task['id']
-        account_id = task['account_id']
-        current_index = task['current_index']
 
+        # 获取账户信息
+        account = db.fetchone('SELECT * FROM accounts WHERE id = ?', (account_id,))
+        if not account:
+            logger.error(f"Batch task {task_id}: account {account_id} not found")
+            self._drop_account(task_id, account_id, "账户不存在")
+            return
+
+        item = None
         try:
-            # 解析兑换码列表
-            codes = json.loads(task['codes'])
-            if current_index >= len(codes):
-                self._complete_task(task_id)
+            item = self._claim_item(task_id, account_id)
+            if not item:
+                # 剩余的码都已被其他账户领取，由最后完成的账户结束任务
                 return
 
-            code = codes[current_index]
-            logger.info(f"Batch task {task_id}: executing redeem {current_index + 1}/{len(codes)}, code: {code}")
+            code = item['code']
 
-            # 获取账户信息
-            account = db.fetchone('SELECT * FROM accounts WHERE id = ?', (account_id,))
-            if not account:
-                logger.error(f"Batch task {task_id}: account {account_id} not found")
-                self._fail_task(task_id, "账户不存在")
+            # 排队期间已被确认不可用的码直接跳过，不占用兑换间隔
+            known = redeem_code_registry.find_known(db, [account_id], [code])
+            if code in known:
+                logger.info(f"Batch task {task_id}: code {code} skipped: {known[code]}")
+                self._save_item_result(item['id'], False, f"已跳过: {known[code]}", '')
+                self._update_task_progress(task_id, account_id, False, interval=0)
                 return
 
-            # 创建 session
-            token_data = json.loads(account['token_data'])
-            session = self.leaflow_checkin.create_session(token_data)
+            logger.info(
+                f"Batch task {task_id}: account {account['name']} executing redeem "
+                f"{item['item_index'] + 1}/{task['total_count']}, code: {code}"
+            )
+
+            # 复用账户的 session
+            session = session_registry.get(account)
 
             # 执行兑换
             success, message = RedeemService.redeem_code(session, code)
@@ -160,14 +424,17 @@ class BatchRedeemScheduler:
 
             # 记录兑换历史
             db.execute('''
-                INSERT INTO redeem_history (account_id, code, success, message, amount)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (account_id, code, success, message, amount))
+                INSERT INTO redeem_history (account_id, code, success, message, amount, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (account_id, code, success, message, amount, datetime.now(TIMEZONE).replace(tzinfo=None)))
+            redeem_code_registry.remember(db, account_id, code, success, message)
+
+            self._save_item_result(item['id'], success, message, amount)
 
             logger.info(f"Batch task {task_id}: code {code} -> {'success' if success else 'failed'}: {message}")
 
             # 更新任务进度
-            self._update_task_progress(task_id, success, current_index + 1, len(codes))
+            self._update_task_progress(task_id, account_id, success)
 
             # 刷新缓存
             data_cache.invalidate()
@@ -176,52 +443,70 @@ class BatchRedeemScheduler:
             logger.error(f"Batch task {task_id} execute error: {e}")
             logger.error(traceback.format_exc())
             # 出错按失败处理
-            self._update_task_progress(task_id, False, task['current_index'] + 1, task['total_count'])
+            if item:
+                self._save_item_result(item['id'], False, str(e), '')
+                self._update_task_progress(task_id, account_id, False)
+
+    @staticmethod
+    def _save_item_result(item_id, success, message, amount):
+        db.execute('''
+            UPDATE batch_redeem_items SET status = ?, message = ?, amount = ?, executed_at = ?
+            WHERE id = ?
+        ''', ('success' if success else 'failed', message, amount, datetime.now(TIMEZONE), item_id))
 
-    def _update_task_progress(self, task_id, success, new_index, total_count):
-        """更新任务进度"""
+    def _update_task_progress(self, task_id, account_id, success, interval=None):
+        """更新任务和账户的进度，并安排该账户的下一次兑换（interval 默认按成功/失败选择）"""
         now = datetime.now(TIMEZONE)
 
-        # 计算下次执行时间
-        if new_index >= total_count:
-            # 已完成所有兑换
-            next_execute_at = None
-            status = 'completed'
-            completed_at = now
-        else:
-            # 根据成功/失败设置不同间隔
+        # 根据成功/失败设置不同间隔
+        if interval is None:
             interval = self.SUCCESS_INTERVAL if success else self.FAIL_INTERVAL
-            next_execute_at = now + timedelta(seconds=interval)
-            status = 'running'
-            completed_at = None
+        next_execute_at = now + timedelta(seconds=interval)
+        counter = 'success_count' if success else 'fail_count'
 
-        # 更新数据库
-        if success:
-            db.execute('''
-                UPDATE batch_redeem_tasks
-                SET current_index = ?, success_count = success_count + 1,
-                    next_execute_at = ?, status = ?, updated_at = ?, completed_at = ?
-                WHERE id = ?
-            ''', (new_index, next_execute_at, status, now, completed_at, task_id))
-        else:
-            db.execute('''
-                UPDATE batch_redeem_tasks
-                SET current_index = ?, fail_count = fail_count + 1,
-                    next_execute_at = ?, status = ?, updated_at = ?, completed_at = ?
-                WHERE id = ?
-            ''', (new_index, next_execute_at, status, now, completed_at, task_id))
+        db.execute(f'''
+            UPDATE batch_redeem_accounts
+            SET next_execute_at = ?, {counter} = {counter} + 1
+            WHERE task_id = ? AND account_id = ?
+        ''', (next_execute_at, task_id, account_id))
+
+        # 任务的 next_execute_at 为最早到期的账户
+        db.execute(f'''
+            UPDATE batch_redeem_tasks
+            SET current_index = current_index + 1, {counter} = {counter} + 1,
+                next_execute_at = (SELECT MIN(next_execute_at) FROM batch_redeem_accounts WHERE task_id = ?),
+                updated_at = ?
+            WHERE id = ?
+        ''', (task_id, now, task_id))
 
-        if status == 'completed':
-            logger.info(f"Batch task {task_id} completed")
+        task = db.fetchone('SELECT status, current_index, total_count FROM batch_redeem_tasks WHERE id = ?', (task_id,))
+        if not task:
+            return
+
+        if task['current_index'] >= task['total_count']:
+            self._complete_task(task_id)
+        elif task['status'] == 'running':
+            # 执行期间被暂停或取消的任务保持原状态，不再排入定时堆
+            self._schedule((task_id, account_id), next_execute_at.timestamp())
+
+    def _drop_account(self, task_id, account_id, reason):
+        """移除无法继续兑换的账户，没有账户时任务失败"""
+        db.execute('DELETE FROM batch_redeem_accounts WHERE task_id = ? AND account_id = ?', (task_id, account_id))
+        remaining = db.fetchone('SELECT COUNT(*) AS total FROM batch_redeem_accounts WHERE task_id = ?', (task_id,))
+        if not remaining or not remaining['total']:
+            self._fail_task(task_id, reason)
+        else:
+            logger.warning(f"Batch task {task_id}: account {account_id} removed: {reason}")
 
     def _complete_task(self, task_id):
         """标记任务完成"""
         now = datetime.now(TIMEZONE)
         db.execute('''
             UPDATE batch_redeem_tasks
-            SET status = 'completed', completed_at = ?, updated_at = ?
-            WHERE id = ?
+            SET status = 'completed', next_execute_at = NULL, completed_at = ?, updated_at = ?
+            WHERE id = ? AND status IN ('running', 'paused')
         ''', (now, now, task_id))
+        self._unschedule(task_id)
         logger.info(f"Batch task {task_id} marked as completed")
 
     def _fail_task(self, task_id, reason):
@@ -232,43 +517,68 @@ class BatchRedeemScheduler:
             SET status = 'cancelled', completed_at = ?, updated_at = ?
             WHERE id = ?
         ''', (now, now, task_id))
+        self._unschedule(task_id)
         logger.error(f"Batch task {task_id} failed: {reason}")
 
     # ============ 公开 API 方法 ============
 
-    def create_task(self, account_id, codes):
+    def create_task(self, account_id, codes, pool_account_ids=None):
         """
         创建批量兑换任务
 
         Args:
-            account_id: 账户 ID
+            account_id: 账户 ID（任务所属账户）
             codes: 兑换码列表
+            pool_account_ids: 共同消耗这批兑换码的其他账户 ID（码池模式，可选）
 
         Returns:
             dict: {'success': bool, 'task_id': int, 'message': str}
         """
         try:
-            # 检查是否有未完成的任务
-            existing = db.fetchone('''
-                SELECT id FROM batch_redeem_tasks
-                WHERE account_id = ? AND status IN ('pending', 'running', 'paused')
-            ''', (account_id,))
+            account_ids = list(dict.fromkeys([account_id] + list(pool_account_ids or [])))
+            mode = 'pool' if len(account_ids) > 1 else 'single'
+
+            # 检查参与的账户是否已有未完成的任务
+            placeholders = ','.join('?' for _ in account_ids)
+            existing = db.fetchone(f'''
+                SELECT t.id FROM batch_redeem_tasks t
+                LEFT JOIN batch_redeem_accounts a ON a.task_id = t.id
+                WHERE (t.account_id IN ({placeholders}) OR a.account_id IN ({placeholders}))
+                AND t.status IN ('pending', 'running', 'paused')
+                LIMIT 1
+            ''', (*account_ids, *account_ids))
 
             if existing:
                 return {
                     'success': False,
-                    'message': '该账户已有进行中的批量兑换任务',
+                    'message': '该账户已有进行中的批量兑换任务' if mode == 'single' else '所选账户中有账户已有进行中的批量兑换任务',
                     'existing_task_id': existing['id']
                 }
 
+            # 去掉已兑换、已确认无效或已在其他任务中排队的码
+            known = redeem_code_registry.find_known(db, account_ids, codes)
+            queued = redeem_code_registry.find_queued(db, [code for code in codes if code not in known])
+            skipped = [
+                {'code': code, 'reason': known.get(code) or '已在其他批量任务中排队'}
+                for code in codes if code in known or code in queued
+            ]
+            codes = [code for code in codes if code not in known and code not in queued]
+
+            if not codes:
+                return {
+                    'success': False,
+                    'message': '所有兑换码均已兑换、无效或已在排队',
+                    'skipped': skipped
+                }
+
             now = datetime.now(TIMEZONE)
-            codes_json = json.dumps(codes, ensure_ascii=False)
 
+            # 兑换码逐条写入 batch_redeem_items，codes 字段仅保留给旧任务
             db.execute('''
                 INSERT INTO batch_redeem_tasks
-                (account_id, status, codes, total_count, next_execute_at, created_at, updated_at)
-                VALUES (?, 'running', ?, ?, ?, ?, ?)
-            ''', (account_id, codes_json, len(codes), now, now, now))
+                (account_id, status, mode, codes, total_count, next_execute_at, created_at, updated_at)
+                VALUES (?, 'running', ?, '', ?, ?, ?, ?)
+            ''', (account_id, mode, len(codes), now, now, now))
 
             # 获取新创建的任务 ID
             task = db.fetchone('''
@@ -278,13 +588,28 @@ class BatchRedeemScheduler:
             ''', (account_id,))
 
             task_id = task['id'] if task else None
-
-            logger.info(f"Created batch redeem task {task_id} for account {account_id} with {len(codes)} codes")
+            if task_id:
+                self._insert_items([(task_id, i, code, 'pending', None, '', None) for i, code in enumerate(codes)])
+                db.executemany('''
+                    INSERT INTO batch_redeem_accounts (task_id, account_id, next_execute_at)
+                    VALUES (?, ?, ?)
+                ''', [(task_id, member_id, now) for member_id in account_ids])
+                for member_id in account_ids:
+                    self._schedule((task_id, member_id), now.timestamp())
+
+            logger.info(
+                f"Created batch redeem task {task_id} for account {account_id} with {len(codes)} codes"
+                + (f", pooled across {len(account_ids)} accounts" if mode == 'pool' else '')
+                + (f", {len(skipped)} known codes skipped" if skipped else '')
+            )
 
             return {
                 'success': True,
                 'task_id': task_id,
+                'mode': mode,
                 'total_count': len(codes),
+                'account_count': len(account_ids),
+                'skipped': skipped,
                 'message': '批量兑换任务已创建'
             }
 
@@ -306,9 +631,7 @@ class BatchRedeemScheduler:
             if task['status'] in ('completed', 'cancelled'):
                 return {'success': False, 'message': '任务已结束'}
 
-            with self._lock:
-                self.cancelled_tasks.add(task_id)
-                self.paused_tasks.discard(task_id)
+            self._unschedule(task_id)
 
             now = datetime.now(TIMEZONE)
             db.execute('''
@@ -334,8 +657,7 @@ class BatchRedeemScheduler:
             if task['status'] != 'running':
                 return {'success': False, 'message': '只能暂停运行中的任务'}
 
-            with self._lock:
-                self.paused_tasks.add(task_id)
+            self._unschedule(task_id)
 
             now = datetime.now(TIMEZONE)
             db.execute('''
@@ -361,15 +683,15 @@ class BatchRedeemScheduler:
             if task['status'] != 'paused':
                 return {'success': False, 'message': '只能恢复暂停的任务'}
 
-            with self._lock:
-                self.paused_tasks.discard(task_id)
-
             now = datetime.now(TIMEZONE)
             db.execute('''
                 UPDATE batch_redeem_tasks
                 SET status = 'running', next_execute_at = ?, updated_at = ?
                 WHERE id = ?
             ''', (now, now, task_id))
+            db.execute('UPDATE batch_redeem_accounts SET next_execute_at = ? WHERE task_id = ?', (now, task_id))
+            for slot in db.fetchall('SELECT account_id FROM batch_redeem_accounts WHERE task_id = ?', (task_id,)):
+                self._schedule((task_id, slot['account_id']), now.timestamp())
 
             logger.info(f"Batch task {task_id} resumed")
             return {'success': True, 'message': '任务已恢复'}
@@ -378,95 +700,100 @@ class BatchRedeemScheduler:
             logger.error(f"Resume batch task error: {e}")
             return {'success': False, 'message': f'恢复失败: {str(e)}'}
 
-    def get_task_status(self, account_id):
+    def get_task_status(self, account_id, page=None, per_page=50, status=None):
         """
-        获取账户的批量兑换任务状态
+        获取账户的批量兑换任务状态（包括账户参与的码池任务）
+
+        Args:
+            account_id: 账户 ID
+            page: 页码（从 1 开始），默认为当前执行位置所在页
+            per_page: 每页条数
+            status: 只返回该状态的兑换码（pending/executing/success/failed）
 
         Returns:
-            dict: 任务状态和进度信息
+            dict: 任务状态、参与账户、当前页的兑换码进度和分页信息
         """
         try:
             # 获取最新的任务（包括已完成的，便于查看历史）
             task = db.fetchone('''
                 SELECT * FROM batch_redeem_tasks
-                WHERE account_id = ?
+                WHERE account_id = ? OR id IN (SELECT task_id FROM batch_redeem_accounts WHERE account_id = ?)
                 ORDER BY id DESC LIMIT 1
-            ''', (account_id,))
+            ''', (account_id, account_id))
 
             if not task:
                 return {'task': None, 'progress': []}
 
-            # 获取兑换码列表
-            codes = json.loads(task['codes'])
-
-            # 获取每个兑换码的执行结果（直接用 code 列表查询）
-            codes_placeholder = ','.join(['?' for _ in codes])
-            history = db.fetchall(f'''
-                SELECT code, success, message, amount, created_at
-                FROM redeem_history
-                WHERE account_id = ?
-                AND code IN ({codes_placeholder})
-                ORDER BY created_at DESC
-            ''', (account_id, *codes))
-
-            # 构建兑换码结果映射
-            history_map = {}
-            for record in history:
-                code = record['code']
-                if code not in history_map:
-                    history_map[code] = record
-
-            # 格式化 next_execute_at
-            next_execute_str = None
-            if task['next_execute_at']:
-                next_exec = task['next_execute_at']
-                if isinstance(next_exec, datetime):
-                    next_execute_str = next_exec.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    next_execute_str = str(next_exec).split('.')[0] if '.' in str(next_exec) else str(next_exec)
+            next_execute_str = _format_time(task['next_execute_at'])
+
+            members = db.fetchall('''
+                SELECT a.account_id, ac.name, a.next_execute_at, a.success_count, a.fail_count
+                FROM batch_redeem_accounts a
+                JOIN accounts ac ON ac.id = a.account_id
+                WHERE a.task_id = ?
+                ORDER BY a.id
+            ''', (task['id'],))
+            names = {member['account_id']: member['name'] for member in members}
+
+            # 下一个待兑换的码（序号最小的 pending）
+            row = db.fetchone('''
+                SELECT MIN(item_index) AS next_index FROM batch_redeem_items
+                WHERE task_id = ? AND status = 'pending'
+            ''', (task['id'],))
+            next_index = row['next_index'] if row else None
+
+            if status:
+                row = db.fetchone('''
+                    SELECT COUNT(*) AS total FROM batch_redeem_items WHERE task_id = ? AND status = ?
+                ''', (task['id'], status))
+                total = row['total'] if row else 0
+            else:
+                total = task['total_count']
+
+            pages = max(1, math.ceil(total / per_page))
+            if page is None:
+                position = next_index if next_index is not None else task['current_index']
+                page = position // per_page + 1 if not status else 1
+            page = min(max(1, page), pages)
+
+            status_filter = 'AND status = ?' if status else ''
+            items = db.fetchall(f'''
+                SELECT item_index, code, status, message, amount, executed_at, account_id
+                FROM batch_redeem_items
+                WHERE task_id = ? {status_filter}
+                ORDER BY item_index
+                LIMIT ? OFFSET ?
+            ''', (task['id'],) + ((status,) if status else ()) + (per_page, (page - 1) * per_page))
 
             # 构建进度列表
             progress = []
-            for i, code in enumerate(codes):
-                if code in history_map:
-                    record = history_map[code]
-                    progress.append({
-                        'code': code,
-                        'index': i,
-                        'status': 'success' if record['success'] else 'failed',
-                        'message': record['message'],
-                        'amount': record.get('amount', ''),
-                        'time': str(record['created_at']) if record['created_at'] else None
-                    })
-                elif i < task['current_index']:
-                    # 已执行但未找到记录（理论上不应该发生）
-                    progress.append({
-                        'code': code,
-                        'index': i,
-                        'status': 'unknown',
-                        'message': '记录丢失'
-                    })
-                elif i == task['current_index'] and task['status'] == 'running':
+            for item in items:
+                entry = {
+                    'code': item['code'],
+                    'index': item['item_index'],
+                    'status': item['status'],
+                    'message': item['message'],
+                }
+                if item.get('account_id'):
+                    entry['account_id'] = item['account_id']
+                    entry['account_name'] = names.get(item['account_id'])
+                if item['status'] in ('success', 'failed'):
+                    entry['amount'] = item.get('amount', '')
+                    entry['time'] = str(item['executed_at']) if item['executed_at'] else None
+                elif item['item_index'] == next_index and task['status'] == 'running':
                     # 当前待执行的兑换码 - 显示等待执行
-                    progress.append({
-                        'code': code,
-                        'index': i,
-                        'status': 'waiting',
-                        'message': '等待执行',
-                        'next_execute_at': next_execute_str
-                    })
-                else:
-                    progress.append({
-                        'code': code,
-                        'index': i,
-                        'status': 'pending',
-                        'message': '等待中'
-                    })
+                    entry['status'] = 'waiting'
+                    entry['message'] = '等待执行'
+                    entry['next_execute_at'] = next_execute_str
+                elif item['status'] == 'pending':
+                    entry['message'] = '等待中'
+                progress.append(entry)
 
             return {
                 'task': {
                     'id': task['id'],
                     'account_id': task['account_id'],
+                    'mode': task.get('mode') or 'single',
                     'status': task['status'],
                     'total_count': task['total_count'],
                     'current_index': task['current_index'],
@@ -476,7 +803,20 @@ class BatchRedeemScheduler:
                     'created_at': str(task['created_at']) if task['created_at'] else None,
                     'completed_at': str(task['completed_at']) if task['completed_at'] else None
                 },
-                'progress': progress
+                'accounts': [{
+                    'account_id': member['account_id'],
+                    'name': member['name'],
+                    'next_execute_at': _format_time(member['next_execute_at']),
+                    'success_count': member['success_count'],
+                    'fail_count': member['fail_count'],
+                } for member in members],
+                'progress': progress,
+                'pagination': {
+                    'page': page,
+                    'per_page': per_page,
+                    'total': total,
+                    'pages': pages
+                }
             }
 
         except Exception as e:
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check-in outcome taxonomy for Leaflow Auto Check-in Control Panel
+"""
+
+from enum import Enum
+
+import requests
+
+from .deadline import DeadlineExceeded
+
+
+class CheckinOutcome(str, Enum):
+    """签到结果分类（存储于 checkin_history.outcome）"""
+
+    SUCCESS = 'success'
+    ALREADY_DONE = 'already_done'
+    AUTH_EXPIRED = 'auth_expired'
+    NETWORK = 'network'
+    UPSTREAM_5XX = 'upstream_5xx'
+    RATE_LIMITED = 'rate_limited'
+    PARSE_FAILURE = 'parse_failure'
+
+    @property
+    def is_success(self):
+        return self in (CheckinOutcome.SUCCESS, CheckinOutcome.ALREADY_DONE)
+
+    @classmethod
+    def values(cls):
+        return [outcome.value for outcome in cls]
+
+
+def classify_status(status_code):
+    """
+    根据 HTTP 状态码判断失败类型
+
+    Returns:
+        CheckinOutcome | None: 无法从状态码判断时返回 None
+    """
+    if status_code == 429:
+        return CheckinOutcome.RATE_LIMITED
+    if status_code in (401, 419):
+        return CheckinOutcome.AUTH_EXPIRED
+    if status_code >= 500:
+        return CheckinOutcome.UPSTREAM_5XX
+    return None
+
+
+def classify_exception(exc):
+    """
+    根据异常类型判断失败类型
+
+    只有请求异常和超时算网络错误；数据库、程序错误等本地异常不是上游抖动，
+    归为不重试的 PARSE_FAILURE
+    """
+    if isinstance(exc, (requests.exceptions.RequestException, DeadlineExceeded)):
+        return CheckinOutcome.NETWORK
+    return CheckinOutcome.PARSE_FAILURE
+
+
+def pick_failure(outcomes, default=CheckinOutcome.PARSE_FAILURE):
+    """
+    从多次请求的失败类型中选出最能代表本次失败的一个
+
+    认证过期优先（重试无意义），其次是限流、上游故障和网络错误
+    """
+    priority = (
+        CheckinOutcome.AUTH_EXPIRED,
+        CheckinOutcome.RATE_LIMITED,
+        CheckinOutcome.UPSTREAM_5XX,
+        CheckinOutcome.NETWORK,
+        CheckinOutcome.PARSE_FAILURE,
+    )
+    for outcome in priority:
+        if outcome in outcomes:
+            return outcome
+    return default
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check-in planner for Leaflow Auto Check-in Control Panel
+Assigns each account a check-in time inside its own window
+"""
+
+import zlib
+from collections import Counter
+from datetime import timedelta
+
+
+class CheckinPlanner:
+    """每日签到时间规划"""
+
+    # 单个账户一次签到的预估请求数（认证 + 签到页 + 提交）
+    ESTIMATED_REQUESTS_PER_CHECKIN = 3
+
+    @staticmethod
+    def _parse_time(value):
+        """解析 HH:MM，失败返回 None"""
+        try:
+            hour, minute = map(int, str(value).split(':')[:2])
+            if 0 <= hour < 24 and 0 <= minute < 60:
+                return hour, minute
+        except (ValueError, TypeError):
+            pass
+        return None
+
+    @staticmethod
+    def _at(base, hour_minute):
+        return base.replace(hour=hour_minute[0], minute=hour_minute[1], second=0, microsecond=0)
+
+    @staticmethod
+    def max_spread_minutes(checkin_time):
+        """从 checkin_time 开始、不跨过当天午夜的最大分散时长（分钟）"""
+        hour, minute = CheckinPlanner._parse_time(checkin_time) or (5, 30)
+        return 24 * 60 - 1 - (hour * 60 + minute)
+
+    @staticmethod
+    def plan(accounts, settings, now):
+        """
+        计算当天每个账户的计划签到时间
+
+        - 设置了自定义窗口的账户：在 [checkin_time_start, checkin_time_end] 内
+          按账户和日期哈希取一个固定时间点，每天不同但当天稳定
+        - 其余账户：从全局 checkin_time 开始，在 spread_minutes 内按账户均匀分布；
+          spread_minutes 为 0 时全部使用 checkin_time。分散窗口截止在当天午夜前，
+          否则排到次日的账户每天都会再被推到次日，永远不会签到
+
+        Args:
+            accounts: 账户列表
+            settings: 全局签到设置
+            now: 当前时间（带时区），用于确定日期
+
+        Returns:
+            dict: {account_id: datetime}
+        """
+        date_key = now.date().isoformat()
+        global_time = CheckinPlanner._parse_time(settings.get('checkin_time', '05:30')) or (5, 30)
+        global_start = CheckinPlanner._at(now, global_time)
+        spread_minutes = max(0, int(settings.get('spread_minutes') or 0))
+        spread_seconds = min(spread_minutes, CheckinPlanner.max_spread_minutes('%02d:%02d' % global_time)) * 60
+
+        plan = {}
+        auto_accounts = []
+
+        for account in accounts:
+            start = CheckinPlanner._parse_time(account.get('checkin_time_start'))
+            end = CheckinPlanner._parse_time(account.get('checkin_time_end'))
+
+            if not account.get('custom_window') or not start:
+                auto_accounts.append(account)
+                continue
+
+            window_start = CheckinPlanner._at(now, start)
+            window_seconds = 0
+            if end:
+                window_seconds = max(0, int((CheckinPlanner._at(now, end) - window_start).total_seconds()))
+
+            offset = 0
+            if window_seconds:
+                offset = zlib.crc32(f"{account['id']}:{date_key}".encode()) % window_seconds
+            plan[account['id']] = window_start + timedelta(seconds=offset)
+
+        auto_accounts.sort(key=lambda a: a['id'])
+        count = len(auto_accounts)
+        for index, account in enumerate(auto_accounts):
+            offset = spread_seconds * index / count if spread_seconds else 0
+            plan[account['id']] = global_start + timedelta(seconds=offset)
+
+        return plan
+
+    @staticmethod
+    def project_load(plan, random_delay_max=0):
+        """
+        统计计划中每分钟的签到数和预估请求数
+
+        Args:
+            plan: plan() 的返回值
+            random_delay_max: 随机延迟上限（秒），用于平摊到后续分钟
+
+        Returns:
+            dict: 每分钟负载和峰值
+        """
+        per_minute = Counter()
+        spread_minutes = max(1, int(random_delay_max // 60) + 1)
+
+        for planned_at in plan.values():
+            # 随机延迟会把请求平摊到接下来的几分钟
+            for step in range(spread_minutes):
+                minute = (planned_at + timedelta(minutes=step)).strftime('%H:%M')
+                per_minute[minute] += 1 / spread_minutes
+
+        per_request = CheckinPlanner.ESTIMATED_REQUESTS_PER_CHECKIN
+        slots = [
+            {
+                'minute': minute,
+                'checkins': round(count, 2),
+                'requests': round(count * per_request, 2),
+            }
+            for minute, count in sorted(per_minute.items())
+        ]
+
+        peak = max(slots, key=lambda s: s['requests']) if slots else None
+        return {
+            'accounts': len(plan),
+            'requests_per_checkin': per_request,
+            'peak_minute': peak['minute'] if peak else None,
+            'peak_requests_per_minute': peak['requests'] if peak else 0,
+            'slots': slots,
+        }
+
+    @staticmethod
+    def format_plan(plan):
+        """将计划时间格式化为 HH:MM:SS 便于展示"""
+        return {account_id: planned_at.strftime('%H:%M:%S') for account_id, planned_at in plan.items()}
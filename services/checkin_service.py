@@ -4,23 +4,85 @@
 Check-in service for Leaflow Auto Check-in Control Panel
 """
 
-import re
+import time
+import threading
+from collections import Counter
+from urllib.parse import urlparse
+
 import requests
 
 from config import logger
+from .checkin_outcome import CheckinOutcome, classify_exception, classify_status, pick_failure
+from .circuit_breaker import CircuitOpenError, guarded_request
+from .deadline import DeadlineExceeded, request_timeout
+from .http_transport import shared_transport
+from .response_classifier import classify_response
+
+
+class NotAuthenticated(Exception):
+    """The check-in response shows the session is not logged in"""
+
+
+class CheckinStrategyStats:
+    """Which check-in strategy wins, and how many requests a check-in costs"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.wins = Counter()
+        self.checkins = 0
+        self.failures = 0
+        self.requests = 0
+
+    def record(self, strategy, requests_made, won=True):
+        """
+        Record one check-in attempt (strategy is None when every strategy missed)
+
+        won is False when the strategy only found the account already checked
+        in, which says nothing about whether it can check in.
+        """
+        with self.lock:
+            self.requests += requests_made
+            if strategy:
+                if won:
+                    self.wins[strategy] += 1
+                self.checkins += 1
+            else:
+                self.failures += 1
+
+    def best(self):
+        """Globally most successful strategy"""
+        with self.lock:
+            most_common = self.wins.most_common(1)
+        return most_common[0][0] if most_common else None
+
+    def snapshot(self):
+        with self.lock:
+            attempts = self.checkins + self.failures
+            return {
+                'checkins': self.checkins,
+                'failures': self.failures,
+                'requests': self.requests,
+                'avg_requests_per_checkin': round(self.requests / attempts, 2) if attempts else 0,
+                'wins': dict(self.wins.most_common()),
+            }
 
 
 class LeafLowCheckin:
     """Leaflow check-in service"""
 
+    NOT_CHECKIN_PAGE = "Not a checkin page"
+
     def __init__(self):
+        self.strategy_stats = CheckinStrategyStats()
         self.checkin_url = "https://checkin.leaflow.net"
         self.main_site = "https://leaflow.net"
+        self.main_host = urlparse(self.main_site).hostname
         self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
 
     def create_session(self, token_data):
-        """Create session with authentication"""
+        """Create session with authentication (connections come from the shared pool)"""
         session = requests.Session()
+        shared_transport.mount(session)
 
         session.headers.update({
             'User-Agent': self.user_agent,
@@ -33,16 +95,55 @@ class LeafLowCheckin:
         })
 
         if 'cookies' in token_data:
+            # cookie_domains 记录写回时带域名的 cookie，导入的 cookie 没有域名
+            domains = token_data.get('cookie_domains') or {}
             for name, value in token_data['cookies'].items():
-                session.cookies.set(name, value)
+                session.cookies.set(name, value, domain=domains.get(name, ''))
 
         if 'headers' in token_data:
             session.headers.update(token_data['headers'])
 
+        session.hooks['response'].append(self._sync_rotated_cookies(session, self.main_host))
+
         return session
 
-    def test_authentication(self, session, account_name):
-        """Test if authentication is valid"""
+    @staticmethod
+    def cookie_matches_host(cookie, host):
+        """Whether a cookie with a domain would be sent to host"""
+        domain = (cookie.domain or '').lstrip('.').lower()
+        return bool(domain) and (host == domain or host.endswith('.' + domain))
+
+    @staticmethod
+    def _sync_rotated_cookies(session, host):
+        """
+        Keep the imported (domain-less) cookies in step with Set-Cookie rotations
+
+        requests stores a rotated cookie next to the imported one instead of
+        replacing it, so both would be sent with different values. Only
+        rotations that apply to the imported cookies' target host are copied;
+        a same-named cookie from another subdomain is left alone.
+        """
+        def hook(response, *args, **kwargs):
+            for rotated in response.cookies:
+                if not LeafLowCheckin.cookie_matches_host(rotated, host):
+                    continue
+                for cookie in list(session.cookies):
+                    if cookie.name == rotated.name and not cookie.domain and cookie.value != rotated.value:
+                        session.cookies.set(cookie.name, rotated.value, path=cookie.path)
+            return response
+        return hook
+
+    def test_authentication(self, session, account_name, deadline=None):
+        """
+        Test if authentication is valid
+
+        Args:
+            deadline: optional Deadline bounding the total time of all probes
+
+        Returns:
+            tuple: (valid: bool, message: str, outcome: CheckinOutcome | None)
+        """
+        failures = set()
         try:
             test_urls = [
                 f"{self.main_site}/dashboard",
@@ -52,145 +153,237 @@ class LeafLowCheckin:
             ]
 
             for url in test_urls:
-                response = session.get(url, timeout=30)
+                response = guarded_request(session, 'GET', url, timeout=request_timeout(deadline))
 
                 if response.status_code == 200:
-                    content = response.text.lower()
-                    if any(indicator in content for indicator in ['dashboard', 'profile', 'user', 'logout', 'welcome']):
+                    if classify_response(response.text).has('authenticated'):
                         logger.info(f"✅ [{account_name}] Authentication valid")
-                        return True, "Authentication successful"
+                        return True, "Authentication successful", None
+                    failures.add(CheckinOutcome.AUTH_EXPIRED)
                 elif response.status_code in [301, 302, 303]:
                     location = response.headers.get('location', '')
                     if 'login' not in location.lower():
                         logger.info(f"✅ [{account_name}] Authentication valid (redirect)")
-                        return True, "Authentication successful (redirect)"
+                        return True, "Authentication successful (redirect)", None
+                    failures.add(CheckinOutcome.AUTH_EXPIRED)
+                else:
+                    failures.add(classify_status(response.status_code) or CheckinOutcome.AUTH_EXPIRED)
 
-            return False, "Authentication failed - no valid authenticated pages found"
+            outcome = pick_failure(failures, default=CheckinOutcome.AUTH_EXPIRED)
+            return False, "Authentication failed - no valid authenticated pages found", outcome
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            return False, f"Authentication test error: {str(e)}"
-
-    def perform_checkin(self, session, account_name):
-        """Perform check-in"""
+            return False, f"Authentication test error: {str(e)}", classify_exception(e)
+
+    def checkin_strategies(self):
+        """
+        All check-in strategies in default order
+
+        'page' loads the check-in page and submits its form; the others hit a
+        single API endpoint with one method, keyed as "METHOD url".
+        """
+        strategies = ['page']
+        for endpoint in (
+            f"{self.checkin_url}/api/checkin",
+            f"{self.checkin_url}/checkin",
+            f"{self.main_site}/api/checkin",
+            f"{self.main_site}/checkin",
+        ):
+            strategies.append(f"GET {endpoint}")
+            strategies.append(f"POST {endpoint}")
+        return strategies
+
+    def _ordered_strategies(self, preferred=None):
+        """Account's last winning strategy first, then the global favourite, then the rest"""
+        strategies = self.checkin_strategies()
+        head = []
+        for strategy in (preferred, self.strategy_stats.best()):
+            if strategy in strategies and strategy not in head:
+                head.append(strategy)
+        return head + [s for s in strategies if s not in head]
+
+    def perform_checkin(self, session, account_name, deadline=None, preferred=None):
+        """
+        Perform check-in
+
+        Tries the preferred (previously successful) strategy first and only
+        falls back to the full list on a miss. Authentication is inferred from
+        the responses, so a logged-out session stops at the first response
+        that shows it.
+
+        Args:
+            deadline: optional Deadline bounding the total time of all attempts
+            preferred: strategy that last succeeded for this account
+
+        Returns:
+            tuple: (success: bool, message: str, outcome: CheckinOutcome, strategy: str | None,
+                    submitted_at: float | None)
+
+            submitted_at is the time.time() just before the winning strategy's
+            state-changing request (page fetch when already checked in); only
+            responses after it reflect the post-checkin balance.
+        """
         logger.info(f"🎯 [{account_name}] Performing checkin...")
 
+        failures = set()
+        requests_made = 0
         try:
-            response = session.get(self.checkin_url, timeout=30)
-
-            if response.status_code == 200:
-                result = self.analyze_and_checkin(session, response.text, self.checkin_url, account_name)
-                if result[0]:
-                    return result
-
-            api_endpoints = [
-                f"{self.checkin_url}/api/checkin",
-                f"{self.checkin_url}/checkin",
-                f"{self.main_site}/api/checkin",
-                f"{self.main_site}/checkin"
-            ]
-
-            for endpoint in api_endpoints:
+            for strategy in self._ordered_strategies(preferred):
                 try:
-                    response = session.get(endpoint, timeout=30)
-                    if response.status_code == 200:
-                        success, message = self.check_checkin_response(response.text)
-                        if success:
-                            return True, message
-
-                    response = session.post(endpoint, data={'checkin': '1'}, timeout=30)
-                    if response.status_code == 200:
-                        success, message = self.check_checkin_response(response.text)
-                        if success:
-                            return True, message
-
+                    success, message, outcome, count, submitted_at = self._run_strategy(
+                        session, strategy, account_name, deadline
+                    )
+                    requests_made += count
+                    if success:
+                        self.strategy_stats.record(strategy, requests_made, won=outcome == CheckinOutcome.SUCCESS)
+                        return True, message, outcome, strategy, submitted_at
+                    failures.add(outcome)
+
+                except NotAuthenticated as e:
+                    # 未登录时其他签到方式也不会成功，直接结束
+                    requests_made += 1
+                    self.strategy_stats.record(None, requests_made)
+                    logger.info(f"[{account_name}] Not authenticated: {e}")
+                    return False, f"Authentication failed: {e}", CheckinOutcome.AUTH_EXPIRED, None, None
+                except (CircuitOpenError, DeadlineExceeded):
+                    raise
                 except Exception as e:
-                    logger.debug(f"[{account_name}] API endpoint {endpoint} failed: {str(e)}")
+                    logger.debug(f"[{account_name}] Checkin strategy {strategy} failed: {str(e)}")
+                    failures.add(classify_exception(e))
                     continue
 
-            return False, "All checkin methods failed"
+            # 404/405 等状态只说明该端点不可用，不参与分类
+            failures.discard(None)
+            self.strategy_stats.record(None, requests_made)
+            return False, "All checkin methods failed", pick_failure(failures), None, None
 
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            return False, f"Checkin error: {str(e)}"
-
-    def analyze_and_checkin(self, session, html_content, page_url, account_name):
-        """Analyze page and perform check-in"""
-        if self.already_checked_in(html_content):
-            return True, "Already checked in today"
-
-        if not self.is_checkin_page(html_content):
-            return False, "Not a checkin page"
-
+            return False, f"Checkin error: {str(e)}", classify_exception(e), None, None
+
+    def _run_strategy(self, session, strategy, account_name, deadline=None):
+        """
+        Run one check-in strategy
+
+        Returns:
+            tuple: (success: bool, message: str, outcome: CheckinOutcome | None, requests_made: int,
+                    submitted_at: float)
+        """
+        if strategy == 'page':
+            fetched_at = time.time()
+            response = guarded_request(session, 'GET', self.checkin_url, timeout=request_timeout(deadline))
+            signals = classify_response(response.text) if response.status_code == 200 else None
+            self.ensure_authenticated(response, check_status=True, signals=signals)
+            if response.status_code != 200:
+                return False, f"HTTP {response.status_code}", classify_status(response.status_code) or CheckinOutcome.PARSE_FAILURE, 1, fetched_at
+
+            # 签到页本身带有签到前的余额，只有提交之后的响应才算新数据
+            submitted_at = time.time()
+            success, message, outcome = self.analyze_and_checkin(
+                session, response.text, self.checkin_url, account_name, deadline, signals=signals
+            )
+            # 已签到或非签到页时不会提交表单
+            posted = outcome != CheckinOutcome.ALREADY_DONE and message != self.NOT_CHECKIN_PAGE
+            return success, message, outcome, 2 if posted else 1, submitted_at if posted else fetched_at
+
+        method, endpoint = strategy.split(' ', 1)
+        kwargs = {'data': {'checkin': '1'}} if method == 'POST' else {}
+        submitted_at = time.time()
+        response = guarded_request(session, method, endpoint, timeout=request_timeout(deadline), **kwargs)
+        signals = classify_response(response.text) if response.status_code == 200 else None
+        # API 端点的 401 可能只是不支持会话认证，只把跳转登录页视为未登录
+        self.ensure_authenticated(response, signals=signals)
+        if response.status_code == 200:
+            success, message = self.check_checkin_response(response.text, signals)
+            if success:
+                return True, message, CheckinOutcome.SUCCESS, 1, submitted_at
+            return False, message, None, 1, submitted_at
+        return False, f"HTTP {response.status_code}", classify_status(response.status_code), 1, submitted_at
+
+    def ensure_authenticated(self, response, check_status=False, signals=None):
+        """
+        Infer from a check-in response whether the session is still logged in
+
+        Raises:
+            NotAuthenticated: redirected to login, 401/419 (when check_status), or a login form was served
+        """
+        for hop in list(response.history) + [response]:
+            if 'login' in hop.url.lower() or 'login' in hop.headers.get('location', '').lower():
+                raise NotAuthenticated("redirected to login page")
+
+        if check_status and response.status_code in (401, 419):
+            raise NotAuthenticated(f"HTTP {response.status_code}")
+
+        if response.status_code == 200 and 'text/html' in response.headers.get('content-type', ''):
+            signals = signals or classify_response(response.text)
+            if signals.has('login_form') and not signals.has('logout'):
+                raise NotAuthenticated("login form served")
+
+    def analyze_and_checkin(self, session, html_content, page_url, account_name, deadline=None, signals=None):
+        """
+        Analyze page and perform check-in
+
+        Args:
+            signals: ResponseSignals of html_content if already classified
+
+        Returns:
+            tuple: (success: bool, message: str, outcome: CheckinOutcome)
+        """
+        signals = signals or classify_response(html_content)
+
+        if signals.has('already_done'):
+            return True, "Already checked in today", CheckinOutcome.ALREADY_DONE
+
+        if not signals.has('checkin_page'):
+            return False, self.NOT_CHECKIN_PAGE, CheckinOutcome.PARSE_FAILURE
+
+        outcome = CheckinOutcome.PARSE_FAILURE
         try:
             checkin_data = {'checkin': '1', 'action': 'checkin', 'daily': '1'}
 
-            csrf_token = self.extract_csrf_token(html_content)
+            csrf_token = signals.csrf_token
             if csrf_token:
                 checkin_data['_token'] = csrf_token
                 checkin_data['csrf_token'] = csrf_token
 
-            response = session.post(page_url, data=checkin_data, timeout=30)
+            response = guarded_request(session, 'POST', page_url, data=checkin_data, timeout=request_timeout(deadline))
 
             if response.status_code == 200:
-                return self.check_checkin_response(response.text)
+                success, message = self.check_checkin_response(response.text)
+                return success, message, CheckinOutcome.SUCCESS if success else CheckinOutcome.PARSE_FAILURE
+
+            outcome = classify_status(response.status_code) or CheckinOutcome.PARSE_FAILURE
 
+        except (CircuitOpenError, DeadlineExceeded):
+            raise
         except Exception as e:
             logger.debug(f"[{account_name}] POST checkin failed: {str(e)}")
+            outcome = classify_exception(e)
 
-        return False, "Failed to perform checkin"
+        return False, "Failed to perform checkin", outcome
 
     def already_checked_in(self, html_content):
         """Check if already checked in"""
-        content_lower = html_content.lower()
-        indicators = [
-            'already checked in', '今日已签到', 'checked in today',
-            'attendance recorded', '已完成签到', 'completed today'
-        ]
-        return any(indicator in content_lower for indicator in indicators)
+        return classify_response(html_content).has('already_done')
 
     def is_checkin_page(self, html_content):
         """Check if it's a check-in page"""
-        content_lower = html_content.lower()
-        indicators = ['check-in', 'checkin', '签到', 'attendance', 'daily']
-        return any(indicator in content_lower for indicator in indicators)
+        return classify_response(html_content).has('checkin_page')
 
     def extract_csrf_token(self, html_content):
         """Extract CSRF token"""
-        patterns = [
-            r'name=["\']_token["\'][^>]*value=["\']([^"\']+)["\']',
-            r'name=["\']csrf_token["\'][^>]*value=["\']([^"\']+)["\']',
-            r'<meta[^>]*name=["\']csrf-token["\'][^>]*content=["\']([^"\']+)["\']',
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, html_content, re.IGNORECASE)
-            if match:
-                return match.group(1)
+        return classify_response(html_content).csrf_token
 
-        return None
-
-    def check_checkin_response(self, html_content):
+    def check_checkin_response(self, html_content, signals=None):
         """Check check-in response"""
-        content_lower = html_content.lower()
-
-        success_indicators = [
-            'check-in successful', 'checkin successful', '签到成功',
-            'attendance recorded', 'earned reward', '获得奖励',
-            'success', '成功', 'completed'
-        ]
-
-        if any(indicator in content_lower for indicator in success_indicators):
-            reward_patterns = [
-                r'获得奖励[^\d]*(\d+\.?\d*)\s*元',
-                r'earned.*?(\d+\.?\d*)\s*(credits?|points?)',
-                r'(\d+\.?\d*)\s*(credits?|points?|元)'
-            ]
-
-            for pattern in reward_patterns:
-                match = re.search(pattern, html_content, re.IGNORECASE)
-                if match:
-                    reward = match.group(1)
-                    return True, f"Check-in successful! Earned {reward} credits"
+        signals = signals or classify_response(html_content)
 
+        if signals.has('success'):
+            if signals.reward:
+                return True, f"Check-in successful! Earned {signals.reward} credits"
             return True, "Check-in successful!"
 
         return False, "Checkin response indicates failure"
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Check-in phase tracing for Leaflow Auto Check-in Control Panel
+Records how long each phase of a check-in run took and how many upstream
+requests it made, and summarises the recorded timings as percentiles
+"""
+
+import json
+import math
+import threading
+from time import perf_counter
+from contextlib import contextmanager
+
+
+# 签到流程的阶段（按执行顺序）
+PHASES = ('session', 'auth', 'checkin', 'db', 'balance', 'notify')
+
+_local = threading.local()
+
+
+class CheckinTrace:
+    """
+    单次签到的阶段耗时记录
+
+    通过 active() 绑定到当前线程后，经 guarded_request 发出的请求
+    会计入请求数和上游等待时间（到收到响应头为止）
+    """
+
+    def __init__(self):
+        self.started = self.last = perf_counter()
+        self.phases = {}
+        self.requests = 0
+        self.upstream = 0.0
+
+    @contextmanager
+    def active(self):
+        previous = getattr(_local, 'trace', None)
+        _local.trace = self
+        try:
+            yield self
+        finally:
+            _local.trace = previous
+
+    def lap(self, name):
+        """把上一个 lap 以来的耗时计入 name 阶段"""
+        now = perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self.last) * 1000
+        self.last = now
+
+    def record_request(self, response):
+        self.requests += 1
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            self.upstream += elapsed.total_seconds() * 1000
+
+    def to_dict(self):
+        """耗时单位为毫秒"""
+        return {
+            'phases': {name: round(value, 1) for name, value in self.phases.items()},
+            'total': round((perf_counter() - self.started) * 1000, 1),
+            'upstream': round(self.upstream, 1),
+            'requests': self.requests,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(',', ':'))
+
+
+def record_request(response):
+    """计入当前线程正在记录的签到（没有则忽略）"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.record_request(response)
+
+
+def percentile(sorted_values, p):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_timings(rows):
+    """
+    汇总 checkin_history.timings
+
+    Args:
+        rows: 包含 timings（JSON 字符串）的记录
+
+    Returns:
+        dict: {phase: {count, p50, p95, p99, max}}，另含 total、upstream 和 requests
+    """
+    samples = {}
+    for row in rows:
+        try:
+            timings = json.loads(row['timings'])
+        except (TypeError, ValueError):
+            continue
+
+        for name, value in timings.get('phases', {}).items():
+            samples.setdefault(name, []).append(value)
+        for name in ('total', 'upstream', 'requests'):
+            if name in timings:
+                samples.setdefault(name, []).append(timings[name])
+
+    order = list(PHASES) + ['total', 'upstream', 'requests']
+    result = {}
+    for name in sorted(samples, key=lambda n: order.index(n) if n in order else len(order)):
+        values = sorted(samples[name])
+        result[name] = {
+            'count': len(values),
+            'p50': percentile(values, 50),
+            'p95': percentile(values, 95),
+            'p99': percentile(values, 99),
+            'max': values[-1],
+        }
+    return result
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Upstream circuit breaker for Leaflow Auto Check-in Control Panel
+One breaker per upstream host (leaflow.net, checkin.leaflow.net)
+"""
+
+import time
+import threading
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+
+from config import (
+    logger, CIRCUIT_ERROR_RATE, CIRCUIT_MIN_REQUESTS, CIRCUIT_OPEN_SECONDS
+)
+from .checkin_trace import record_request
+
+
+class CircuitOpenError(Exception):
+    """上游熔断中，请求未发出"""
+
+    def __init__(self, host, retry_after):
+        super().__init__(f"Circuit open for {host}, retry after {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    基于错误率的熔断器
+
+    closed: 正常放行，统计滑动窗口内的错误率
+    open: 错误率超过阈值后拒绝所有请求，直到冷却结束
+    half_open: 冷却结束后只放行少量探测请求，全部成功后恢复 closed
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, host, error_rate_threshold=0.5, min_requests=10,
+                 window_seconds=60, open_seconds=120, half_open_probes=3):
+        self.host = host
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = self.CLOSED
+        self.opened_at = None
+        self.results = deque()  # (timestamp, ok)
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.lock = threading.Lock()
+
+    def _trim(self, now):
+        while self.results and now - self.results[0][0] > self.window_seconds:
+            self.results.popleft()
+
+    def allow_request(self):
+        """是否放行本次请求（half_open 时占用一个探测名额）"""
+        with self.lock:
+            now = time.time()
+
+            if self.state == self.OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self.probes_in_flight = 0
+                self.probe_successes = 0
+                logger.info(f"Circuit half-open for {self.host}, probing...")
+
+            if self.state == self.HALF_OPEN:
+                if self.probes_in_flight + self.probe_successes >= self.half_open_probes:
+                    return False
+                self.probes_in_flight += 1
+
+            return True
+
+    def retry_after(self):
+        """距离下次可以尝试的秒数"""
+        with self.lock:
+            if self.state == self.OPEN:
+                return max(0.0, self.open_seconds - (time.time() - self.opened_at))
+            if self.state == self.HALF_OPEN:
+                # 等待探测结果
+                return 15.0
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            now = time.time()
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+                self.probe_successes += 1
+                if self.probe_successes >= self.half_open_probes:
+                    self.state = self.CLOSED
+                    self.results.clear()
+                    logger.info(f"Circuit closed for {self.host}, upstream recovered")
+                return
+
+            self.results.append((now, True))
+            self._trim(now)
+
+    def release_probe(self):
+        """请求未得到上游响应（本地异常）：只归还半开状态的探测名额，不计入成功或失败"""
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+
+    def record_failure(self):
+        with self.lock:
+            now = time.time()
+            if self.state == self.HALF_OPEN:
+                self._open(now)
+                return
+
+            self.results.append((now, False))
+            self._trim(now)
+
+            if self.state == self.CLOSED and len(self.results) >= self.min_requests:
+                failures = sum(1 for _, ok in self.results if not ok)
+                if failures / len(self.results) >= self.error_rate_threshold:
+                    self._open(now)
+
+    def _open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.results.clear()
+        logger.warning(f"Circuit opened for {self.host}, deferring requests for {self.open_seconds}s")
+
+    def snapshot(self):
+        with self.lock:
+            now = time.time()
+            self._trim(now)
+            total = len(self.results)
+            failures = sum(1 for _, ok in self.results if not ok)
+            return {
+                'host': self.host,
+                'state': self.state,
+                'window_requests': total,
+                'window_failures': failures,
+                'error_rate': round(failures / total, 3) if total else 0,
+                'opened_at': self.opened_at if self.state != self.CLOSED else None,
+            }
+
+
+class CircuitBreakerRegistry:
+    """按 host 管理熔断器"""
+
+    def __init__(self):
+        self.breakers = {}
+        self.lock = threading.Lock()
+
+    def get(self, host):
+        with self.lock:
+            breaker = self.breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    host,
+                    error_rate_threshold=CIRCUIT_ERROR_RATE,
+                    min_requests=CIRCUIT_MIN_REQUESTS,
+                    open_seconds=CIRCUIT_OPEN_SECONDS,
+                )
+                self.breakers[host] = breaker
+            return breaker
+
+    def for_url(self, url):
+        return self.get(urlparse(url).hostname or '')
+
+    def snapshot(self):
+        with self.lock:
+            breakers = list(self.breakers.values())
+        return [breaker.snapshot() for breaker in breakers]
+
+
+def guarded_request(session, method, url, **kwargs):
+    """
+    通过熔断器发起请求
+
+    熔断打开时抛出 CircuitOpenError 而不发出请求；
+    网络异常、5xx 和 429 计为失败
+    """
+    breaker = circuit_breakers.for_url(url)
+    if not breaker.allow_request():
+        raise CircuitOpenError(breaker.host, breaker.retry_after())
+
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        breaker.record_failure()
+        raise
+    except Exception:
+        # 非网络异常不反映上游健康状况，只释放探测名额
+        breaker.release_probe()
+        raise
+
+    if response.status_code >= 500 or response.status_code == 429:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+    record_request(response)
+    return response
+
+
+# 全局熔断器注册表
+circuit_breakers = CircuitBreakerRegistry()
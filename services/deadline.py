@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time budget for Leaflow Auto Check-in Control Panel
+Bounds the total time a single account's check-in pipeline may take
+"""
+
+import time
+
+
+class DeadlineExceeded(Exception):
+    """时间预算已用完，请求未发出"""
+
+
+class Deadline:
+    """
+    单次签到流程的总时间预算
+
+    每个请求的连接/读取超时从剩余预算中截取，预算用完时抛出 DeadlineExceeded，
+    保证一个账户占用工作线程的时间有上限
+    """
+
+    # 剩余时间不足以完成一次请求时直接放弃
+    MIN_REQUEST_SECONDS = 1.0
+
+    def __init__(self, budget, connect_timeout=5, read_timeout=30):
+        self.budget = budget
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        """剩余秒数"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() < self.MIN_REQUEST_SECONDS
+
+    def timeout(self):
+        """
+        下一次请求使用的 (connect, read) 超时
+
+        Raises:
+            DeadlineExceeded: 剩余预算不足
+        """
+        remaining = self.remaining()
+        if remaining < self.MIN_REQUEST_SECONDS:
+            raise DeadlineExceeded(f"Time budget of {self.budget}s exhausted")
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+
+def request_timeout(deadline, default=30):
+    """有预算时从预算中取超时，否则使用固定超时"""
+    return deadline.timeout() if deadline else default
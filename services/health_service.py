@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Account health service for Leaflow Auto Check-in Control Panel
+Tracks per-account health and quarantines persistently failing accounts
+"""
+
+from datetime import datetime, timedelta
+
+from config import logger, TIMEZONE, QUARANTINE_AUTH_FAILURES
+from .checkin_outcome import CheckinOutcome
+
+
+class AccountHealthService:
+    """账户健康度与隔离管理"""
+
+    # 健康度为最近结果的指数加权平均（0-100）
+    SCORE_WEIGHT = 0.3
+    OUTCOME_SCORES = {
+        CheckinOutcome.SUCCESS: 100,
+        CheckinOutcome.ALREADY_DONE: 100,
+        CheckinOutcome.AUTH_EXPIRED: 0,
+        CheckinOutcome.PARSE_FAILURE: 40,
+        # 网络和上游故障不是账户本身的问题，扣分较少
+        CheckinOutcome.NETWORK: 70,
+        CheckinOutcome.UPSTREAM_5XX: 70,
+        CheckinOutcome.RATE_LIMITED: 70,
+    }
+    PROBE_INTERVAL = 24 * 60 * 60  # 隔离账户每天探测一次
+
+    @staticmethod
+    def record_outcome(db, account_id, account_name, outcome):
+        """
+        根据签到结果更新账户健康度，连续认证失败达到阈值时隔离账户
+
+        Returns:
+            bool: 本次是否触发了隔离
+        """
+        try:
+            account = db.fetchone(
+                'SELECT health_score, consecutive_auth_failures, quarantined FROM accounts WHERE id = ?',
+                (account_id,)
+            )
+            if not account:
+                return False
+
+            old_score = account.get('health_score')
+            old_score = 100 if old_score is None else old_score
+            weight = AccountHealthService.SCORE_WEIGHT
+            score = round(old_score * (1 - weight) + AccountHealthService.OUTCOME_SCORES[outcome] * weight)
+
+            failures = account.get('consecutive_auth_failures') or 0
+            if outcome == CheckinOutcome.AUTH_EXPIRED:
+                failures += 1
+            elif outcome.is_success:
+                failures = 0
+
+            if outcome.is_success and account.get('quarantined'):
+                AccountHealthService.release(db, account_id, score=score)
+                logger.info(f"[{account_name}] Recovered, released from quarantine")
+                return False
+
+            db.execute(
+                'UPDATE accounts SET health_score = ?, consecutive_auth_failures = ? WHERE id = ?',
+                (score, failures, account_id)
+            )
+
+            if not account.get('quarantined') and failures >= QUARANTINE_AUTH_FAILURES:
+                AccountHealthService.quarantine(db, account_id, account_name, failures)
+                return True
+
+            return False
+
+        except Exception as e:
+            logger.error(f"[{account_name}] Record health outcome error: {e}")
+            return False
+
+    @staticmethod
+    def quarantine(db, account_id, account_name, failures):
+        """隔离账户：不再参与定时签到和余额刷新"""
+        now = datetime.now(TIMEZONE)
+        db.execute(
+            'UPDATE accounts SET quarantined = 1, quarantined_at = ?, last_probe_at = ? WHERE id = ?',
+            (now, now, account_id)
+        )
+        logger.warning(f"[{account_name}] Quarantined after {failures} consecutive auth failures")
+
+        from .notification_service import NotificationService
+        NotificationService.send_notification(
+            f"Leaflow账户已隔离 - {account_name}",
+            f"连续 {failures} 次认证失败，已暂停定时签到和余额刷新。\n请更新 Cookie 或在控制面板中解除隔离。",
+            account_name
+        )
+
+    @staticmethod
+    def release(db, account_id, score=50):
+        """解除隔离"""
+        db.execute('''
+            UPDATE accounts SET quarantined = 0, quarantined_at = NULL,
+                consecutive_auth_failures = 0, health_score = ?
+            WHERE id = ?
+        ''', (score, account_id))
+
+    @staticmethod
+    def get_probe_candidates(db):
+        """获取今天需要探测的隔离账户"""
+        cutoff = datetime.now(TIMEZONE) - timedelta(seconds=AccountHealthService.PROBE_INTERVAL)
+        return db.fetchall('''
+            SELECT * FROM accounts
+            WHERE enabled = 1 AND quarantined = 1
+              AND (last_probe_at IS NULL OR last_probe_at <= ?)
+        ''', (cutoff,))
+
+    @staticmethod
+    def probe(db, session, account):
+        """
+        用一次余额页请求探测隔离账户是否恢复
+
+        Returns:
+            bool: 是否已恢复
+        """
+        from .balance_service import BalanceService
+
+        account_id = account['id']
+        account_name = account['name']
+
+        success, _ = BalanceService.refresh_account_balance(db, session, account_id, account_name)
+        db.execute(
+            'UPDATE accounts SET last_probe_at = ? WHERE id = ?',
+            (datetime.now(TIMEZONE), account_id)
+        )
+        if success:
+            AccountHealthService.release(db, account_id)
+            logger.info(f"[{account_name}] Quarantine probe succeeded, account released")
+            return True
+
+        logger.info(f"[{account_name}] Quarantine probe failed, still quarantined")
+        return False
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP transport for Leaflow Auto Check-in Control Panel
+One connection pool per upstream host shared by every account session,
+with TLS session resumption
+"""
+
+import ssl
+import threading
+import weakref
+
+from requests.adapters import HTTPAdapter
+from requests.utils import DEFAULT_CA_BUNDLE_PATH
+
+from config import HTTP_POOL_MAXSIZE
+
+
+class TlsSessionCache:
+    """按 host 缓存 TLS 会话，新连接复用会话跳过完整握手"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}
+        # TLS 1.3 的会话票据在握手之后才到达，先记下连接，下次建连时再取
+        self.sockets = {}
+        self.handshakes = 0
+        self.resumed = 0
+
+    def get(self, host):
+        with self.lock:
+            for sock in self.sockets.pop(host, weakref.WeakSet()):
+                try:
+                    session = sock.session
+                except (OSError, ValueError):
+                    continue
+                if session is not None and session.has_ticket:
+                    self.sessions[host] = session
+            return self.sessions.get(host)
+
+    def discard(self, host):
+        with self.lock:
+            self.sessions.pop(host, None)
+
+    def record(self, host, sock):
+        with self.lock:
+            self.handshakes += 1
+            if sock.session_reused:
+                self.resumed += 1
+            self.sockets.setdefault(host, weakref.WeakSet()).add(sock)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'handshakes': self.handshakes,
+                'resumed': self.resumed,
+                'cached_hosts': sorted(self.sessions),
+            }
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """建立连接时自动带上该 host 缓存的 TLS 会话"""
+
+    session_cache = None
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        cache = self.session_cache
+        if session is None and cache is not None and server_hostname:
+            session = cache.get(server_hostname)
+
+        try:
+            ssl_sock = super().wrap_socket(sock, *args, server_hostname=server_hostname, session=session, **kwargs)
+        except ssl.SSLError:
+            # 缓存的会话可能已失效，下次重新完整握手
+            if session is not None and cache is not None:
+                cache.discard(server_hostname)
+            raise
+
+        if cache is not None and server_hostname:
+            cache.record(server_hostname, ssl_sock)
+        return ssl_sock
+
+
+class SharedHTTPAdapter(HTTPAdapter):
+    """所有账户 session 共用的适配器（共享连接池，close 不会关闭连接池）"""
+
+    def __init__(self, ssl_context, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['ssl_context'] = self.ssl_context
+        return super().init_poolmanager(*args, **kwargs)
+
+    def close(self):
+        # 单个 session 关闭时不能清空共享连接池
+        pass
+
+
+class SharedTransport:
+    """进程级共享的 HTTP 传输层"""
+
+    def __init__(self, pool_maxsize=10):
+        self.tls_sessions = TlsSessionCache()
+
+        context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.load_verify_locations(DEFAULT_CA_BUNDLE_PATH)
+        context.session_cache = self.tls_sessions
+
+        self.pool_maxsize = pool_maxsize
+        self.adapter = SharedHTTPAdapter(
+            context,
+            pool_connections=10,
+            pool_maxsize=pool_maxsize,
+        )
+
+    def mount(self, session):
+        """让 session 使用共享连接池（cookie 和 header 仍属于各自的 session）"""
+        session.mount('https://', self.adapter)
+        session.mount('http://', self.adapter)
+        return session
+
+    def stats(self):
+        """连接池统计"""
+        pools = []
+        container = self.adapter.poolmanager.pools
+        for key in list(container.keys()):
+            pool = container.get(key)
+            if pool is None:
+                continue
+            pools.append({
+                'host': key.key_host,
+                'scheme': key.key_scheme,
+                'maxsize': pool.pool.maxsize if pool.pool else 0,
+                'idle_connections': pool.pool.qsize() if pool.pool else 0,
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+            })
+
+        return {
+            'pool_maxsize': self.pool_maxsize,
+            'pools': pools,
+            'tls': self.tls_sessions.snapshot(),
+        }
+
+
+# 全局共享传输层
+shared_transport = SharedTransport(pool_maxsize=HTTP_POOL_MAXSIZE)
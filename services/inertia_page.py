@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Inertia page extractor for Leaflow Auto Check-in Control Panel
+Streams upstream HTML, picks out the data-page attribute and decodes
+just the part of the payload that is needed
+"""
+
+import re
+import json
+import html
+
+
+# 单个页面最多读取的字节数（超过仍未读到 data-page 结束则放弃）
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+CHUNK_SIZE = 16 * 1024
+
+_MARKER = b'data-page="'
+_DATA_PAGE_PATTERN = re.compile(r'data-page="([^"]*)"')
+_AUTH_USER_PATTERN = re.compile(r'&quot;auth&quot;\s*:\s*\{\s*&quot;user&quot;\s*:\s*')
+_decoder = json.JSONDecoder()
+
+
+class PageTooLarge(ValueError):
+    """页面超过大小限制"""
+
+
+def read_data_page(response, max_bytes=MAX_PAGE_BYTES, chunk_size=CHUNK_SIZE):
+    """
+    流式读取响应，取出 data-page 属性
+
+    取到属性后把剩余正文读完（总量不超过 max_bytes），连接回到连接池
+    复用；读不完时才关闭连接。请求需以 stream=True 发出，否则正文已被
+    完整下载（仍可正常解析）
+
+    Args:
+        response: requests.Response
+        max_bytes: 最多读取的字节数
+
+    Returns:
+        str | None: data-page 属性的原始值（未做 HTML 实体解码），页面中没有时返回 None
+
+    Raises:
+        PageTooLarge: 超过 max_bytes 仍未读到属性结束
+    """
+    buffer = bytearray()
+    total = 0
+    start = -1
+    value = None
+
+    try:
+        for chunk in response.iter_content(chunk_size):
+            total += len(chunk)
+            if value is not None:
+                # 只是在读完正文，页面过大时放弃（关闭连接）
+                if total > max_bytes:
+                    break
+                continue
+
+            search_from = len(buffer)
+            buffer += chunk
+
+            if start < 0:
+                index = buffer.find(_MARKER, max(0, search_from - len(_MARKER) + 1))
+                if index < 0:
+                    # 属性开始之前的内容不需要保留
+                    del buffer[:max(0, len(buffer) - len(_MARKER) + 1)]
+                else:
+                    del buffer[:index + len(_MARKER)]
+                    start = 0
+                    search_from = 0
+
+            if start >= 0:
+                # 属性值经过 HTML 转义，第一个双引号即为结束
+                end = buffer.find(b'"', search_from)
+                if end >= 0:
+                    value = buffer[:end].decode(response.encoding or 'utf-8', errors='replace')
+                    buffer = None
+                    continue
+
+            if total > max_bytes:
+                raise PageTooLarge(f"Page exceeds {max_bytes} bytes before data-page closes")
+
+        return value
+    finally:
+        response.close()
+
+
+def find_data_page(html_content):
+    """
+    从已下载的 HTML 中取出 data-page 属性的原始值
+
+    Returns:
+        str | None
+    """
+    match = _DATA_PAGE_PATTERN.search(html_content)
+    return match.group(1) if match else None
+
+
+def extract_auth_user(data_page):
+    """
+    从 data-page 中只解码 props.auth.user
+
+    定位 auth.user 后仅对其之后的内容做实体解码并 raw_decode 出这一个对象；
+    定位失败时退回完整解析
+
+    Returns:
+        dict | None
+    """
+    match = _AUTH_USER_PATTERN.search(data_page)
+    if match:
+        try:
+            user, _ = _decoder.raw_decode(html.unescape(data_page[match.end():]))
+            return user
+        except ValueError:
+            pass
+
+    data = json.loads(html.unescape(data_page))
+    return data.get('props', {}).get('auth', {}).get('user')
+
+
+def extract_version(data_page):
+    """
+    从 data-page 中提取顶层的 Inertia version
+
+    只读取顶层对象的 version；props 中嵌套的同名字段不能当作页面版本
+
+    Returns:
+        str | None
+    """
+    data = json.loads(html.unescape(data_page))
+    version = data.get('version') if isinstance(data, dict) else None
+    return version if isinstance(version, str) and version else None
@@ -4,13 +4,11 @@
 Invitation code service for Leaflow Auto Check-in Control Panel
 """
 
-import re
 import json
-import html
 import traceback
-from urllib.parse import unquote
 
 from config import logger
+from .leaflow_client import leaflow_client, InertiaHandshakeError
 
 
 class InvitationService:
@@ -33,52 +31,25 @@ class InvitationService:
                    失败时 data 为错误信息
         """
         try:
-            # 1. 先访问页面获取 version 和 cookies
-            logger.info("Fetching invitation codes page...")
-            response = session.get(InvitationService.INVITATION_LIST_URL, timeout=30)
-
-            if response.status_code != 200:
-                logger.error(f"Get invitation page failed: HTTP {response.status_code}")
-                return False, f"获取页面失败: HTTP {response.status_code}"
-
-            # 2. 清理并更新重复的 cookies
-            InvitationService._cleanup_cookies(session, response)
-
-            # 3. 解析 version
-            version = InvitationService._extract_version(response.text)
-            if not version:
-                logger.error("Cannot extract version from page")
-                return False, "无法获取页面版本信息"
-            logger.info(f"Got version: {version}")
-
-            # 4. 获取 XSRF-TOKEN
-            xsrf_token = InvitationService._get_xsrf_token(session, response)
-            if not xsrf_token:
-                logger.error("Cannot get XSRF-TOKEN")
-                return False, "无法获取 XSRF-TOKEN"
-
-            # 5. 发送 Inertia AJAX 请求
-            headers = {
-                'x-inertia': 'true',
-                'x-inertia-version': version,
-                'x-xsrf-token': xsrf_token,
-                'x-requested-with': 'XMLHttpRequest',
-                'accept': 'text/html, application/xhtml+xml',
-            }
-
-            ajax_response = session.get(
+            # 1. 发送 Inertia AJAX 请求（version 和 XSRF-TOKEN 由客户端缓存）
+            logger.info("Fetching invitation codes...")
+            ajax_response = leaflow_client.request(
+                session, 'GET',
                 InvitationService.INVITATION_LIST_URL,
-                headers=headers,
-                timeout=30
+                InvitationService.INVITATION_LIST_URL,
+                headers={'accept': 'text/html, application/xhtml+xml'}
             )
 
             if ajax_response.status_code != 200:
                 logger.error(f"Get invitation codes failed: HTTP {ajax_response.status_code}")
                 return False, f"获取邀请码失败: HTTP {ajax_response.status_code}"
 
-            # 6. 解析响应
+            # 2. 解析响应
             return InvitationService._parse_invitation_response(ajax_response.text)
 
+        except InertiaHandshakeError as e:
+            logger.error(f"Invitation handshake failed: {e}")
+            return False, str(e)
         except Exception as e:
             logger.error(f"Get invitation codes error: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
@@ -100,44 +71,16 @@ class InvitationService:
                    失败时 data 为错误信息
         """
         try:
-            # 1. 先访问页面获取 version 和 cookies
-            logger.info("Fetching invitation page for create...")
-            response = session.get(InvitationService.INVITATION_LIST_URL, timeout=30)
-
-            if response.status_code != 200:
-                logger.error(f"Get invitation page failed: HTTP {response.status_code}")
-                return False, f"获取页面失败: HTTP {response.status_code}"
-
-            # 2. 清理并更新重复的 cookies
-            InvitationService._cleanup_cookies(session, response)
-
-            # 3. 解析 version
-            version = InvitationService._extract_version(response.text)
-            if not version:
-                logger.error("Cannot extract version from page")
-                return False, "无法获取页面版本信息"
-
-            # 4. 获取 XSRF-TOKEN
-            xsrf_token = InvitationService._get_xsrf_token(session, response)
-            if not xsrf_token:
-                logger.error("Cannot get XSRF-TOKEN")
-                return False, "无法获取 XSRF-TOKEN"
-
-            # 5. 发送创建请求
-            headers = {
-                'x-inertia': 'true',
-                'x-inertia-version': version,
-                'x-xsrf-token': xsrf_token,
-                'x-requested-with': 'XMLHttpRequest',
-                'content-type': 'application/json',
-                'accept': 'application/json, text/plain, */*',
-            }
-
-            create_response = session.post(
+            # 1. 发送创建请求（version 和 XSRF-TOKEN 由客户端缓存）
+            create_response = leaflow_client.request(
+                session, 'POST',
                 InvitationService.INVITATION_CREATE_URL,
-                headers=headers,
-                json={'max_uses': max_uses, 'note': note},
-                timeout=30
+                InvitationService.INVITATION_LIST_URL,
+                headers={
+                    'content-type': 'application/json',
+                    'accept': 'application/json, text/plain, */*',
+                },
+                json={'max_uses': max_uses, 'note': note}
             )
 
             logger.info(f"Create invitation code response status: {create_response.status_code}")
@@ -152,7 +95,7 @@ class InvitationService:
                 except Exception:
                     return False, f"创建失败: HTTP {create_response.status_code}"
 
-            # 6. 解析创建结果
+            # 2. 解析创建结果
             try:
                 result = create_response.json()
                 logger.info(f"Created invitation code: {result.get('code')}")
@@ -161,56 +104,14 @@ class InvitationService:
                 logger.error("Cannot parse create response as JSON")
                 return False, "响应解析失败"
 
+        except InertiaHandshakeError as e:
+            logger.error(f"Invitation handshake failed: {e}")
+            return False, str(e)
         except Exception as e:
             logger.error(f"Create invitation code error: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False, f"创建邀请码失败: {str(e)}"
 
-    @staticmethod
-    def _cleanup_cookies(session, response):
-        """清理并更新重复的 cookies"""
-        for cookie_name in ['XSRF-TOKEN', 'leaflow_session', 'shared_api_cookie']:
-            if cookie_name in response.cookies:
-                for cookie in list(session.cookies):
-                    if cookie.name == cookie_name:
-                        session.cookies.clear(cookie.domain, cookie.path, cookie.name)
-                session.cookies.set(cookie_name, response.cookies[cookie_name], domain='leaflow.net')
-
-    @staticmethod
-    def _get_xsrf_token(session, response):
-        """获取 XSRF-TOKEN"""
-        xsrf_token = response.cookies.get('XSRF-TOKEN')
-        if not xsrf_token:
-            cookies_dict = session.cookies.get_dict()
-            xsrf_token = cookies_dict.get('XSRF-TOKEN')
-        if xsrf_token:
-            xsrf_token = unquote(xsrf_token)
-        return xsrf_token
-
-    @staticmethod
-    def _extract_version(html_content):
-        """从响应中提取 Inertia version"""
-        try:
-            # 方法1: 从 data-page JSON 中提取
-            pattern = r'data-page="([^"]+)"'
-            match = re.search(pattern, html_content)
-            if match:
-                json_str = html.unescape(match.group(1))
-                data = json.loads(json_str)
-                if data.get('version'):
-                    return data['version']
-
-            # 方法2: 直接匹配 version 字段
-            version_pattern = r'"version"\s*:\s*"([a-f0-9]+)"'
-            match = re.search(version_pattern, html_content)
-            if match:
-                return match.group(1)
-
-            return None
-        except Exception as e:
-            logger.error(f"Extract version error: {e}")
-            return None
-
     @staticmethod
     def _parse_invitation_response(response_text):
         """解析邀请码列表响应"""
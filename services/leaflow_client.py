@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leaflow Inertia client for Leaflow Auto Check-in Control Panel
+Caches the Inertia version and per-account XSRF tokens so that redeem and
+invitation calls skip the page GET that only served as a handshake
+"""
+
+import time
+import weakref
+import threading
+from collections import Counter
+from urllib.parse import unquote
+
+from config import logger
+from .circuit_breaker import guarded_request
+from .inertia_page import read_data_page, extract_version
+
+
+class InertiaHandshakeError(Exception):
+    """无法从页面获取 Inertia version 或 XSRF-TOKEN"""
+
+
+class LeaflowClient:
+    """
+    Inertia 请求客户端
+
+    version 全站共用，XSRF-TOKEN 按账户 session 缓存，各自带 TTL；
+    服务端返回 409（version 不一致）或 419（CSRF 校验失败）时刷新并重试一次
+    """
+
+    VERSION_TTL = 60 * 60
+    XSRF_TTL = 30 * 60
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.version_at = 0
+        self.xsrf_tokens = weakref.WeakKeyDictionary()  # session -> (token, fetched_at)
+        self.stats = Counter()
+
+    def _cached(self, session):
+        now = time.time()
+        with self.lock:
+            version = self.version if now - self.version_at < self.VERSION_TTL else None
+            token, fetched_at = self.xsrf_tokens.get(session, (None, 0))
+            if now - fetched_at >= self.XSRF_TTL:
+                token = None
+        return version, token
+
+    def _remember_xsrf(self, session, response):
+        """服务端每次响应都会下发新的 XSRF-TOKEN，顺便刷新缓存"""
+        token = response.cookies.get('XSRF-TOKEN')
+        if token:
+            with self.lock:
+                self.xsrf_tokens[session] = (token, time.time())
+
+    def _handshake(self, session, page_url):
+        """GET 页面获取 version 和 XSRF-TOKEN"""
+        self.stats['handshakes'] += 1
+        response = guarded_request(session, 'GET', page_url, timeout=30, stream=True)
+        if response.status_code != 200:
+            response.close()
+            raise InertiaHandshakeError(f"获取页面失败: HTTP {response.status_code}")
+
+        data_page = read_data_page(response)
+        version = extract_version(data_page) if data_page is not None else None
+        if not version:
+            raise InertiaHandshakeError("无法获取页面版本信息")
+
+        token = response.cookies.get('XSRF-TOKEN') or session.cookies.get_dict().get('XSRF-TOKEN')
+        if not token:
+            raise InertiaHandshakeError("无法获取 XSRF-TOKEN")
+
+        now = time.time()
+        with self.lock:
+            if version != self.version:
+                logger.info(f"Inertia version: {version}")
+            self.version = version
+            self.version_at = now
+            self.xsrf_tokens[session] = (token, now)
+
+    def request(self, session, method, url, page_url, headers=None, **kwargs):
+        """
+        发送 Inertia 请求，缺少或过期时先通过 page_url 握手
+
+        Args:
+            session: 账户的 requests.Session
+            page_url: 用于获取 version 和 XSRF-TOKEN 的页面
+            headers: 额外的请求头
+
+        Returns:
+            requests.Response
+
+        Raises:
+            InertiaHandshakeError: 握手失败
+        """
+        for attempt in range(2):
+            version, token = self._cached(session)
+            if version and token:
+                self.stats['cache_hits'] += 1
+            else:
+                self._handshake(session, page_url)
+                version, token = self._cached(session)
+
+            request_headers = {
+                'x-inertia': 'true',
+                'x-inertia-version': version,
+                'x-xsrf-token': unquote(token),
+                'x-requested-with': 'XMLHttpRequest',
+            }
+            request_headers.update(headers or {})
+
+            response = guarded_request(session, method, url, headers=request_headers, timeout=30, **kwargs)
+            self._remember_xsrf(session, response)
+
+            if attempt == 0 and response.status_code == 409:
+                logger.info("Inertia version changed, refreshing")
+                self.stats['version_refreshes'] += 1
+                with self.lock:
+                    self.version = None
+                continue
+
+            if attempt == 0 and response.status_code == 419:
+                logger.info("XSRF token expired, refreshing")
+                self.stats['xsrf_refreshes'] += 1
+                with self.lock:
+                    self.xsrf_tokens.pop(session, None)
+                continue
+
+            return response
+
+        return response
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, version=self.version, cached_tokens=len(self.xsrf_tokens))
+
+
+# 全局 Leaflow 客户端
+leaflow_client = LeaflowClient()
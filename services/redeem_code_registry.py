@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Redeem code registry for Leaflow Auto Check-in Control Panel
+Remembers codes that were already redeemed or confirmed invalid so they are
+dropped before they cost an upstream request or a batch slot
+"""
+
+import re
+import hashlib
+import threading
+
+from config import logger
+
+
+# 上游 flash error 中表示兑换码本身不可用的说法（与账户无关）；
+# 必须同时提到兑换码，避免把“登录已过期”之类的账户错误当成码无效
+INVALID_PATTERN = re.compile(
+    r'兑换码.*(不存在|无效|已被使用|已失效|已用完)|无效的兑换码'
+    r'|\b(invalid|unknown) (redeem )?code\b|\bcode\b.*\b(not found|does not exist|has been used|already been used)\b',
+    re.IGNORECASE
+)
+
+# 当前账户已兑换过该码（只对该账户无效）
+ALREADY_REDEEMED_PATTERN = re.compile(r'已兑换|已经兑换|already redeemed', re.IGNORECASE)
+
+# RedeemService 本地生成的失败消息（异常、解析失败、登录过期等），从不分类
+LOCAL_MESSAGE_PREFIXES = ('兑换失败:', '解析失败:', '响应解析失败', '未知响应', '登录已过期', '获取页面失败', '无法获取')
+
+# 单条 IN 查询的最大参数个数（SQLite 旧版本上限为 999）
+CHUNK_SIZE = 500
+
+
+def _chunks(values):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+
+def _upstream_error(message):
+    """只分类上游返回的错误消息"""
+    if not message or message.startswith(LOCAL_MESSAGE_PREFIXES):
+        return None
+    return message
+
+
+def is_invalid_message(message):
+    """兑换失败消息是否表示兑换码本身不可用（超时、登录过期等临时错误不算）"""
+    message = _upstream_error(message)
+    return bool(message) and not ALREADY_REDEEMED_PATTERN.search(message) and bool(INVALID_PATTERN.search(message))
+
+
+def is_already_redeemed_message(message):
+    """兑换失败消息是否表示当前账户已兑换过该码"""
+    message = _upstream_error(message)
+    return bool(message) and bool(ALREADY_REDEEMED_PATTERN.search(message))
+
+
+class BloomFilter:
+    """定长布隆过滤器（只会误报，不会漏报）"""
+
+    def __init__(self, capacity, hashes=4, bits_per_item=10):
+        self.capacity = capacity
+        self.size = max(64, capacity * bits_per_item)
+        self.hashes = hashes
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class RedeemCodeRegistry:
+    """
+    已兑换 / 已确认无效的兑换码
+
+    内存中的布隆过滤器挡掉绝大多数没见过的码；命中时再用
+    redeem_history(code, account_id) 索引确认，排除误报
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filter = None
+
+    @staticmethod
+    def _invalid_key(code):
+        return f'invalid:{code}'
+
+    @staticmethod
+    def _used_key(account_id, code):
+        return f'used:{account_id}:{code}'
+
+    def _rebuild(self, db):
+        """从 redeem_history 重建过滤器（容量不足时翻倍）"""
+        rows = db.fetchall('SELECT account_id, code, success, message FROM redeem_history')
+        keys = []
+        for row in rows:
+            if row['success'] or is_already_redeemed_message(row['message']):
+                keys.append(self._used_key(row['account_id'], row['code']))
+            elif is_invalid_message(row['message']):
+                keys.append(self._invalid_key(row['code']))
+
+        bloom = BloomFilter(max(1024, len(keys) * 2))
+        for key in keys:
+            bloom.add(key)
+        self.filter = bloom
+        logger.info(f"Redeem code registry loaded: {len(keys)} known codes")
+
+    def _ensure_filter(self, db):
+        with self.lock:
+            if self.filter is None or self.filter.count >= self.filter.capacity:
+                self._rebuild(db)
+            return self.filter
+
+    def remember(self, db, account_id, code, success, message):
+        """记录一次兑换结果（写入 redeem_history 之后调用）"""
+        try:
+            bloom = self._ensure_filter(db)
+            with self.lock:
+                if success or is_already_redeemed_message(message):
+                    bloom.add(self._used_key(account_id, code))
+                elif is_invalid_message(message):
+                    bloom.add(self._invalid_key(code))
+        except Exception as e:
+            logger.error(f"Remember redeem code error: {e}")
+
+    def find_known(self, db, account_ids, codes):
+        """
+        找出对这些账户来说已知不可用的兑换码
+
+        Args:
+            db: 数据库实例
+            account_ids: 将使用这些码的账户
+            codes: 兑换码列表
+
+        Returns:
+            dict: {code: 原因}
+        """
+        bloom = self._ensure_filter(db)
+        with self.lock:
+            candidates = [
+                code for code in codes
+                if self._invalid_key(code) in bloom
+                or any(self._used_key(account_id, code) in bloom for account_id in account_ids)
+            ]
+        if not candidates:
+            return {}
+
+        # 布隆过滤器可能误报，用索引确认
+        rows = []
+        for chunk in _chunks(candidates):
+            placeholders = ','.join('?' for _ in chunk)
+            rows.extend(db.fetchall(f'''
+                SELECT code, account_id, success, message FROM redeem_history
+                WHERE code IN ({placeholders})
+            ''', tuple(chunk)))
+
+        members = set(account_ids)
+        known = {}
+        for row in rows:
+            if row['account_id'] in members and (row['success'] or is_already_redeemed_message(row['message'])):
+                known[row['code']] = '已兑换过'
+            elif not row['success'] and is_invalid_message(row['message']):
+                known.setdefault(row['code'], row['message'])
+        return known
+
+    def find_queued(self, db, codes, exclude_task_id=None):
+        """已在未结束的批量任务中排队（或正在执行）的兑换码"""
+        queued = set()
+        for chunk in _chunks(list(codes)):
+            placeholders = ','.join('?' for _ in chunk)
+            rows = db.fetchall(f'''
+                SELECT i.code FROM batch_redeem_items i
+                JOIN batch_redeem_tasks t ON t.id = i.task_id
+                WHERE i.code IN ({placeholders})
+                AND i.status IN ('pending', 'executing')
+                AND t.status IN ('pending', 'running', 'paused')
+                AND t.id != ?
+            ''', (*chunk, exclude_task_id or 0))
+            queued.update(row['code'] for row in rows)
+        return queued
+
+
+# 全局兑换码登记表
+redeem_code_registry = RedeemCodeRegistry()
@@ -6,11 +6,10 @@ Redeem code service for Leaflow Auto Check-in Control Panel
 
 import re
 import json
-import html
 import traceback
-from urllib.parse import unquote
 
 from config import logger
+from .leaflow_client import leaflow_client, InertiaHandshakeError
 
 
 class RedeemService:
@@ -32,109 +31,28 @@ class RedeemService:
             tuple: (success: bool, message: str)
         """
         try:
-            # 1. 记录请求前的 cookies 状态（调试用）
-            logger.info(f"Session cookies before request: {list(session.cookies.keys())}")
-
-            # 2. 获取 balance 页面
-            response = session.get(RedeemService.BALANCE_URL, timeout=30)
-
-            if response.status_code != 200:
-                logger.error(f"Get balance page failed: HTTP {response.status_code}")
-                return False, f"获取页面失败: HTTP {response.status_code}"
-
-            # 3. 记录响应的 cookies（调试用）
-            logger.info(f"Response cookies: {list(response.cookies.keys())}")
-            logger.info(f"Session cookies after request: {list(session.cookies.keys())}")
-
-            # 3.5 清理并更新重复的 cookies（修复 CSRF 验证失败问题）
-            # requests.Session 在收到 Set-Cookie 时会追加而不是替换，导致 cookies 重复
-            for cookie_name in ['XSRF-TOKEN', 'leaflow_session', 'shared_api_cookie']:
-                if cookie_name in response.cookies:
-                    # 遍历删除所有同名 cookie
-                    for cookie in list(session.cookies):
-                        if cookie.name == cookie_name:
-                            session.cookies.clear(cookie.domain, cookie.path, cookie.name)
-                    # 设置新的 cookie
-                    session.cookies.set(cookie_name, response.cookies[cookie_name], domain='leaflow.net')
-            logger.info(f"Session cookies after cleanup: {list(session.cookies.keys())}")
-
-            # 4. 解析 version
-            version = RedeemService._extract_version(response.text)
-            if not version:
-                logger.error("Cannot extract version from page")
-                return False, "无法获取页面版本信息"
-            logger.info(f"Got version: {version}")
-
-            # 5. 获取最新的 XSRF-TOKEN（必须从响应的 cookies 获取）
-            xsrf_token = response.cookies.get('XSRF-TOKEN')
-            if xsrf_token:
-                logger.info("Got XSRF-TOKEN from response cookies")
-            else:
-                # 如果响应中没有，从 session 获取
-                cookies_dict = session.cookies.get_dict()
-                xsrf_token = cookies_dict.get('XSRF-TOKEN')
-                if xsrf_token:
-                    logger.info("Got XSRF-TOKEN from session cookies dict")
-
-            if not xsrf_token:
-                logger.error("Cannot get XSRF-TOKEN")
-                return False, "无法获取 XSRF-TOKEN"
-
-            xsrf_token = unquote(xsrf_token)
-            logger.info(f"Using XSRF-TOKEN: {xsrf_token[:30]}...")
-
-            # 6. 发送兑换请求（使用 session 会自动携带更新后的 cookies）
-            headers = {
-                'x-inertia': 'true',
-                'x-inertia-version': version,
-                'x-xsrf-token': xsrf_token,
-                'x-requested-with': 'XMLHttpRequest',
-                'content-type': 'application/json',
-            }
-
+            # 1. 发送兑换请求（version 和 XSRF-TOKEN 由客户端缓存，过期或失效时自动握手）
             logger.info(f"Sending redeem request with code: {code}")
-            logger.info(f"Request headers: {headers}")
-
-            redeem_response = session.post(
+            redeem_response = leaflow_client.request(
+                session, 'POST',
                 RedeemService.REDEEM_URL,
-                headers=headers,
-                json={'code': code},
-                timeout=30
+                RedeemService.BALANCE_URL,
+                headers={'content-type': 'application/json'},
+                json={'code': code}
             )
             logger.info(f"Redeem response status: {redeem_response.status_code}")
 
-            # 7. 解析结果
+            # 2. 解析结果
             return RedeemService._parse_redeem_response(redeem_response.text)
 
+        except InertiaHandshakeError as e:
+            logger.error(f"Redeem handshake failed: {e}")
+            return False, str(e)
         except Exception as e:
             logger.error(f"Redeem code error: {e}")
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False, f"兑换失败: {str(e)}"
 
-    @staticmethod
-    def _extract_version(html_content):
-        """从响应中提取 version"""
-        try:
-            # 方法1: 从 data-page JSON 中提取
-            pattern = r'data-page="([^"]+)"'
-            match = re.search(pattern, html_content)
-            if match:
-                json_str = html.unescape(match.group(1))
-                data = json.loads(json_str)
-                if data.get('version'):
-                    return data['version']
-
-            # 方法2: 直接匹配 version 字段
-            version_pattern = r'"version"\s*:\s*"([a-f0-9]+)"'
-            match = re.search(version_pattern, html_content)
-            if match:
-                return match.group(1)
-
-            return None
-        except Exception as e:
-            logger.error(f"Extract version error: {e}")
-            return None
-
     @staticmethod
     def _parse_redeem_response(response_text):
         """解析兑换响应"""
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response classifier for Leaflow Auto Check-in Control Panel
+Scans an upstream response body once for every check-in signal
+"""
+
+import re
+from functools import cached_property
+
+
+# 信号 -> 关键词（大小写不敏感）
+SIGNAL_INDICATORS = {
+    'already_done': [
+        'already checked in', '今日已签到', 'checked in today',
+        'attendance recorded', '已完成签到', 'completed today',
+    ],
+    'checkin_page': ['check-in', 'checkin', '签到', 'attendance', 'daily'],
+    'success': [
+        'check-in successful', 'checkin successful', '签到成功',
+        'attendance recorded', 'earned reward', '获得奖励',
+        'success', '成功', 'completed',
+    ],
+    'authenticated': ['dashboard', 'profile', 'user', 'logout', 'welcome'],
+    'logout': ['logout'],
+    'login_form': ['type="password"', "type='password'", 'name="password"'],
+}
+
+CSRF_PATTERNS = [
+    re.compile(r'name=["\']_token["\'][^>]*value=["\']([^"\']+)["\']', re.IGNORECASE),
+    re.compile(r'name=["\']csrf_token["\'][^>]*value=["\']([^"\']+)["\']', re.IGNORECASE),
+    re.compile(r'<meta[^>]*name=["\']csrf-token["\'][^>]*content=["\']([^"\']+)["\']', re.IGNORECASE),
+]
+
+REWARD_PATTERNS = [
+    re.compile(r'获得奖励[^\d]*(\d+\.?\d*)\s*元', re.IGNORECASE),
+    re.compile(r'earned.*?(\d+\.?\d*)\s*(credits?|points?)', re.IGNORECASE),
+    re.compile(r'(\d+\.?\d*)\s*(credits?|points?|元)', re.IGNORECASE),
+]
+
+
+def _build_keyword_table(signal_indicators):
+    """
+    把各信号的关键词合并成一张去重的表（长词在前）
+
+    implied 记录命中某个关键词时同时成立的所有信号：短词是长词的子串时，
+    命中长词即可确定短词也存在，不必再扫描
+    """
+    keyword_signals = {}
+    for signal, keywords in signal_indicators.items():
+        for keyword in keywords:
+            keyword_signals.setdefault(keyword.lower(), set()).add(signal)
+
+    keywords = sorted(keyword_signals, key=len, reverse=True)
+
+    implied = {}
+    for keyword in keywords:
+        signals = set()
+        for other in keywords:
+            if other in keyword:
+                signals |= keyword_signals[other]
+        implied[keyword] = frozenset(signals)
+
+    return [(keyword, keyword_signals[keyword], implied[keyword]) for keyword in keywords]
+
+
+_KEYWORD_TABLE = _build_keyword_table(SIGNAL_INDICATORS)
+_ALL_SIGNALS = frozenset(SIGNAL_INDICATORS)
+
+
+class ResponseSignals:
+    """一次扫描的结果：命中的信号，按需提取 CSRF token 和奖励金额"""
+
+    def __init__(self, text, signals):
+        self.text = text
+        self.signals = signals
+
+    def has(self, signal):
+        return signal in self.signals
+
+    @cached_property
+    def csrf_token(self):
+        for pattern in CSRF_PATTERNS:
+            match = pattern.search(self.text)
+            if match:
+                return match.group(1)
+        return None
+
+    @cached_property
+    def reward(self):
+        for pattern in REWARD_PATTERNS:
+            match = pattern.search(self.text)
+            if match:
+                return match.group(1)
+        return None
+
+
+def classify_response(text):
+    """
+    扫描一次响应内容，返回命中的所有信号
+
+    只做一次 lower()，每个关键词最多查找一次，已确定的信号不再查找
+
+    Args:
+        text: 响应内容
+
+    Returns:
+        ResponseSignals
+    """
+    content = (text or '').lower()
+    signals = set()
+    for keyword, keyword_signals, implied in _KEYWORD_TABLE:
+        # 该关键词能带来的信号都已确定时跳过
+        if keyword_signals <= signals:
+            continue
+        if keyword in content:
+            signals |= implied
+            if len(signals) == len(_ALL_SIGNALS):
+                break
+    return ResponseSignals(text or '', frozenset(signals))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Retry policy for Leaflow Auto Check-in Control Panel
+Exponential backoff with jitter, configurable per error class
+"""
+
+import json
+import random
+
+from config import logger
+from .checkin_outcome import CheckinOutcome
+
+
+# 默认重试策略（按签到结果分类，见 CheckinOutcome）
+# max_retries 为 None 时使用全局签到设置中的 retry_count
+# 认证过期和解析失败重试无意义，默认不重试
+DEFAULT_RETRY_POLICIES = {
+    CheckinOutcome.AUTH_EXPIRED.value: {'max_retries': 0, 'base_delay': 30, 'max_delay': 600, 'multiplier': 2.0, 'jitter': 0.3},
+    CheckinOutcome.NETWORK.value: {'max_retries': None, 'base_delay': 15, 'max_delay': 600, 'multiplier': 2.0, 'jitter': 0.3},
+    CheckinOutcome.UPSTREAM_5XX.value: {'max_retries': None, 'base_delay': 60, 'max_delay': 1800, 'multiplier': 2.0, 'jitter': 0.3},
+    CheckinOutcome.RATE_LIMITED.value: {'max_retries': None, 'base_delay': 120, 'max_delay': 3600, 'multiplier': 2.0, 'jitter': 0.5},
+    CheckinOutcome.PARSE_FAILURE.value: {'max_retries': 0, 'base_delay': 10, 'max_delay': 300, 'multiplier': 2.0, 'jitter': 0.3},
+}
+
+POLICY_FIELDS = ('max_retries', 'base_delay', 'max_delay', 'multiplier', 'jitter')
+
+
+class RetryPolicy:
+    """单个错误类型的重试策略（指数退避 + 抖动）"""
+
+    def __init__(self, max_retries=None, base_delay=10, max_delay=300, multiplier=2.0, jitter=0.3):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def should_retry(self, attempt, default_max_retries):
+        """
+        判断是否还可以重试
+
+        Args:
+            attempt: 已经重试的次数（首次执行为 0）
+            default_max_retries: 策略未指定时使用的最大重试次数
+
+        Returns:
+            bool: 是否继续重试
+        """
+        max_retries = self.max_retries if self.max_retries is not None else default_max_retries
+        return attempt < max_retries
+
+    def next_delay(self, attempt):
+        """计算第 attempt 次失败后的等待秒数"""
+        delay = min(self.base_delay * (self.multiplier ** attempt), self.max_delay)
+        if self.jitter:
+            delay *= random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.0, delay)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in POLICY_FIELDS}
+
+
+def validate_policy_overrides(overrides):
+    """
+    校验用户提交的重试策略覆盖配置
+
+    Returns:
+        tuple: (valid: bool, error_msg: str | None)
+    """
+    if not isinstance(overrides, dict):
+        return False, '重试策略必须是对象'
+
+    for error_class, policy in overrides.items():
+        if error_class not in DEFAULT_RETRY_POLICIES:
+            return False, f'未知的错误类型: {error_class}'
+        if not isinstance(policy, dict):
+            return False, f'{error_class} 的策略必须是对象'
+
+        for field, value in policy.items():
+            if field not in POLICY_FIELDS:
+                return False, f'未知的策略字段: {field}'
+            if field == 'max_retries':
+                if value is not None and (not isinstance(value, int) or value < 0 or value > 5):
+                    return False, '重试次数必须在 0-5 之间'
+            elif not isinstance(value, (int, float)) or value < 0:
+                return False, f'{field} 必须是非负数'
+
+        if policy.get('jitter', 0) > 1:
+            return False, 'jitter 必须在 0-1 之间'
+        if policy.get('base_delay', 0) > 3600 or policy.get('max_delay', 0) > 3600:
+            return False, '重试间隔不能超过 3600 秒'
+
+    return True, None
+
+
+def load_retry_policies(raw_overrides=None):
+    """
+    合并默认策略与数据库中保存的覆盖配置
+
+    Args:
+        raw_overrides: JSON 字符串或 dict（来自 checkin_settings.retry_policy）
+
+    Returns:
+        dict: {error_class: RetryPolicy}
+    """
+    overrides = {}
+    if raw_overrides:
+        try:
+            overrides = json.loads(raw_overrides) if isinstance(raw_overrides, str) else dict(raw_overrides)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Invalid retry policy overrides ignored: {e}")
+            overrides = {}
+
+    policies = {}
+    for error_class, defaults in DEFAULT_RETRY_POLICIES.items():
+        merged = dict(defaults)
+        custom = overrides.get(error_class)
+        if isinstance(custom, dict):
+            merged.update({k: v for k, v in custom.items() if k in POLICY_FIELDS})
+        policies[error_class] = RetryPolicy(**merged)
+
+    return policies
@@ -4,17 +4,29 @@
 Scheduler service for Leaflow Auto Check-in Control Panel
 """
 
-import json
 import time
+import heapq
 import random
+import itertools
 import threading
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from config import logger, TIMEZONE
+from config import logger, TIMEZONE, CHECKIN_TIME_BUDGET
 from database import db, account_cache
 from .checkin_service import LeafLowCheckin
 from .notification_service import NotificationService
+from .checkin_outcome import CheckinOutcome, classify_exception
+from .circuit_breaker import CircuitOpenError
+from .deadline import Deadline
+from .health_service import AccountHealthService
+from .retry_policy import load_retry_policies
+from .warmup_service import CheckinWarmup
+from .checkin_planner import CheckinPlanner
+from .session_registry import session_registry
+from .single_flight import single_flight
+from .checkin_trace import CheckinTrace
+from .balance_snapshot_service import BalanceSnapshotService
 
 
 class CheckinScheduler:
@@ -24,12 +36,25 @@ class CheckinScheduler:
         self.scheduler_thread = None
         self.running = False
         self.leaflow_checkin = LeafLowCheckin()
+        self.warmup = CheckinWarmup(self.leaflow_checkin)
         self.checkin_tasks = {}
         self._cached_settings = None
         self._settings_cache_time = None
         # 余额定时刷新配置
         self.last_balance_refresh = None  # 上次刷新时间戳
-        self.balance_refresh_interval = 2 * 60 * 60  # 2小时（秒）
+        self.balance_refresh_interval = 2 * 60 * 60  # 基础刷新间隔 2小时（秒）
+        self.balance_refresh_tick = 5 * 60  # 每 5 分钟挑选一批到期账户
+        # 隔离账户探测检查（每小时检查一次，每个账户每天最多探测一次）
+        self.last_quarantine_probe = None
+        self.quarantine_probe_check_interval = 60 * 60
+        # 余额快照降采样（每小时一次）
+        self.last_snapshot_downsample = None
+        self.snapshot_downsample_interval = 60 * 60
+        # 延迟重试队列: (due_timestamp, seq, job)
+        self._retry_queue = []
+        self._retry_seq = itertools.count()
+        self._retry_lock = threading.Lock()
+        self._wakeup = threading.Event()
 
     def _get_checkin_settings(self):
         """Get global checkin settings with cache"""
@@ -49,9 +74,55 @@ class CheckinScheduler:
             'checkin_time': '05:30',
             'retry_count': 2,
             'random_delay_min': 0,
-            'random_delay_max': 30
+            'random_delay_max': 30,
+            'warmup_minutes': 0,
+            'spread_minutes': 0,
+            'inline_auth': 0
         }
 
+    def _get_retry_policy(self, error_class):
+        """Get retry policy for an error class (merged with settings overrides)"""
+        settings = self._get_checkin_settings()
+        policies = load_retry_policies(settings.get('retry_policy'))
+        return policies.get(error_class) or policies[CheckinOutcome.NETWORK.value]
+
+    def _schedule_retry(self, account_id, attempt, delay, task_key=None):
+        """Put a check-in retry back on the scheduler as a delayed job"""
+        due = time.time() + delay
+        job = {'account_id': account_id, 'attempt': attempt, 'task_key': task_key}
+        with self._retry_lock:
+            heapq.heappush(self._retry_queue, (due, next(self._retry_seq), job))
+        self._wakeup.set()
+
+    def _run_due_retries(self):
+        """Dispatch retry jobs whose backoff has expired"""
+        now = time.time()
+        due_jobs = []
+        with self._retry_lock:
+            while self._retry_queue and self._retry_queue[0][0] <= now:
+                due_jobs.append(heapq.heappop(self._retry_queue)[2])
+
+        for job in due_jobs:
+            threading.Thread(target=self._run_retry_job, args=(job,), daemon=True).start()
+
+    def _run_retry_job(self, job):
+        """Execute one delayed retry"""
+        try:
+            success = self.perform_checkin(job['account_id'], job['attempt'], job['task_key'])
+            task_key = job['task_key']
+            if task_key and task_key in self.checkin_tasks:
+                self.checkin_tasks[task_key]['completed'] = success
+        except Exception as e:
+            logger.error(f"Retry job error for account {job['account_id']}: {e}")
+            logger.error(traceback.format_exc())
+
+    def _next_wakeup_delay(self, default=30):
+        """Seconds until the next loop iteration (earliest retry or default)"""
+        with self._retry_lock:
+            if not self._retry_queue:
+                return default
+            return max(0.0, min(default, self._retry_queue[0][0] - time.time()))
+
     def start(self):
         """Start the scheduler"""
         if not self.running:
@@ -63,8 +134,10 @@ class CheckinScheduler:
     def stop(self):
         """Stop the scheduler"""
         self.running = False
+        self._wakeup.set()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+        session_registry.flush(db)
         logger.info("Scheduler stopped")
 
     def _run_scheduler(self):
@@ -83,25 +156,36 @@ class CheckinScheduler:
                     else:
                         accounts = []
 
+                # 每个账户当天的计划签到时间（自定义窗口或全局时间 + 分散区间）
+                # 按所有启用且未隔离的账户规划，已签到的账户只在下面跳过，
+                # 这样签到成功后其余账户的计划时间不会前移（与 schedule-preview 一致）
+                settings = self._get_checkin_settings()
+                plan = CheckinPlanner.plan(
+                    [account for account in accounts if not account.get('quarantined')], settings, now
+                )
+                pending_accounts = self._pending_checkin_accounts(accounts, current_date)
+
+                # 签到窗口开启前的预热阶段（以最早的计划时间为准）
+                warmup_minutes = settings.get('warmup_minutes') or 0
+                if warmup_minutes and plan and pending_accounts:
+                    first_slot = min(plan.values())
+                    if first_slot - timedelta(minutes=warmup_minutes) <= now < first_slot:
+                        self.warmup.start(pending_accounts, current_date)
+
                 for account in accounts:
                     try:
                         account_id = account['id']
 
-                        last_checkin_date = account.get('last_checkin_date')
-                        if last_checkin_date:
-                            if isinstance(last_checkin_date, str):
-                                last_checkin_date = datetime.strptime(last_checkin_date, '%Y-%m-%d').date()
-                            if last_checkin_date == current_date:
-                                continue
-
-                        # Use global checkin settings
-                        settings = self._get_checkin_settings()
-                        checkin_time_str = settings.get('checkin_time', '05:30')
-                        checkin_hour, checkin_minute = map(int, checkin_time_str.split(':'))
-                        checkin_time = now.replace(hour=checkin_hour, minute=checkin_minute, second=0, microsecond=0)
-
-                        # Check if current time is past the checkin time
-                        if now >= checkin_time:
+                        # 隔离账户不参与定时签到
+                        if account.get('quarantined'):
+                            continue
+
+                        if self._checked_in_on(account, current_date):
+                            continue
+
+                        # Check if current time is past the account's planned checkin time
+                        planned_at = plan.get(account_id)
+                        if planned_at and now >= planned_at:
                             task_key = f"{account_id}_{current_date}"
 
                             if task_key not in self.checkin_tasks:
@@ -132,14 +216,43 @@ class CheckinScheduler:
                 for key in expired_keys:
                     del self.checkin_tasks[key]
 
-                # 每2小时刷新所有账号余额
+                # 按数据新鲜度分批刷新余额
                 self._periodic_balance_refresh()
 
+                # 余额快照降采样
+                self._periodic_snapshot_downsample()
+
+                # 探测隔离账户是否恢复
+                self._periodic_quarantine_probe()
+
+                # 批量写回服务端轮换的 cookie
+                session_registry.flush_if_due(db)
+
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
                 logger.error(traceback.format_exc())
 
-            time.sleep(30)
+            # 等待下一轮，有更早到期的重试任务时提前唤醒
+            self._wakeup.wait(self._next_wakeup_delay())
+            self._wakeup.clear()
+            self._run_due_retries()
+
+    @staticmethod
+    def _checked_in_on(account, date):
+        """Whether the cached account row shows a check-in on the given date"""
+        last_checkin_date = account.get('last_checkin_date')
+        if last_checkin_date:
+            if isinstance(last_checkin_date, str):
+                last_checkin_date = datetime.strptime(last_checkin_date, '%Y-%m-%d').date()
+            return last_checkin_date == date
+        return False
+
+    def _pending_checkin_accounts(self, accounts, date):
+        """Accounts that still need a scheduled check-in on the given date"""
+        return [
+            account for account in accounts
+            if not account.get('quarantined') and not self._checked_in_on(account, date)
+        ]
 
     def perform_checkin_with_delay(self, account_id, task_key):
         """Perform check-in with random delay"""
@@ -152,7 +265,7 @@ class CheckinScheduler:
             logger.info(f"Account {account_id} waiting {delay}s before checkin (range: {delay_min}-{delay_max}s)")
             time.sleep(delay)
 
-            success = self.perform_checkin(account_id)
+            success = self.perform_checkin(account_id, task_key=task_key)
 
             if task_key in self.checkin_tasks:
                 self.checkin_tasks[task_key]['completed'] = success
@@ -161,8 +274,39 @@ class CheckinScheduler:
             logger.error(f"Checkin with delay error: {e}")
             logger.error(traceback.format_exc())
 
-    def perform_checkin(self, account_id, retry_attempt=0):
-        """Perform check-in for an account with retry mechanism"""
+    def perform_checkin(self, account_id, retry_attempt=0, task_key=None):
+        """
+        Perform check-in for an account.
+
+        Concurrent check-ins of the same account (scheduled, retry or manual)
+        share one run and its result.
+        """
+        return single_flight.do(
+            ('checkin', account_id), self._perform_checkin, account_id, retry_attempt, task_key
+        )
+
+    def trigger_checkin(self, account_id):
+        """
+        Start a check-in in the background, or return the one already running.
+
+        Returns:
+            tuple: (job, started: bool)
+        """
+        return single_flight.spawn(('checkin', account_id), self._perform_checkin, account_id)
+
+    def _perform_checkin(self, account_id, retry_attempt=0, task_key=None):
+        """Run the check-in pipeline for an account, recording per-phase timings"""
+        trace = CheckinTrace()
+        with trace.active():
+            return self._run_checkin(account_id, retry_attempt, task_key, trace)
+
+    def _run_checkin(self, account_id, retry_attempt, task_key, trace):
+        """
+        Check-in pipeline: session, authentication, check-in, DB writes, balance refresh.
+
+        On failure the retry is scheduled as a delayed job (exponential backoff
+        with jitter per error class) instead of blocking the current thread.
+        """
         try:
             account = db.fetchone('SELECT * FROM accounts WHERE id = ?', (account_id,))
             if not account or not account.get('enabled'):
@@ -179,29 +323,62 @@ class CheckinScheduler:
                 logger.info(f"Account {account['name']} already checked in today")
                 return True
 
-            token_data = json.loads(account['token_data'])
+            trace.lap('db')
+
+            # 整个签到流程（认证、签到、余额刷新）共用一个时间预算
+            deadline = Deadline(CHECKIN_TIME_BUDGET)
 
-            session = self.leaflow_checkin.create_session(token_data)
+            # 预热阶段的结果：已验证的会话直接签到，认证失效的账户不再发请求
+            warm_state, warm_value = self.warmup.take(account_id, current_date)
 
-            auth_result = self.leaflow_checkin.test_authentication(session, account['name'])
-            if not auth_result[0]:
+            if warm_state == 'flagged':
+                session = None
+                auth_valid, auth_message, auth_outcome = False, f"{warm_value} (warm-up)", CheckinOutcome.AUTH_EXPIRED
+            elif warm_state == 'valid':
+                session = warm_value
+                auth_valid, auth_message, auth_outcome = True, "Authentication verified in warm-up", None
+            else:
+                session = session_registry.get(account)
+                trace.lap('session')
+                if self._get_checkin_settings().get('inline_auth'):
+                    # 由签到请求的响应判断认证状态，省去单独的认证探测
+                    auth_valid, auth_message, auth_outcome = True, "Authentication inferred from checkin response", None
+                else:
+                    auth_valid, auth_message, auth_outcome = self.leaflow_checkin.test_authentication(
+                        session, account['name'], deadline
+                    )
+            trace.lap('auth')
+
+            strategy = None
+            checkin_submitted = None
+            if not auth_valid:
                 success = False
-                message = f"Authentication failed: {auth_result[1]}"
+                message = f"Authentication failed: {auth_message}"
+                outcome = auth_outcome
             else:
-                success, message = self.leaflow_checkin.perform_checkin(session, account['name'])
+                success, message, outcome, strategy, checkin_submitted = self.leaflow_checkin.perform_checkin(
+                    session, account['name'], deadline, preferred=account.get('checkin_strategy')
+                )
+                # 记住本账户成功的签到方式，下次优先尝试（已签到不算该方式成功）
+                if outcome == CheckinOutcome.SUCCESS and strategy != account.get('checkin_strategy'):
+                    db.execute('UPDATE accounts SET checkin_strategy = ? WHERE id = ?', (strategy, account_id))
+            trace.lap('checkin')
+
+            # 自定义窗口账户的 check_interval 作为重试的最小间隔
+            min_retry_delay = (account.get('check_interval') or 0) if account.get('custom_window') else 0
+
+            if not success and self._maybe_schedule_retry(account_id, account['name'], retry_attempt, outcome, task_key,
+                                                           min_delay=min_retry_delay):
+                return False
 
-            # Use global settings for retry count
-            settings = self._get_checkin_settings()
-            retry_count = settings.get('retry_count', 2)
-            if not success and retry_attempt < retry_count:
-                logger.info(f"Retrying checkin for {account['name']} (attempt {retry_attempt + 1}/{retry_count})")
-                time.sleep(5)
-                return self.perform_checkin(account_id, retry_attempt + 1)
+            cursor = db.execute('''
+                INSERT INTO checkin_history (account_id, success, message, checkin_date, retry_times, outcome)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (account_id, success, message, current_date, retry_attempt, outcome.value))
+            history_id = cursor.lastrowid if cursor is not None else None
 
-            db.execute('''
-                INSERT INTO checkin_history (account_id, success, message, checkin_date, retry_times)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (account_id, success, message, current_date, retry_attempt))
+            if AccountHealthService.record_outcome(db, account_id, account['name'], outcome):
+                account_cache.refresh_from_db(db)
 
             if success:
                 db.execute('''
@@ -209,9 +386,12 @@ class CheckinScheduler:
                     WHERE id = ?
                 ''', (current_date, account_id))
                 account_cache.refresh_from_db(db)
+            trace.lap('db')
 
+            if success:
                 # 签到成功后刷新余额信息
-                self._refresh_balance_after_checkin(session, account_id, account['name'])
+                self._refresh_balance_after_checkin(session, account_id, account['name'], deadline, checkin_submitted)
+                trace.lap('balance')
 
             logger.info(f"Check-in for {account['name']}: {'Success' if success else 'Failed'} - {message}")
 
@@ -219,13 +399,29 @@ class CheckinScheduler:
             status_emoji = '✅' if success else '❌'
             notification_content = f"状态: {status_emoji} {'成功' if success else '失败'}\n消息: {message}\n重试次数: {retry_attempt}"
             NotificationService.send_notification(notification_title, notification_content, account['name'])
+            trace.lap('notify')
 
+            self._save_checkin_timings(history_id, account_id, trace, strategy if success else None)
             return success
 
+        except CircuitOpenError as e:
+            # 上游熔断中：推迟本次签到，不消耗重试次数；加入抖动避免恢复时集中请求
+            delay = e.retry_after + random.uniform(0, 30)
+            logger.info(f"{e}; deferring checkin for account {account_id} by {delay:.0f}s")
+            self._schedule_retry(account_id, retry_attempt, delay, task_key)
+            return False
+
         except Exception as e:
             logger.error(f"Check-in error for account {account_id}: {e}")
             logger.error(traceback.format_exc())
 
+            try:
+                outcome = classify_exception(e)
+                if self._maybe_schedule_retry(account_id, f"account {account_id}", retry_attempt, outcome, task_key):
+                    return False
+            except Exception:
+                pass
+
             try:
                 account = db.fetchone('SELECT name FROM accounts WHERE id = ?', (account_id,))
                 if account:
@@ -239,68 +435,139 @@ class CheckinScheduler:
 
             return False
 
-    def _refresh_balance_after_checkin(self, session, account_id, account_name):
-        """签到成功后刷新余额（不影响签到流程）"""
+    def _save_checkin_timings(self, history_id, account_id, trace, endpoint):
+        """把阶段耗时和成功的签到方式写入本次签到的历史记录（不影响签到结果）"""
+        if not history_id:
+            return
+        try:
+            db.execute(
+                'UPDATE checkin_history SET timings = ?, endpoint = ? WHERE id = ?',
+                (trace.to_json(), endpoint, history_id)
+            )
+        except Exception as e:
+            logger.error(f"Save checkin timings error for account {account_id}: {e}")
+
+    def _maybe_schedule_retry(self, account_id, account_name, retry_attempt, outcome, task_key, min_delay=0):
+        """Schedule a delayed retry if the outcome's policy allows, return True when scheduled"""
+        # Use global settings for retry count
+        settings = self._get_checkin_settings()
+        retry_count = settings.get('retry_count', 2)
+        policy = self._get_retry_policy(outcome.value)
+
+        if not policy.should_retry(retry_attempt, retry_count):
+            logger.info(f"No more retries for {account_name} ({outcome.value})")
+            return False
+
+        delay = max(policy.next_delay(retry_attempt), min_delay)
+        logger.info(
+            f"Scheduling checkin retry for {account_name} in {delay:.1f}s "
+            f"(attempt {retry_attempt + 1}, {outcome.value})"
+        )
+        self._schedule_retry(account_id, retry_attempt + 1, delay, task_key)
+        return True
+
+    def _refresh_balance_after_checkin(self, session, account_id, account_name, deadline=None, seen_since=None):
+        """签到成功后刷新余额（签到响应中已带有余额时跳过，不影响签到流程）"""
         try:
             from .balance_service import BalanceService
-            BalanceService.refresh_account_balance(db, session, account_id, account_name)
+            if deadline and deadline.expired:
+                logger.info(f"[{account_name}] Skipping balance refresh after checkin, time budget exhausted")
+                return
+            BalanceService.refresh_account_balance(db, session, account_id, account_name, deadline, seen_since)
         except Exception as e:
             # 余额刷新失败不影响签到结果
             logger.error(f"[{account_name}] Balance refresh error after checkin: {e}")
 
     def _periodic_balance_refresh(self):
-        """定期刷新所有账号余额（每2小时）"""
+        """定期刷新余额：每轮只刷新到期的账户，分散在整个刷新间隔内"""
         now = time.time()
 
-        # 检查是否到达刷新时间
-        if self.last_balance_refresh and (now - self.last_balance_refresh) < self.balance_refresh_interval:
+        if self.last_balance_refresh and (now - self.last_balance_refresh) < self.balance_refresh_tick:
             return
 
         self.last_balance_refresh = now
-        logger.info("Starting periodic balance refresh for all accounts...")
 
         # 在后台线程中执行，避免阻塞主调度器
-        threading.Thread(target=self._refresh_all_balances, daemon=True).start()
+        threading.Thread(target=self._refresh_stale_balances, daemon=True).start()
 
-    def _refresh_all_balances(self):
-        """刷新所有启用账号的余额"""
-        from .balance_service import BalanceService
+    def _refresh_stale_balances(self):
+        """刷新余额已过期的启用账号"""
+        from .balance_refresh import balance_refresh, BalanceRefreshPolicy
 
         try:
-            accounts = db.fetchall('SELECT * FROM accounts WHERE enabled = 1')
+            previous = balance_refresh.latest('periodic')
+            if previous and previous.running:
+                return
 
-            if not accounts:
-                logger.info("No enabled accounts to refresh balance")
+            accounts = db.fetchall('SELECT * FROM accounts WHERE enabled = 1 AND quarantined = 0')
+            due = BalanceRefreshPolicy.select_due(
+                accounts, datetime.now(TIMEZONE), self.balance_refresh_interval, self.balance_refresh_tick
+            )
+
+            if not due:
                 return
 
-            success_count = 0
-            fail_count = 0
+            logger.info(f"Refreshing balance for {len(due)}/{len(accounts)} stale accounts...")
+            job = balance_refresh.run(due, source='periodic')
+            logger.info(f"Periodic balance refresh completed: {job.success} success, {job.failed} failed")
 
-            for account in accounts:
-                try:
-                    token_data = json.loads(account['token_data'])
-                    session = self.leaflow_checkin.create_session(token_data)
+        except Exception as e:
+            logger.error(f"Refresh stale balances error: {e}")
+            logger.error(traceback.format_exc())
 
-                    success, _ = BalanceService.refresh_account_balance(
-                        db, session, account['id'], account['name']
-                    )
+    def _periodic_snapshot_downsample(self):
+        """定期把旧的余额快照合并为小时/天桶"""
+        now = time.time()
 
-                    if success:
-                        success_count += 1
-                    else:
-                        fail_count += 1
+        if self.last_snapshot_downsample and (now - self.last_snapshot_downsample) < self.snapshot_downsample_interval:
+            return
 
-                    # 每个账号间随机等待 500-1500ms，避免请求过快
-                    time.sleep(random.uniform(0.5, 1.5))
+        self.last_snapshot_downsample = now
+        threading.Thread(target=self._downsample_snapshots, daemon=True).start()
 
+    def _downsample_snapshots(self):
+        try:
+            BalanceSnapshotService.downsample(db)
+        except Exception as e:
+            logger.error(f"Downsample balance snapshots error: {e}")
+
+    def _periodic_quarantine_probe(self):
+        """定期探测隔离账户（每个账户每天一次）"""
+        now = time.time()
+
+        if self.last_quarantine_probe and (now - self.last_quarantine_probe) < self.quarantine_probe_check_interval:
+            return
+
+        self.last_quarantine_probe = now
+        threading.Thread(target=self._probe_quarantined_accounts, daemon=True).start()
+
+    def _probe_quarantined_accounts(self):
+        """对到期的隔离账户发起一次轻量探测"""
+        try:
+            accounts = AccountHealthService.get_probe_candidates(db)
+            if not accounts:
+                return
+
+            logger.info(f"Probing {len(accounts)} quarantined accounts...")
+            recovered = 0
+
+            for account in accounts:
+                try:
+                    session = session_registry.get(account)
+                    if AccountHealthService.probe(db, session, account):
+                        recovered += 1
+                except CircuitOpenError as e:
+                    logger.warning(f"Quarantine probe stopped: {e}")
+                    break
                 except Exception as e:
-                    fail_count += 1
-                    logger.error(f"Refresh balance error for {account['name']}: {e}")
+                    logger.error(f"Quarantine probe error for {account['name']}: {e}")
 
-            logger.info(f"Periodic balance refresh completed: {success_count} success, {fail_count} failed")
+            if recovered:
+                account_cache.refresh_from_db(db)
+            logger.info(f"Quarantine probe completed: {recovered}/{len(accounts)} recovered")
 
         except Exception as e:
-            logger.error(f"Refresh all balances error: {e}")
+            logger.error(f"Probe quarantined accounts error: {e}")
             logger.error(traceback.format_exc())
 
 
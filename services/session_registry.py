@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Account session registry for Leaflow Auto Check-in Control Panel
+Keeps one long-lived session per account and writes rotated cookies back
+"""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+
+from config import logger
+from .checkin_service import LeafLowCheckin
+from .balance_service import BalanceService
+
+
+class AccountSessionRegistry:
+    """
+    按账户缓存 requests.Session（LRU 淘汰）
+
+    服务端通过 Set-Cookie 轮换的 cookie 会保留在 session 中，
+    并定期批量写回 accounts.token_data
+    """
+
+    def __init__(self, max_sessions=500, flush_interval=60):
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self.leaflow_checkin = LeafLowCheckin()
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()  # account_id -> entry
+        self.dirty = {}                # account_id -> entry（等待写回）
+        self.last_flush = time.time()
+        self.stats = {'created': 0, 'reused': 0, 'evicted': 0, 'written_back': 0}
+
+    def get(self, account):
+        """
+        获取账户的 session，token_data 被用户修改过时重新创建
+
+        Args:
+            account: 包含 id 和 token_data 的账户记录
+        """
+        account_id = account['id']
+        token_data = account['token_data']
+
+        with self.lock:
+            entry = self.sessions.get(account_id)
+            # known 包含创建时和写回过的 token_data，缓存中的旧记录不会触发重建
+            if entry and token_data in entry['known']:
+                self.sessions.move_to_end(account_id)
+                self.stats['reused'] += 1
+                return entry['session']
+
+        entry = self._create_entry(account_id, token_data)
+
+        with self.lock:
+            self.sessions[account_id] = entry
+            self.sessions.move_to_end(account_id)
+            self.dirty.pop(account_id, None)
+            self.stats['created'] += 1
+            while len(self.sessions) > self.max_sessions:
+                # 被淘汰的 session 如有未写回的 cookie，仍保留在 dirty 中等待写回
+                self.sessions.popitem(last=False)
+                self.stats['evicted'] += 1
+
+        return entry['session']
+
+    def _create_entry(self, account_id, token_data):
+        parsed = json.loads(token_data)
+        session = self.leaflow_checkin.create_session(parsed)
+        entry = {
+            'account_id': account_id,
+            'session': session,
+            'token_data': parsed,
+            'known': [token_data],
+        }
+
+        def mark_rotated(response, *args, **kwargs):
+            if response.cookies:
+                with self.lock:
+                    self.dirty[account_id] = entry
+            return response
+
+        session.hooks['response'].append(mark_rotated)
+        # 页面中带有用户数据时顺带更新余额，省去单独的余额请求
+        session.hooks['response'].append(BalanceService.observer(account_id))
+        return entry
+
+    def invalidate(self, account_id):
+        """丢弃账户的 session（修改或删除账户时调用）"""
+        with self.lock:
+            self.sessions.pop(account_id, None)
+            self.dirty.pop(account_id, None)
+
+    def _discard(self, entry):
+        """丢弃指定的 session 记录（账户已换用新 session 时不受影响）"""
+        account_id = entry['account_id']
+        with self.lock:
+            if self.sessions.get(account_id) is entry:
+                del self.sessions[account_id]
+            if self.dirty.get(account_id) is entry:
+                del self.dirty[account_id]
+
+    def flush_if_due(self, db):
+        if time.time() - self.last_flush >= self.flush_interval:
+            self.flush(db)
+
+    def _persisted_cookies(self, jar):
+        """
+        session 中需要写回的 cookie
+
+        导入的无域名 cookie（已随轮换同步）原样写回；新出现的 cookie 只写回
+        发往主站的那些，并在 cookie_domains 中记录域名，其他子域的同名
+        cookie 不会覆盖导入的值
+
+        Returns:
+            tuple: ({name: value}, {name: domain})
+        """
+        host = self.leaflow_checkin.main_host
+        cookies = {cookie.name: cookie.value for cookie in jar if not cookie.domain}
+        domains = {}
+        for cookie in jar:
+            if cookie.name in cookies or not LeafLowCheckin.cookie_matches_host(cookie, host):
+                continue
+            cookies[cookie.name] = cookie.value
+            domains[cookie.name] = cookie.domain
+        return cookies, domains
+
+    def flush(self, db):
+        """把轮换过的 cookie 批量写回 token_data"""
+        with self.lock:
+            pending = list(self.dirty.values())
+            self.dirty = {}
+            self.last_flush = time.time()
+
+        written = 0
+        for entry in pending:
+            try:
+                cookies, domains = self._persisted_cookies(entry['session'].cookies)
+                if cookies == entry['token_data'].get('cookies') and domains == (entry['token_data'].get('cookie_domains') or {}):
+                    continue
+
+                token_data = dict(entry['token_data'], cookies=cookies)
+                token_data.pop('cookie_domains', None)
+                if domains:
+                    token_data['cookie_domains'] = domains
+                serialized = json.dumps(token_data)
+                # 只覆盖本 session 已知的 token_data，期间用户更新过 Cookie 则跳过
+                cursor = db.execute(
+                    'UPDATE accounts SET token_data = ? WHERE id = ? AND token_data = ?',
+                    (serialized, entry['account_id'], entry['known'][-1])
+                )
+                if cursor is None or cursor.rowcount != 1:
+                    # 数据库中的 token_data 已被修改（或账户已删除），丢弃旧 session，下次按新数据重建
+                    self._discard(entry)
+                    logger.info(f"Account {entry['account_id']} token_data changed, skipped cookie write-back")
+                    continue
+
+                with self.lock:
+                    entry['token_data'] = token_data
+                    entry['known'] = (entry['known'] + [serialized])[-3:]
+                written += 1
+            except Exception as e:
+                logger.error(f"Write back cookies for account {entry['account_id']} error: {e}")
+
+        if written:
+            with self.lock:
+                self.stats['written_back'] += written
+            logger.info(f"Wrote back rotated cookies for {written} accounts")
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, cached=len(self.sessions), pending_write_back=len(self.dirty))
+
+
+# 全局账户 session 注册表
+session_registry = AccountSessionRegistry()
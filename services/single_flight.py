@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing for Leaflow Auto Check-in Control Panel
+Concurrent callers of the same (operation, account) share one upstream call
+"""
+
+import time
+import uuid
+import threading
+
+from config import logger
+
+
+class FlightTimeout(Exception):
+    """等待进行中的调用超时"""
+
+
+class _Call:
+    """一次进行中的调用"""
+
+    def __init__(self, key):
+        self.key = key
+        self.job_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'operation': self.key[0],
+            'account_id': self.key[1],
+            'started_at': self.started_at,
+            'waiters': self.waiters,
+        }
+
+
+class SingleFlight:
+    """
+    按 (operation, account_id) 合并并发调用
+
+    同一个 key 正在执行时，后来的调用者等待并共享同一个结果（或异常），
+    不会再发出新的上游请求
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        执行或加入 key 对应的调用
+
+        Args:
+            key: (operation, account_id)
+            timeout: 加入进行中的调用时最长等待秒数
+
+        Raises:
+            FlightTimeout: 等待进行中的调用超时
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self.calls[key] = _Call(key)
+                leader = True
+
+        if leader:
+            self._run(call, fn, args, kwargs)
+        elif not call.done.wait(timeout):
+            raise FlightTimeout(f"{key[0]} for account {key[1]} still in progress")
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def spawn(self, key, fn, *args, **kwargs):
+        """
+        在后台线程中执行，key 已在执行时直接返回进行中的调用
+
+        Returns:
+            tuple: (call, started: bool)
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                return call, False
+            call = self.calls[key] = _Call(key)
+
+        threading.Thread(target=self._run, args=(call, fn, args, kwargs), daemon=True).start()
+        return call, True
+
+    def _run(self, call, fn, args, kwargs):
+        try:
+            call.result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            with self.lock:
+                self.calls.pop(call.key, None)
+            call.done.set()
+            if call.waiters:
+                logger.info(f"{call.key[0]} for account {call.key[1]} shared with {call.waiters} callers")
+
+    def get(self, key):
+        with self.lock:
+            return self.calls.get(key)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'in_flight': [call.to_dict() for call in self.calls.values()],
+                'coalesced': self.coalesced,
+            }
+
+
+# 全局单飞实例
+single_flight = SingleFlight()
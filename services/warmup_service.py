@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pre-flight warm-up service for Leaflow Auto Check-in Control Panel
+Resolves upstream hosts, opens keep-alive connections and validates
+account sessions before the daily check-in window opens
+"""
+
+import time
+import socket
+import threading
+from urllib.parse import urlparse
+
+from config import logger
+from .balance_service import BalanceService
+from .circuit_breaker import CircuitOpenError, guarded_request
+from .inertia_page import read_data_page
+from .session_registry import session_registry
+
+
+class CheckinWarmup:
+    """签到窗口前的预热阶段"""
+
+    # 认证失效的判断依据（余额页的解析结果）
+    DEAD_SESSION_MESSAGES = ('User data not found',)
+
+    def __init__(self, leaflow_checkin):
+        self.leaflow_checkin = leaflow_checkin
+        self.lock = threading.Lock()
+        self.date = None          # 最近一次预热的日期
+        self.running = False
+        self.sessions = {}        # account_id -> 已验证的 session
+        self.flagged = {}         # account_id -> 认证失效原因
+        self.stats = {}
+
+    def start(self, accounts, date):
+        """为当天启动一次预热（同一天只执行一次）"""
+        with self.lock:
+            if self.date == date or self.running:
+                return
+            self.date = date
+            self.running = True
+            self.sessions = {}
+            self.flagged = {}
+
+        threading.Thread(target=self._run, args=(accounts,), daemon=True).start()
+
+    def _run(self, accounts):
+        started = time.time()
+        valid = flagged = unknown = 0
+        try:
+            hosts = [urlparse(url).hostname for url in (self.leaflow_checkin.main_site, self.leaflow_checkin.checkin_url)]
+            # 只提前发现 DNS 故障（并预热系统解析缓存），连接复用靠下面建立的长连接
+            for host in hosts:
+                try:
+                    socket.getaddrinfo(host, 443, 0, socket.SOCK_STREAM)
+                except OSError as e:
+                    logger.warning(f"Warm-up DNS resolve failed for {host}: {e}")
+
+            logger.info(f"Check-in warm-up started for {len(accounts)} accounts")
+
+            for account in accounts:
+                try:
+                    state = self._warm_account(account)
+                except CircuitOpenError as e:
+                    logger.warning(f"Warm-up stopped: {e}")
+                    break
+                except Exception as e:
+                    logger.debug(f"Warm-up error for {account['name']}: {e}")
+                    state = None
+
+                if state is True:
+                    valid += 1
+                elif state is False:
+                    flagged += 1
+                else:
+                    unknown += 1
+
+            logger.info(
+                f"Check-in warm-up completed in {time.time() - started:.1f}s: "
+                f"{valid} valid, {flagged} flagged, {unknown} unknown"
+            )
+
+        finally:
+            with self.lock:
+                self.running = False
+                self.stats = {
+                    'date': str(self.date),
+                    'duration': round(time.time() - started, 2),
+                    'valid': valid,
+                    'flagged': flagged,
+                    'unknown': unknown,
+                }
+
+    def _warm_account(self, account):
+        """
+        验证单个账户的会话，同时为两个上游建立长连接
+
+        Returns:
+            bool | None: True 有效，False 认证失效，None 无法判断
+        """
+        from database import db
+
+        session = session_registry.get(account)
+
+        # 唯一的验证请求：余额页（同时顺便更新余额）
+        response = guarded_request(session, 'GET', BalanceService.BALANCE_URL, timeout=30, stream=True)
+        if response.status_code in (401, 419) or 'login' in response.url.lower():
+            response.close()
+            return self._flag(account, f"HTTP {response.status_code} / login redirect")
+        if response.status_code != 200:
+            response.close()
+            return None
+
+        success, result = BalanceService.parse_data_page(read_data_page(response))
+        if not success:
+            if any(result.startswith(msg) for msg in self.DEAD_SESSION_MESSAGES):
+                return self._flag(account, result)
+            return None
+
+        BalanceService.save_balance_info(db, account['id'], result)
+
+        # 打开签到站点的长连接，窗口开启时直接复用
+        try:
+            guarded_request(session, 'HEAD', self.leaflow_checkin.checkin_url, timeout=10)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.debug(f"Warm-up connection to checkin host failed for {account['name']}: {e}")
+
+        with self.lock:
+            self.sessions[account['id']] = session
+        return True
+
+    def _flag(self, account, reason):
+        logger.warning(f"[{account['name']}] Warm-up: session is not authenticated ({reason})")
+        with self.lock:
+            self.flagged[account['id']] = reason
+        return False
+
+    def take(self, account_id, date):
+        """
+        取出账户的预热结果（仅当天有效，取出后即清除）
+
+        Returns:
+            tuple: ('valid', session) | ('flagged', reason) | (None, None)
+        """
+        with self.lock:
+            if self.date != date:
+                return None, None
+            if account_id in self.flagged:
+                return 'flagged', self.flagged.pop(account_id)
+            if account_id in self.sessions:
+                return 'valid', self.sessions.pop(account_id)
+            return None, None
+
+    def status(self):
+        with self.lock:
+            return {
+                'date': str(self.date) if self.date else None,
+                'running': self.running,
+                'pending_sessions': len(self.sessions),
+                'flagged_accounts': list(self.flagged.keys()),
+                'last_run': self.stats,
+            }
@@ -318,6 +318,12 @@
                             todayCheckinHtml = `<span class="badge badge-secondary clickable" onclick="showCheckinHistory(${account.id}, '${account.name}')">未签到</span>`;
                         }
 
+                        // 隔离状态：点击解除隔离
+                        if (account.quarantined) {
+                            const healthTitle = `健康度: ${account.health_score ?? '-'}，连续认证失败 ${account.consecutive_auth_failures || 0} 次，点击解除隔离`;
+                            todayCheckinHtml += ` <span class="badge badge-warning clickable" onclick="releaseQuarantine(${account.id})" title="${healthTitle}">已隔离</span>`;
+                        }
+
                         // 基础信息列
                         let basicInfoHtml = '';
                         if (account.leaflow_email) {
@@ -495,11 +501,27 @@
         }
 
 
+        async function releaseQuarantine(id) {
+            if (!confirm('确定解除该账号的隔离状态吗？解除后将恢复定时签到和余额刷新。')) {
+                return;
+            }
+            try {
+                await apiCall(`/api/accounts/${id}`, {
+                    method: 'PUT',
+                    body: JSON.stringify({ quarantined: false })
+                });
+                showToast('已解除隔离', 'success');
+                loadAccounts();
+            } catch (error) {
+                showToast('操作失败: ' + error.message, 'error');
+            }
+        }
+
         async function manualCheckin(id) {
             if (confirm('确定立即执行签到吗？')) {
                 try {
-                    await apiCall(`/api/checkin/manual/${id}`, { method: 'POST' });
-                    showToast('签到任务已触发', 'success');
+                    const result = await apiCall(`/api/checkin/manual/${id}`, { method: 'POST' });
+                    showToast(result && result.status === 'running' ? '该账号正在签到中' : '签到任务已触发', 'success');
                     // 立即刷新，无延迟
                     loadDashboard();
                     loadAccounts();
@@ -548,6 +570,17 @@
             await loadCheckinHistory(accountId);
         }
 
+        // 签到结果分类显示名称
+        const OUTCOME_LABELS = {
+            success: '成功',
+            already_done: '已签到',
+            auth_expired: '认证过期',
+            network: '网络错误',
+            upstream_5xx: '服务异常',
+            rate_limited: '请求限流',
+            parse_failure: '解析失败'
+        };
+
         async function loadCheckinHistory(accountId) {
             const tbody = document.getElementById('historyList');
             tbody.innerHTML = '<tr><td colspan="4" style="text-align: center; color: #a0aec0;">加载中...</td></tr>';
@@ -560,7 +593,7 @@
                 if (history && history.length > 0) {
                     history.forEach(record => {
                         const tr = document.createElement('tr');
-                        const statusText = record.success ? '成功' : '失败';
+                        const statusText = OUTCOME_LABELS[record.outcome] || (record.success ? '成功' : '失败');
                         const statusClass = record.success ? 'badge-success' : 'badge-danger';
                         const time = record.created_at ? new Date(record.created_at).toLocaleString() : '-';
 
@@ -691,6 +724,9 @@
             document.getElementById('editAccountId').value = accountId;
             document.getElementById('editAccountTitle').textContent = `修改账号 - ${account.name}`;
             document.getElementById('editTokenData').value = '';
+            document.getElementById('editCheckinTimeStart').value = account.custom_window ? (account.checkin_time_start || '') : '';
+            document.getElementById('editCheckinTimeEnd').value = account.custom_window ? (account.checkin_time_end || '') : '';
+            document.getElementById('editCheckInterval').value = account.check_interval || 60;
             document.getElementById('editAccountModal').style.display = 'flex';
         }
 
@@ -780,8 +816,29 @@
                     data.token_data = tokenData;
                 }
 
+                const account = accountsData.find(a => a.id === parseInt(accountId)) || {};
+                const windowStart = document.getElementById('editCheckinTimeStart').value;
+                const windowEnd = document.getElementById('editCheckinTimeEnd').value;
+                if (windowStart || windowEnd) {
+                    if (!windowStart || !windowEnd) {
+                        showToast('请同时填写窗口开始和结束时间', 'warning');
+                        return;
+                    }
+                    if (!account.custom_window || windowStart !== account.checkin_time_start || windowEnd !== account.checkin_time_end) {
+                        data.checkin_time_start = windowStart;
+                        data.checkin_time_end = windowEnd;
+                    }
+                } else if (account.custom_window) {
+                    data.custom_window = false;
+                }
+
+                const checkInterval = parseInt(document.getElementById('editCheckInterval').value);
+                if (!isNaN(checkInterval) && checkInterval !== account.check_interval) {
+                    data.check_interval = checkInterval;
+                }
+
                 if (Object.keys(data).length === 0) {
-                    showToast('请输入新的 Cookie 数据', 'warning');
+                    showToast('没有需要保存的修改', 'warning');
                     return;
                 }
 
@@ -824,18 +881,47 @@
                 document.getElementById('globalRetryCount').value = settings.retry_count || 2;
                 document.getElementById('globalRandomDelayMin').value = settings.random_delay_min || 0;
                 document.getElementById('globalRandomDelayMax').value = settings.random_delay_max || 30;
+                document.getElementById('globalWarmupMinutes').value = settings.warmup_minutes || 0;
+                document.getElementById('globalSpreadMinutes').value = settings.spread_minutes || 0;
+                document.getElementById('globalInlineAuth').checked = settings.inline_auth === true || settings.inline_auth === 1;
+                loadSchedulePreview();
             } catch (error) {
                 console.error('Failed to load checkin settings:', error);
             }
         }
 
+        // 预估每分钟请求数
+        async function loadSchedulePreview() {
+            const container = document.getElementById('schedulePreview');
+            try {
+                const params = new URLSearchParams({
+                    checkin_time: document.getElementById('globalCheckinTime').value,
+                    spread_minutes: parseInt(document.getElementById('globalSpreadMinutes').value) || 0
+                });
+                const preview = await apiCall(`/api/checkin/schedule-preview?${params}`);
+                if (!preview) return;
+
+                if (!preview.accounts) {
+                    container.textContent = '暂无启用的账号';
+                    return;
+                }
+                container.textContent = `预计峰值：${preview.peak_minute} 约 ${preview.peak_requests_per_minute} 请求/分钟（${preview.accounts} 个账号，分布在 ${preview.slots.length} 分钟内）`;
+            } catch (error) {
+                container.textContent = '';
+                console.error('Failed to load schedule preview:', error);
+            }
+        }
+
         async function saveCheckinSettings() {
             try {
                 const settings = {
                     checkin_time: document.getElementById('globalCheckinTime').value,
                     retry_count: parseInt(document.getElementById('globalRetryCount').value),
                     random_delay_min: parseInt(document.getElementById('globalRandomDelayMin').value),
-                    random_delay_max: parseInt(document.getElementById('globalRandomDelayMax').value)
+                    random_delay_max: parseInt(document.getElementById('globalRandomDelayMax').value),
+                    warmup_minutes: parseInt(document.getElementById('globalWarmupMinutes').value) || 0,
+                    spread_minutes: parseInt(document.getElementById('globalSpreadMinutes').value) || 0,
+                    inline_auth: document.getElementById('globalInlineAuth').checked
                 };
 
                 // 前端验证
@@ -893,17 +979,17 @@
                 }
 
                 showToast('余额刷新任务已启动...', 'info');
-                pollRefreshProgress();
+                pollRefreshProgress(result.job_id);
             } catch (error) {
                 showToast('余额刷新失败: ' + error.message, 'error');
             }
         }
 
         // 轮询刷新进度
-        function pollRefreshProgress() {
+        function pollRefreshProgress(jobId) {
             const interval = setInterval(async () => {
                 try {
-                    const progress = await apiCall('/api/accounts/refresh-progress');
+                    const progress = await apiCall('/api/accounts/refresh-progress' + (jobId ? `?job_id=${jobId}` : ''));
 
                     if (progress.running) {
                         showToast(`正在刷新 ${progress.completed}/${progress.total}...`, 'info');
@@ -1118,6 +1204,7 @@
         let batchRedeemTimer = null;
         let batchCountdownTimer = null;
         let currentBatchTaskId = null;
+        let batchCodePage = null;  // null 表示跟随当前执行位置
 
         // Tab 切换
         function switchRedeemTab(tab) {
@@ -1136,10 +1223,27 @@
             // 切换到批量 Tab 时加载任务状态
             if (tab === 'batch') {
                 const accountId = document.getElementById('redeemAccountId').value;
+                batchCodePage = null;
+                renderBatchPoolAccounts(accountId);
                 loadBatchRedeemStatus(accountId);
             }
         }
 
+        // 渲染码池模式可选的其他账户
+        function renderBatchPoolAccounts(accountId) {
+            const listEl = document.getElementById('batchPoolAccounts');
+            const others = accountsData.filter(account => String(account.id) !== String(accountId) && account.enabled);
+
+            if (others.length === 0) {
+                listEl.innerHTML = '<div class="format-hint">没有其他启用的账户</div>';
+                return;
+            }
+
+            listEl.innerHTML = others.map(account => `
+                <label><input type="checkbox" value="${account.id}"> ${account.name}</label>
+            `).join('');
+        }
+
         // 解析兑换码输入（支持换行和逗号分隔）
         function parseBatchCodes(input) {
             if (!input) return [];
@@ -1158,7 +1262,8 @@
         // 加载批量兑换任务状态
         async function loadBatchRedeemStatus(accountId) {
             try {
-                const data = await apiCall(`/api/accounts/${accountId}/batch-redeem`);
+                const pageQuery = batchCodePage ? `?page=${batchCodePage}` : '';
+                const data = await apiCall(`/api/accounts/${accountId}/batch-redeem${pageQuery}`);
 
                 if (!data.task) {
                     // 没有任务，显示输入区域
@@ -1197,6 +1302,7 @@
 
                 // 渲染兑换码列表
                 renderBatchCodeList(data.progress);
+                renderBatchCodePager(accountId, data.pagination);
 
                 // 更新按钮状态
                 updateBatchButtons(task.status);
@@ -1320,11 +1426,35 @@
                         <span class="status-icon">${statusIcon}</span>
                         <code title="${item.code}">${item.code}</code>
                         <span class="status-message" title="${message}">${message}</span>
+                        ${item.account_name ? `<span class="status-account">${item.account_name}</span>` : ''}
                     </div>
                 `;
             }).join('');
         }
 
+        // 渲染兑换码分页
+        function renderBatchCodePager(accountId, pagination) {
+            const pagerEl = document.getElementById('batchCodePager');
+
+            if (!pagination || pagination.pages <= 1) {
+                pagerEl.style.display = 'none';
+                return;
+            }
+
+            const { page, pages } = pagination;
+            pagerEl.innerHTML = `
+                <button type="button" class="btn btn-secondary btn-sm" ${page <= 1 ? 'disabled' : ''} onclick="changeBatchCodePage(${accountId}, ${page - 1})">上一页</button>
+                <span>${page} / ${pages}</span>
+                <button type="button" class="btn btn-secondary btn-sm" ${page >= pages ? 'disabled' : ''} onclick="changeBatchCodePage(${accountId}, ${page + 1})">下一页</button>
+            `;
+            pagerEl.style.display = 'flex';
+        }
+
+        function changeBatchCodePage(accountId, page) {
+            batchCodePage = page;
+            loadBatchRedeemStatus(accountId);
+        }
+
         // 格式化等待时间
         function formatWaitingTime(nextExecuteAt) {
             if (!nextExecuteAt) return '等待执行';
@@ -1405,14 +1535,21 @@
             btn.textContent = '创建中...';
 
             try {
+                const poolAccountIds = Array.from(
+                    document.querySelectorAll('#batchPoolAccounts input:checked')
+                ).map(input => parseInt(input.value));
+
                 const result = await apiCall(`/api/accounts/${accountId}/batch-redeem`, {
                     method: 'POST',
-                    body: JSON.stringify({ codes })
+                    body: JSON.stringify({ codes, pool_account_ids: poolAccountIds })
                 });
 
                 if (result.success) {
                     currentBatchTaskId = result.task_id;
-                    showToast(`批量兑换任务已创建，共 ${result.total_count} 个兑换码`, 'success');
+                    batchCodePage = null;
+                    const poolText = result.mode === 'pool' ? `，${result.account_count} 个账户并行` : '';
+                    const skippedText = result.skipped && result.skipped.length ? `，跳过 ${result.skipped.length} 个已兑换/无效/排队中的码` : '';
+                    showToast(`批量兑换任务已创建，共 ${result.total_count} 个兑换码${poolText}${skippedText}`, 'success');
                     loadBatchRedeemStatus(accountId);
                 } else {
                     showToast(result.message || '创建任务失败', 'error');
@@ -1485,6 +1622,7 @@
                     showToast('任务已取消', 'info');
                     stopBatchProgressPolling();
                     currentBatchTaskId = null;
+                    batchCodePage = null;
                     const accountId = document.getElementById('redeemAccountId').value;
                     loadBatchRedeemStatus(accountId);
                 } else {